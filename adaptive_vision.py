@@ -0,0 +1,187 @@
+"""
+Adaptive vision: attach the screenshot only on steps where the DOM text isn't enough.
+
+A vision step costs roughly twice the prefill of a text-only step (see
+LLM_INPUT_EXPLANATION.md), yet on most pages the indexed DOM already has
+everything the model needs. VisionPolicy looks at each state message and
+keeps the screenshot only when:
+
+  - dom_sparse:       the page has fewer than min_elements interactive elements
+                      or almost no DOM text (blank pages, loading states)
+  - canvas_or_iframe: the DOM shows <canvas>/<iframe>, or page_stats counts iframes
+  - previous_failed:  the last step in agent_history has an action error
+                      (agent_history.last_step_failed)
+  - visual_change:    the screenshot changed but the DOM text did not
+  - refresh:          max_text_only_steps text-only steps in a row
+
+Otherwise the screenshot (and its "Current screenshot:" caption) is removed
+and the step runs text-only. AdaptiveVision is the chat model wrapper that
+applies the policy; the scripts copy policy.last_decision into each step's
+actions.jsonl record:
+
+    {"step": 4, ..., "vision": {"screenshot": false, "reasons": [], "est_image_tokens_saved": 1564}}
+
+Usage:
+    vision_policy = VisionPolicy()
+    llm = AdaptiveVision(ChatOpenAI(...), vision_policy)
+    agent = Agent(task=task, llm=llm, use_vision=True)  # screenshots must be captured to be filtered
+"""
+import base64
+import hashlib
+import io
+import math
+import re
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from agent_history import last_step_failed
+
+_BROWSER_STATE = re.compile(r"<browser_state>(.*?)</browser_state>", re.DOTALL)
+_INTERACTIVE = re.compile(r"^\s*\*?\[\d+\]<", re.MULTILINE)
+_IFRAMES = re.compile(r"(\d+) iframes?")
+_VISUAL_TAGS = re.compile(r"<(canvas|iframe)\b", re.IGNORECASE)
+_MARKER = re.compile(r"(?m)^(\s*)\*(?=\[)")
+
+
+def _image_url(part) -> str | None:
+    image_url = getattr(part, "image_url", None)
+    if image_url is None:
+        return None
+    return getattr(image_url, "url", image_url)
+
+
+def estimate_image_tokens(url: str, patch: int = 28, fallback: int = 1000) -> int:
+    """
+    Rough prompt tokens for one image: one token per patch x patch pixel block
+    (Qwen2.5-VL merges 14px patches 2x2). Falls back to `fallback` without Pillow
+    or for non-data URLs.
+    """
+    if Image is None or not url.startswith("data:"):
+        return fallback
+    try:
+        with Image.open(io.BytesIO(base64.b64decode(url.split(",", 1)[1]))) as image:
+            width, height = image.size
+    except Exception:
+        return fallback
+    return math.ceil(width / patch) * math.ceil(height / patch)
+
+
+class VisionPolicy:
+    """Per-agent screenshot decisions; keeps the previous step's hashes for change detection"""
+
+    def __init__(self, min_elements: int = 3, min_dom_chars: int = 200, max_text_only_steps: int | None = 8):
+        """
+        Args:
+            min_elements: Fewer interactive elements than this counts as a sparse DOM
+            min_dom_chars: Less browser_state text than this counts as a sparse DOM
+            max_text_only_steps: Send a screenshot after this many text-only steps (None = never force)
+        """
+        self.min_elements = min_elements
+        self.min_dom_chars = min_dom_chars
+        self.max_text_only_steps = max_text_only_steps
+
+        self._previous_dom_hash = None
+        self._previous_image_hash = None
+        self._text_only_streak = 0
+        self.last_decision = None
+
+        # Counters
+        self.steps = 0
+        self.screenshots_sent = 0
+        self.screenshots_dropped = 0
+        self.est_tokens_saved = 0
+
+    def reasons(self, state_text: str, image_hash: str) -> list[str]:
+        match = _BROWSER_STATE.search(state_text)
+        dom = match.group(1) if match else ""
+        dom_hash = hashlib.sha256(_MARKER.sub(r"\1", dom).encode("utf-8")).hexdigest()
+
+        reasons = []
+        if len(_INTERACTIVE.findall(dom)) < self.min_elements or len(dom.strip()) < self.min_dom_chars:
+            reasons.append("dom_sparse")
+        iframes = _IFRAMES.search(dom)
+        if _VISUAL_TAGS.search(dom) or (iframes and int(iframes.group(1)) > 0):
+            reasons.append("canvas_or_iframe")
+        if last_step_failed(state_text):
+            reasons.append("previous_failed")
+        if (
+            self._previous_image_hash is not None
+            and image_hash != self._previous_image_hash
+            and dom_hash == self._previous_dom_hash
+        ):
+            reasons.append("visual_change")
+        if self.max_text_only_steps is not None and self._text_only_streak >= self.max_text_only_steps:
+            reasons.append("refresh")
+
+        self._previous_dom_hash = dom_hash
+        self._previous_image_hash = image_hash
+        return reasons
+
+    def apply(self, messages: list) -> list:
+        """Return messages with the screenshot removed from the state message unless a reason keeps it"""
+        for index, message in enumerate(messages):
+            content = getattr(message, "content", None)
+            if isinstance(content, str) or not content:
+                continue
+            text = "".join(part.text for part in content if hasattr(part, 'text'))
+            if "<browser_state>" not in text:
+                continue
+            image_indexes = [i for i, part in enumerate(content) if _image_url(part) is not None]
+            if not image_indexes:
+                self.last_decision = {"screenshot": False, "reasons": ["not_captured"], "est_image_tokens_saved": 0}
+                return messages
+
+            urls = [_image_url(content[i]) for i in image_indexes]
+            image_hash = hashlib.sha256("".join(urls).encode("utf-8")).hexdigest()
+            reasons = self.reasons(text, image_hash)
+            self.steps += 1
+            if reasons:
+                self._text_only_streak = 0
+                self.screenshots_sent += 1
+                self.last_decision = {"screenshot": True, "reasons": reasons, "est_image_tokens_saved": 0}
+                return messages
+
+            # Drop the images and the short caption right before each of them
+            drop = set(image_indexes)
+            for i in image_indexes:
+                previous = content[i - 1] if i > 0 else None
+                if previous is not None and hasattr(previous, 'text') and len(previous.text) < 100 and "screenshot" in previous.text.lower():
+                    drop.add(i - 1)
+            saved = sum(estimate_image_tokens(url) for url in urls)
+            self._text_only_streak += 1
+            self.screenshots_dropped += 1
+            self.est_tokens_saved += saved
+            self.last_decision = {"screenshot": False, "reasons": [], "est_image_tokens_saved": saved}
+
+            shaped = list(messages)
+            shaped[index] = message.model_copy(update={"content": [part for i, part in enumerate(content) if i not in drop]})
+            return shaped
+        return messages
+
+    def stats(self) -> dict:
+        return {
+            "steps": self.steps,
+            "screenshots_sent": self.screenshots_sent,
+            "screenshots_dropped": self.screenshots_dropped,
+            "est_image_tokens_saved": self.est_tokens_saved,
+        }
+
+
+class AdaptiveVision:
+    """Chat model wrapper that applies a VisionPolicy to every request"""
+
+    def __init__(self, llm, policy: VisionPolicy | None = None):
+        self.llm = llm
+        self.policy = policy or VisionPolicy()
+
+    def __getattr__(self, name):
+        # model, provider, name, stats(), ... come from the wrapped model
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    async def ainvoke(self, messages, output_format=None):
+        return await self.llm.ainvoke(self.policy.apply(messages), output_format)
@@ -1,6 +1,7 @@
 from browser_use import Agent, ChatOpenAI, BrowserProfile
 from dotenv import load_dotenv
 import asyncio
+from token_usage import MeteredLLM, UsageMeter
 
 load_dotenv()
 
@@ -11,8 +12,11 @@ async def main():
     # Configure browser profile to keep browser alive after task completion
     browser_profile = BrowserProfile(keep_alive=True)
 
-    agent = Agent(task=task, llm=llm, browser_profile=browser_profile)
+    # Prompt/cached/completion/image tokens and cost of every LLM call
+    usage_meter = UsageMeter()
+    agent = Agent(task=task, llm=MeteredLLM(llm, usage_meter), browser_profile=browser_profile)
     await agent.run()
+    print(f"Token usage: {usage_meter.stats()}")
 
     # Keep the script running to prevent browser from closing
     print("\nTask completed! Browser will stay open.")
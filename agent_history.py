@@ -0,0 +1,99 @@
+"""
+Parser for the <agent_history> block of browser_use's state message.
+
+Each entry is a HistoryItem.to_string(), joined with newlines. browser_use
+changed the rendering over time:
+
+  - up to 0.7.4:  <step_3>\\n...\\n</step_3> and <sys>\\n...\\n</sys>
+  - 0.7.5 onwards: <step>\\n...\\n</step>; later releases (0.9.7, 0.13) drop
+                  the closing tag. System entries (the "Agent initialized"
+                  first entry, follow-up tasks) are plain text without a tag
+
+and with max_history_items the middle of the history is replaced by
+"<sys>[... N previous steps omitted...]</sys>". A step entry holds the
+model's evaluation, memory and next goal, then "Result:" and one line per
+action result or error. Initial actions (e.g. opening the URL in the task)
+are a step entry with only the Result part.
+
+response_cache, adaptive_vision, replay and llm_stub_server read the history
+through this module so all of them follow the format of the installed
+release.
+
+Usage:
+    items = history_items(state_text)           # ["Agent initialized", "<step>\\n...", ...]
+    steps = model_steps(state_text)             # model outputs so far, omitted ones included
+    if last_step_failed(state_text): ...
+"""
+import re
+
+AGENT_HISTORY = re.compile(r"<agent_history>\n?(.*?)\n?</agent_history>", re.DOTALL)
+# First line of an entry: <step>, <step_unknown>, <step_3>, or a <sys> entry
+_ITEM_START = re.compile(r"^(?:<step(?:_\d+|_unknown)?>|<sys>)", re.MULTILINE)
+_CLOSING = re.compile(r"^</(?:step(?:_\d+|_unknown)?|sys)>$", re.MULTILINE)
+_OMITTED = re.compile(r"\[\.\.\. (\d+) previous steps omitted\.\.\.\]")
+_FAILURE = re.compile(r"\berror\b|\bfailed\b|\bfailure\b|\bexception\b|\bnot executed\b", re.IGNORECASE)
+# HistoryItem error entry for a step whose output couldn't be parsed
+_FORMAT_ERROR = "Agent failed to output in the right format."
+
+
+def history_text(state_text: str) -> str | None:
+    """Body of the <agent_history> block, or None if there is none"""
+    match = AGENT_HISTORY.search(state_text or "")
+    return match.group(1) if match else None
+
+
+def history_items(state_text: str) -> list[str]:
+    """Entries of the <agent_history> block in order, without closing tags"""
+    body = history_text(state_text)
+    if not body:
+        return []
+    starts = [match.start() for match in _ITEM_START.finditer(body)]
+    bounds = ([0] if not starts or starts[0] > 0 else []) + starts + [len(body)]
+    items = []
+    for start, end in zip(bounds, bounds[1:]):
+        item = _CLOSING.sub("", body[start:end]).strip("\n")
+        if item.strip():
+            items.append(item)
+    return items
+
+
+def is_step(item: str) -> bool:
+    return item.startswith("<step")
+
+
+def step_body(item: str) -> str:
+    """An entry without its opening tag"""
+    return item.split("\n", 1)[1] if "\n" in item else ""
+
+
+def action_results(item: str) -> str | None:
+    """The "Result:" lines of a step entry, or None if it has none"""
+    body = step_body(item)
+    if body.startswith("Result:\n"):
+        return body[len("Result:\n"):]
+    index = body.find("\nResult:\n")
+    return body[index + len("\nResult:\n"):] if index >= 0 else None
+
+
+def model_steps(state_text: str) -> int:
+    """Number of model outputs in the history, including steps omitted by max_history_items"""
+    steps = 0
+    for item in history_items(state_text):
+        omitted = _OMITTED.search(item)
+        if omitted:
+            steps += int(omitted.group(1))
+        elif is_step(item) and not item.startswith("<step_0>") and not step_body(item).startswith("Result:"):
+            # An entry that is only "Result:" holds the initial actions, not a model output
+            steps += 1
+    return steps
+
+
+def last_step_failed(state_text: str) -> bool:
+    """The last step entry reports an action error (never judged from the model's own evaluation or memory)"""
+    items = [item for item in history_items(state_text) if is_step(item)]
+    if not items:
+        return False
+    if step_body(items[-1]).strip() == _FORMAT_ERROR:
+        return True
+    results = action_results(items[-1])
+    return results is not None and _FAILURE.search(results) is not None
@@ -1,6 +1,8 @@
 from browser_use import Agent, ChatOllama, BrowserProfile
 from dotenv import load_dotenv
 import asyncio
+from llm_pool import EndpointPool
+from token_usage import MeteredLLM, UsageMeter
 
 load_dotenv()
 
@@ -8,9 +10,12 @@ async def main():
     # Configure Ollama LLM
     # Make sure you have Ollama running locally (ollama serve)
     # and the model pulled (e.g., ollama pull qwen2.5:72b)
-    llm = ChatOllama(
+    # Requests are balanced over every Ollama server in OLLAMA_HOSTS (comma-separated)
+    llm = EndpointPool.from_env(
+        "OLLAMA_HOSTS",
         model="qwen2.5vl:72b",  # Change this to your preferred Ollama model
-        host="http://158.130.4.155:11434",  # Default Ollama host
+        default="http://158.130.4.155:11434",  # Default Ollama host
+        llm_factory=lambda host, model, **kwargs: ChatOllama(model=model, host=host, **kwargs),
         # Optional: Configure Ollama-specific options
         # ollama_options={
         #     "temperature": 0.7,
@@ -24,8 +29,11 @@ async def main():
     # Configure browser profile to keep browser alive after task completion
     browser_profile = BrowserProfile(keep_alive=True)
 
-    agent = Agent(task=task, llm=llm, browser_profile=browser_profile)
+    # Prompt/cached/completion/image tokens and cost of every LLM call
+    usage_meter = UsageMeter()
+    agent = Agent(task=task, llm=MeteredLLM(llm, usage_meter), browser_profile=browser_profile)
     await agent.run()
+    print(f"Token usage: {usage_meter.stats()}")
 
     # Keep the script running to prevent browser from closing
     print("\nTask completed! Browser will stay open.")
@@ -1,5 +1,7 @@
 from browser_use import Agent, ChatOpenAI, BrowserProfile
 from dotenv import load_dotenv
+from llm_pool import EndpointPool
+from token_usage import MeteredLLM, UsageMeter
 import asyncio
 
 load_dotenv()
@@ -9,10 +11,11 @@ async def main():
     # Make sure you have vLLM running with OpenAI API server
     # Example: python -m vllm.entrypoints.openai.api_server --model meta-llama/Llama-3.1-70B-Instruct --port 8000
 
-    llm = ChatOpenAI(
+    # Requests are balanced over every vLLM server in LLM_ENDPOINTS (comma-separated, OpenAI-compatible /v1 URLs)
+    llm = EndpointPool.from_env(
+        "LLM_ENDPOINTS",
         model="Qwen/Qwen2.5-VL-3B-Instruct",  # Change to your vLLM model name
-        base_url="http://158.130.4.155:11434/v1",  # vLLM server URL (OpenAI-compatible endpoint)
-        api_key="EMPTY",  # vLLM doesn't need a real API key, but the client requires something
+        default="http://158.130.4.155:11434/v1",  # vLLM server URL (OpenAI-compatible endpoint)
         temperature=0.7,
         max_completion_tokens=4096,
         # Optional: Add custom timeout for long-running inference
@@ -24,8 +27,11 @@ async def main():
     # Configure browser profile to keep browser alive after task completion
     browser_profile = BrowserProfile(keep_alive=True)
 
-    agent = Agent(task=task, llm=llm, browser_profile=browser_profile)
+    # Prompt/cached/completion/image tokens and cost of every LLM call
+    usage_meter = UsageMeter()
+    agent = Agent(task=task, llm=MeteredLLM(llm, usage_meter), browser_profile=browser_profile)
     await agent.run()
+    print(f"Token usage: {usage_meter.stats()}")
 
     # Keep the script running to prevent browser from closing
     print("\nTask completed! Browser will stay open.")
@@ -1,12 +1,24 @@
 from browser_use import Agent, ChatOpenAI, BrowserProfile
-from browser_use.dom.serializer.html_serializer import HTMLSerializer
 from dotenv import load_dotenv
+from llm_pool import EndpointPool
+from prefix_cache import PrefixCacheShaper
+from response_cache import ResponseCache
 import asyncio
 import json
-import base64
-import shutil
+import os
 from pathlib import Path
 from datetime import datetime
+from adaptive_vision import AdaptiveVision, VisionPolicy
+from dom_compaction import DomCompaction, DomCompactor
+from dom_delta import DomDeltaEncoder
+from screenshot_encoding import ScreenshotEncoder, ScreenshotPolicy
+from screenshot_store import ScreenshotStore
+from session_logger import SessionLogger
+from step_logging import StepLogWriter, make_step_callback
+from stall_detector import StallDetector, StallGuard
+from step_timing import StepTracer, TracedLLM
+from streaming_llm import StreamingFactory
+from token_usage import Budget, MeteredLLM, UsageMeter, load_prices
 
 load_dotenv()
 
@@ -18,228 +30,147 @@ LOGS_DIR.mkdir(exist_ok=True)
 SESSION_DIR = LOGS_DIR / datetime.now().strftime("%Y%m%d_%H%M%S")
 SESSION_DIR.mkdir(exist_ok=True)
 
-# Create subdirectories for different types of logs
-SCREENSHOTS_DIR = SESSION_DIR / "screenshots"
-SCREENSHOTS_DIR.mkdir(exist_ok=True)
-
-ACTIONS_LOG = SESSION_DIR / "actions.jsonl"
-BROWSER_STATE_LOG = SESSION_DIR / "browser_states.jsonl"
-FULL_LOG = SESSION_DIR / "full_session.log"
-
-step_counter = 0
-
-def log_to_file(message: str):
-    """Log a message to the full session log file"""
-    with open(FULL_LOG, "a", encoding="utf-8") as f:
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-        f.write(f"[{timestamp}] {message}\n")
-
-async def step_callback(browser_state, agent_output, step_number):
-    """
-    Callback function that logs all screenshots, browser state, and LLM actions
-
-    Args:
-        browser_state: BrowserStateSummary containing current browser state
-        agent_output: AgentOutput containing LLM's response and planned actions
-        step_number: Current step number
-    """
-    global step_counter
-    step_counter = step_number
-
-    log_to_file(f"\n{'='*80}")
-    log_to_file(f"STEP {step_number}")
-    log_to_file(f"{'='*80}")
-
-    # ===== LOG BROWSER STATE =====
-    browser_state_data = {
-        "step": step_number,
-        "timestamp": datetime.now().isoformat(),
-        "url": browser_state.url,
-        "title": browser_state.title,
-        "tabs": [{"url": tab.url, "title": tab.title} for tab in browser_state.tabs],
-        "dom_text": browser_state.dom_state.dom_text if hasattr(browser_state.dom_state, 'dom_text') else None,
-        "dom_items_count": len(browser_state.dom_state.element_tree) if hasattr(browser_state.dom_state, 'element_tree') else 0,
-    }
-
-    # Add page info if available
-    if browser_state.page_info:
-        browser_state_data["page_info"] = {
-            "viewport_width": browser_state.page_info.viewport_width,
-            "viewport_height": browser_state.page_info.viewport_height,
-            "page_width": browser_state.page_info.page_width,
-            "page_height": browser_state.page_info.page_height,
-            "scroll_x": browser_state.page_info.scroll_x,
-            "scroll_y": browser_state.page_info.scroll_y,
-        }
-
-    # Log browser state to JSONL
-    with open(BROWSER_STATE_LOG, "a", encoding="utf-8") as f:
-        f.write(json.dumps(browser_state_data, ensure_ascii=False) + "\n")
-
-    log_to_file(f"URL: {browser_state.url}")
-    log_to_file(f"Title: {browser_state.title}")
-
-    # ===== LOG SCREENSHOT =====
-    if browser_state.screenshot:
-        screenshot_filename = f"step_{step_number:03d}.png"
-        screenshot_path = SCREENSHOTS_DIR / screenshot_filename
-
-        # Decode base64 screenshot and save
-        try:
-            screenshot_data = base64.b64decode(browser_state.screenshot)
-            with open(screenshot_path, "wb") as f:
-                f.write(screenshot_data)
-            log_to_file(f"Screenshot saved: {screenshot_path}")
-        except Exception as e:
-            log_to_file(f"Error saving screenshot: {e}")
-
-    # ===== LOG FULL HTML CONTENT =====
-    try:
-        # Extract HTML from the DOM state using HTMLSerializer
-        html_content = None
-
-        # Get the root node from selector_map if available
-        if hasattr(browser_state.dom_state, 'selector_map') and browser_state.dom_state.selector_map:
-            # Find the root document node
-            for index, node in browser_state.dom_state.selector_map.items():
-                if hasattr(node, 'node_type') and node.node_type == 9:  # DOCUMENT_NODE
-                    serializer = HTMLSerializer(extract_links=True)
-                    html_content = serializer.serialize(node)
-                    break
-
-            # If no document node found, try to serialize the first node with children
-            if not html_content:
-                for index, node in browser_state.dom_state.selector_map.items():
-                    if hasattr(node, 'children_nodes') and node.children_nodes:
-                        serializer = HTMLSerializer(extract_links=True)
-                        html_content = serializer.serialize(node)
-                        break
-
-        # Save the HTML content
-        if html_content:
-            html_path = SESSION_DIR / f"step_{step_number:03d}_full_page.html"
-            with open(html_path, "w", encoding="utf-8") as f:
-                f.write(html_content)
-            log_to_file(f"Full HTML saved: {html_path} ({len(html_content)} chars)")
-            log_to_file(f"HTML preview (first 500 chars):\n{html_content[:500]}")
-        else:
-            log_to_file("Warning: Could not extract HTML content from DOM state")
-
-    except Exception as e:
-        log_to_file(f"Error extracting HTML content: {e}")
-        import traceback
-        log_to_file(traceback.format_exc())
-
-    # ===== LOG LLM REPRESENTATION (DOM TEXT) =====
-    try:
-        # Also save the LLM representation (simplified DOM text)
-        llm_dom_text = browser_state.dom_state.llm_representation()
-        if llm_dom_text:
-            dom_text_path = SESSION_DIR / f"step_{step_number:03d}_llm_dom.txt"
-            with open(dom_text_path, "w", encoding="utf-8") as f:
-                f.write(llm_dom_text)
-            log_to_file(f"LLM DOM representation saved: {dom_text_path} ({len(llm_dom_text)} chars)")
-            log_to_file(f"LLM DOM preview (first 500 chars):\n{llm_dom_text[:500]}")
-    except Exception as e:
-        log_to_file(f"Error extracting LLM DOM representation: {e}")
-
-    # ===== LOG LLM OUTPUT =====
-    llm_data = {
-        "step": step_number,
-        "timestamp": datetime.now().isoformat(),
-    }
-
-    # Log thinking if available
-    if hasattr(agent_output.current_state, 'thinking') and agent_output.current_state.thinking:
-        llm_data["thinking"] = agent_output.current_state.thinking
-        log_to_file(f"LLM Thinking: {agent_output.current_state.thinking}")
-
-    # Log evaluation
-    if hasattr(agent_output.current_state, 'evaluation_previous_goal') and agent_output.current_state.evaluation_previous_goal:
-        llm_data["evaluation"] = agent_output.current_state.evaluation_previous_goal
-        log_to_file(f"Evaluation: {agent_output.current_state.evaluation_previous_goal}")
-
-    # Log memory
-    if hasattr(agent_output.current_state, 'memory') and agent_output.current_state.memory:
-        llm_data["memory"] = agent_output.current_state.memory
-        log_to_file(f"Memory: {agent_output.current_state.memory}")
-
-    # Log next goal
-    if hasattr(agent_output.current_state, 'next_goal') and agent_output.current_state.next_goal:
-        llm_data["next_goal"] = agent_output.current_state.next_goal
-        log_to_file(f"Next Goal: {agent_output.current_state.next_goal}")
-
-    # ===== LOG ACTIONS =====
-    if hasattr(agent_output.current_state, 'action') and agent_output.current_state.action:
-        actions = []
-        log_to_file(f"\nPlanned Actions ({len(agent_output.current_state.action)}):")
-
-        for i, action in enumerate(agent_output.current_state.action, 1):
-            action_dict = action.model_dump() if hasattr(action, 'model_dump') else dict(action)
-            actions.append(action_dict)
-
-            # Log action details
-            action_name = action_dict.get('name', 'unknown')
-            log_to_file(f"  Action {i}: {action_name}")
-            log_to_file(f"    Full details: {json.dumps(action_dict, indent=6, ensure_ascii=False)}")
-
-        llm_data["actions"] = actions
-
-    # Save LLM output to JSONL
-    with open(ACTIONS_LOG, "a", encoding="utf-8") as f:
-        f.write(json.dumps(llm_data, ensure_ascii=False) + "\n")
-
-    log_to_file(f"{'='*80}\n")
+# Session logger owns the log files; the background writer feeds it step snapshots
+# archive=True packs the whole session into a single session.bsa file
+session_log = SessionLogger(SESSION_DIR, archive=True)
+# Screenshots are downscaled and re-encoded in a process pool before storage
+# Add every_n=N or only_on_change=True to keep fewer frames
+screenshot_encoder = ScreenshotEncoder(ScreenshotPolicy(max_dimension=1280, format="webp", quality=80))
+# Screenshots are stored once per unique frame; set perceptual=True to also collapse near-duplicates
+screenshot_store = ScreenshotStore(session_log)
+# LLM DOM text is stored as a keyframe every 10 steps plus line deltas in between
+dom_encoder = DomDeltaEncoder(keyframe_interval=10)
+log_writer = StepLogWriter(
+    session_log,
+    screenshot_store=screenshot_store,
+    screenshot_encoder=screenshot_encoder,
+    dom_encoder=dom_encoder,
+)
+log_writer.start()
+
+# Screenshots are only sent to the LLM on steps where the DOM text isn't enough;
+# each step's decision is recorded under "vision" in actions.jsonl
+vision_policy = VisionPolicy()
+# The element listing sent to the LLM is compacted to ~1500 tokens (indices unchanged);
+# before/after token counts are recorded under "dom_compaction" in actions.jsonl
+dom_compactor = DomCompactor(budget_tokens=1500)
+# LLM responses are streamed, with a cancel-and-retry when the model rambles; the whole action
+# batch is awaited (early dispatch of the first action needs max_actions_per_step=1);
+# per-call timings (time to first token, action ready) go to llm_stream.jsonl and "stream" in actions.jsonl
+streaming = StreamingFactory(on_timing=lambda record: log_writer.write_jsonl("llm_stream.jsonl", record))
+# Per-step phase timings (browser state, LLM, logging callback, actions) go to timings.jsonl;
+# set OTEL_EXPORTER_OTLP_ENDPOINT to also export them as OpenTelemetry spans
+tracer = StepTracer(log_writer)
+# Unchanged pages and action cycles get a corrective hint, then a recovery navigation, then an abort;
+# detections go to stall.jsonl and "stall" in actions.jsonl
+stall_detector = StallDetector(on_event=lambda event: log_writer.write_jsonl("stall.jsonl", event))
+# Prompt/cached/completion/image tokens and cost go under "usage" in actions.jsonl and to usage.json;
+# set LLM_PRICES to a JSON price table (USD per million tokens) and LLM_COST_BUDGET to stop at a cost budget;
+# the default model has no price, so LLM_TOKEN_BUDGET (total tokens) is the budget that applies to it
+usage_meter = UsageMeter(
+    prices=load_prices(os.getenv("LLM_PRICES")),
+    budget=Budget(
+        max_tokens=int(os.environ["LLM_TOKEN_BUDGET"]) if os.getenv("LLM_TOKEN_BUDGET") else None,
+        max_cost_usd=float(os.environ["LLM_COST_BUDGET"]) if os.getenv("LLM_COST_BUDGET") else None,
+    ),
+)
+
+# Snapshots each step (with the vision, compaction, stream, usage and stall records above)
+# for the log writer thread, so the agent loop is not stalled between the LLM response and the next action
+step_callback = make_step_callback(
+    log_writer,
+    vision_policy=vision_policy,
+    dom_compactor=dom_compactor,
+    stall_detector=stall_detector,
+    usage_meter=usage_meter,
+    streaming=streaming,
+)
 
 async def main():
     # llm = ChatOpenAI(model="gpt-5")
-    llm = ChatOpenAI(
+    # Requests are balanced over every vLLM server in LLM_ENDPOINTS (comma-separated, OpenAI-compatible /v1 URLs)
+    llm = EndpointPool.from_env(
+        "LLM_ENDPOINTS",
+        # Responses are streamed; the agent acts as soon as the first action is complete
+        llm_factory=streaming,
         model="InternVL3_5-14B",  # Change to your vLLM model name
-        base_url="http://158.130.4.155:11434/v1",  # vLLM server URL (OpenAI-compatible endpoint)
-        api_key="EMPTY",  # vLLM doesn't need a real API key, but the client requires something
+        default="http://158.130.4.155:11434/v1",  # vLLM server URL (OpenAI-compatible endpoint)
         temperature=0.7,
         max_completion_tokens=4096,
         # Optional: Add custom timeout for long-running inference
         timeout=120.0,
     )
+    # Stable content first (system prompt, output schema, task) so vLLM's prefix cache is reused
+    # across steps and agents; per-call cached-token ratios go to prefix_cache.jsonl
+    llm = PrefixCacheShaper(llm, on_usage=lambda record: log_writer.write_jsonl("prefix_cache.jsonl", record))
+    # Counts only requests that reach a server (inside the response cache)
+    llm = MeteredLLM(llm, usage_meter)
+    # Repeated states (same task, DOM, recent history and screenshot) are answered from disk
+    llm = ResponseCache(llm, LOGS_DIR / "response_cache.sqlite")
+    llm = DomCompaction(llm, dom_compactor)
+    llm = AdaptiveVision(llm, vision_policy)
+    llm = StallGuard(llm, stall_detector)
+    llm = TracedLLM(llm, tracer)
     # task = "Find the number 1 post on Show HN"
     task = "create a google doc"
 
     # Configure browser profile to keep browser alive after task completion
     browser_profile = BrowserProfile(keep_alive=True)
 
-    log_to_file(f"Starting agent session")
-    log_to_file(f"Session directory: {SESSION_DIR}")
-    log_to_file(f"Task: {task}")
-    log_to_file(f"Model: {llm.model if hasattr(llm, 'model') else 'unknown'}")
+    log_writer.log(f"Starting agent session")
+    log_writer.log(f"Session directory: {SESSION_DIR}")
+    log_writer.log(f"Task: {task}")
+    log_writer.log(f"Model: {llm.model if hasattr(llm, 'model') else 'unknown'}")
+
+    # Copy this Python script to the log folder for reference
+    try:
+        script_path = Path(__file__)
+        script_copy_path = session_log.write_artifact(script_path.name, script_path.read_bytes())
+        log_writer.log(f"Script copied to: {script_copy_path}")
+        print(f"Script copied to: {script_copy_path}")
+    except Exception as e:
+        log_writer.log(f"Error copying script: {e}")
+        print(f"Error copying script: {e}")
 
     agent = Agent(
         task=task,
         llm=llm,
         browser_profile=browser_profile,
-        register_new_step_callback=step_callback,  # Register our logging callback
+        register_new_step_callback=tracer.wrap_step_callback(step_callback),  # Register our logging callback
     )
+    stall_detector.bind(agent)  # Lets the detector stop a run that stays stuck
+    usage_meter.bind(agent)  # Lets the meter stop a run that goes over its budget
 
     try:
-        result = await agent.run()
-        log_to_file(f"\nAgent completed successfully!")
-        log_to_file(f"Total steps: {step_counter}")
-        log_to_file(f"Result: {result}")
+        result = await agent.run(on_step_start=tracer.on_step_start, on_step_end=tracer.on_step_end)
+        log_writer.log(f"\nAgent completed successfully!")
+        log_writer.log(f"Total steps: {log_writer.last_step}")
+        log_writer.log(f"Result: {result}")
     except Exception as e:
-        log_to_file(f"\nAgent encountered an error: {e}")
+        log_writer.log(f"\nAgent encountered an error: {e}")
         import traceback
-        log_to_file(traceback.format_exc())
-
-    # Copy this Python script to the log folder for reference
-    try:
-        script_path = Path(__file__)
-        script_copy_path = SESSION_DIR / script_path.name
-        shutil.copy2(script_path, script_copy_path)
-        log_to_file(f"Script copied to: {script_copy_path}")
-        print(f"Script copied to: {script_copy_path}")
-    except Exception as e:
-        log_to_file(f"Error copying script: {e}")
-        print(f"Error copying script: {e}")
+        log_writer.log(traceback.format_exc())
+    finally:
+        cache_stats = llm.cache_stats()
+        session_log.write_artifact("response_cache.json", json.dumps(cache_stats, indent=2).encode("utf-8"))
+        session_log.write_artifact("usage.json", json.dumps(usage_meter.stats(), indent=2).encode("utf-8"))
+        llm.close()
+        tracer.close()
+        # Flush every queued step before moving on, even if agent.run() raised
+        await asyncio.to_thread(log_writer.close)
+        screenshot_encoder.close()
+        print(f"Session log stats: {session_log.stats()}")
+        print(f"Screenshot store stats: {screenshot_store.stats()}")
+        print(f"Screenshot encoding stats: {screenshot_encoder.stats()}")
+        print(f"LLM endpoint stats: {llm.stats()}")
+        print(f"Prefix cache stats: {llm.prefix_stats()}")
+        print(f"Response cache stats: {cache_stats}")
+        print(f"Adaptive vision stats: {vision_policy.stats()}")
+        print(f"DOM compaction stats: {dom_compactor.stats()}")
+        print(f"Streaming stats: {streaming.stats()}")
+        print(f"Step timing stats: {tracer.stats()}")
+        print(f"Stall detector stats: {stall_detector.stats()}")
+        print(f"Token usage: {usage_meter.stats()}")
 
     # Keep the script running to prevent browser from closing
     print(f"\nTask completed! Logs saved to: {SESSION_DIR}")
@@ -0,0 +1,421 @@
+"""
+Batch runner: run many agent tasks concurrently on a pool of warm browsers.
+
+Reads tasks from a JSONL file, one object per line:
+    {"id": "show-hn-1", "task": "Find the number 1 post on Show HN"}
+    {"id": "gdoc", "task": "create a google doc", "model": "gpt-4.1-mini", "provider": "openai", "max_steps": 30}
+    {"id": "cheap", "task": "Find the number 1 post on Show HN", "cost_budget": 0.05, "token_budget": 200000}
+
+Only "task" is required. Each task gets its own agent_logs/<timestamp>_<id>/
+session directory with the usual logs, and one summary line per task is
+appended to agent_logs/<timestamp>_batch/results.jsonl as tasks finish.
+Token usage and cost are recorded per step in actions.jsonl, per task under
+"usage" in results.jsonl and summed for the batch; a task that goes over its
+token or cost budget is stopped.
+
+Usage:
+    python batch_runner.py tasks.jsonl --parallel 4
+    python batch_runner.py tasks.jsonl --provider vllm --model InternVL3_5-14B --base-url http://158.130.4.155:11434/v1
+    python batch_runner.py tasks.jsonl --provider ollama --model qwen2.5vl:72b --host http://158.130.4.155:11434
+    python batch_runner.py tasks.jsonl --provider vllm --stream  # per-call timings in <batch>/llm_stream.jsonl
+    python batch_runner.py tasks.jsonl --macros agent_logs/macros  # replay tasks that succeeded before without the LLM
+    python batch_runner.py tasks.jsonl --ask-human http:8765 --ask-human-timeout 120  # agents may ask a person
+    python batch_runner.py tasks.jsonl --open-tabs 4  # agents may read several pages per step, 4 loading at once
+    python batch_runner.py tasks.jsonl --provider openai --model gpt-4.1-mini --cost-budget 0.25 --prices prices.json
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from browser_use import Agent, ChatOllama, ChatOpenAI
+from browser_use.tools.service import Tools
+from dotenv import load_dotenv
+
+from adaptive_vision import AdaptiveVision, VisionPolicy
+from browser_pool import BrowserPool, note_visited
+from dom_compaction import DomCompaction, DomCompactor
+from human_channel import HumanChannel, agent_step_timeout, make_frontend, register_ask_human
+from llm_pool import EndpointPool
+from multi_tab import TabGatherer, register_open_tabs
+from prefix_cache import PrefixCacheShaper
+from replay import MacroRecorder, MacroStore, ReplayLLM
+from response_cache import ResponseCache
+from screenshot_encoding import ScreenshotEncoder, ScreenshotPolicy
+from stall_detector import RESPONSES as STALL_RESPONSES, StallDetector, StallGuard
+from step_logging import make_step_callback, open_step_logger
+from step_timing import StepTracer, TracedLLM
+from streaming_llm import StreamingFactory
+from token_usage import Budget, MeteredLLM, UsageMeter, load_prices, merge_usage
+
+load_dotenv()
+
+LOGS_DIR = Path("agent_logs")
+
+
+def make_llm(provider: str, model: str, base_url: str | None = None, host: str | None = None, streaming=None):
+    """
+    Build the chat model the same way the single-task scripts do
+
+    base_url / host may list several servers separated by commas; requests are
+    then balanced across them by EndpointPool. Pass a StreamingFactory as
+    `streaming` to stream vLLM responses (per-call timings, rambling guard).
+    """
+    if provider == "ollama":
+        hosts = (host or "http://158.130.4.155:11434").split(",")
+        return EndpointPool(
+            hosts, model, llm_factory=lambda host, model, **kwargs: ChatOllama(model=model, host=host, **kwargs)
+        )
+    if provider == "vllm":
+        return EndpointPool(
+            (base_url or "http://158.130.4.155:11434/v1").split(","),
+            model,
+            llm_factory=streaming,
+            temperature=0.7,
+            max_completion_tokens=4096,
+            timeout=120.0,
+        )
+    return ChatOpenAI(model=model)
+
+
+def load_tasks(path: Path) -> list[dict]:
+    tasks = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            spec = json.loads(line)
+            if "task" not in spec:
+                raise ValueError(f"{path}:{line_number}: missing 'task'")
+            spec.setdefault("id", f"task{line_number:03d}")
+            tasks.append(spec)
+    return tasks
+
+
+def _safe_id(task_id: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", str(task_id))[:60]
+
+
+def log_replay_event(log_writer, event: dict):
+    log_writer.write_jsonl("replay.jsonl", event)
+    if event["event"] == "diverged":
+        log_writer.log(f"🔀 Replay diverged at recorded step {event['position'] + 1}: {event['reason']}; continuing with the LLM")
+
+
+class BatchRunner:
+    def __init__(self, args, pool: BrowserPool, screenshot_encoder: ScreenshotEncoder, name: str = "batch"):
+        self.args = args
+        self.pool = pool
+        self.screenshot_encoder = screenshot_encoder
+        self.semaphore = asyncio.Semaphore(args.parallel)
+        self.batch_dir = LOGS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{name}"
+        self.batch_dir.mkdir(parents=True, exist_ok=True)
+        self.results_path = self.batch_dir / "results.jsonl"
+        # Batch-level JSONL appends come from the event loop (callbacks, finished tasks); one thread does the IO in order
+        self._writes = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-log")
+        self._closed = False
+        self._llms = {}
+        self._streaming = {}
+        self.macro_store = MacroStore(args.macros) if args.macros else None
+        self.prices = load_prices(args.prices)
+        self.human_channel = None
+        if args.ask_human:
+            # Shared by all tasks, so any number of agents can wait for answers at once
+            self.human_channel = HumanChannel(
+                default_timeout=args.ask_human_timeout,
+                default_answer=args.ask_human_default,
+                frontends=[make_frontend(spec) for spec in args.ask_human],
+                on_event=lambda event: self.write_jsonl("human.jsonl", event),
+            )
+
+    def llm_for(self, spec: dict):
+        """Shared base chat model for a task's provider and model (per-task wrappers are added in run_task)"""
+        key = (spec.get("provider", self.args.provider), spec.get("model", self.args.model))
+        if key not in self._llms:
+            streaming = None
+            if self.args.stream:
+                streaming = self._streaming[key] = StreamingFactory(
+                    on_timing=lambda record: self.write_jsonl("llm_stream.jsonl", record)
+                )
+            llm = make_llm(*key, base_url=self.args.base_url, host=self.args.host, streaming=streaming)
+            if self.args.prefix_cache:
+                llm = PrefixCacheShaper(llm)
+            self._llms[key] = llm
+        return self._llms[key]
+
+    def write_jsonl(self, name: str, record: dict):
+        """Append a record to a JSONL file in the batch directory, off the event loop"""
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        if self._closed:
+            self._append(name, line)
+        else:
+            self._writes.submit(self._append, name, line)
+
+    def _append(self, name: str, line: str):
+        with open(self.batch_dir / name, "a", encoding="utf-8") as f:
+            f.write(line)
+
+    async def run_task(self, spec: dict) -> dict:
+        async with self.semaphore:
+            session_dir = LOGS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{_safe_id(spec['id'])}"
+            log_writer = open_step_logger(session_dir, archive=self.args.archive, screenshot_encoder=self.screenshot_encoder)
+            # Innermost, so cached and replayed answers cost nothing
+            usage_meter = UsageMeter(self.prices, Budget(
+                max_tokens=spec.get("token_budget", self.args.token_budget),
+                max_cost_usd=spec.get("cost_budget", self.args.cost_budget),
+            ))
+            llm = MeteredLLM(self.llm_for(spec), usage_meter)
+            if self.args.response_cache:
+                # Per task, so hit/miss counters are per session; the SQLite file is shared
+                llm = ResponseCache(llm, self.args.response_cache)
+            dom_compactor = None
+            if self.args.dom_budget:
+                dom_compactor = DomCompactor(budget_tokens=self.args.dom_budget)
+                llm = DomCompaction(llm, dom_compactor)
+            vision_policy = None
+            if self.args.adaptive_vision:
+                # Per task: the policy compares each step with the previous one
+                vision_policy = VisionPolicy()
+                llm = AdaptiveVision(llm, vision_policy)
+            macro_recorder = replay_llm = None
+            if self.macro_store is not None:
+                macro_recorder = MacroRecorder(spec["task"])
+                macro = self.macro_store.get(spec["task"])
+                if macro is not None:
+                    # Outside DomCompaction and AdaptiveVision so the recorded page is compared with the full DOM
+                    replay_llm = llm = ReplayLLM(
+                        llm, macro,
+                        on_event=lambda event: log_replay_event(log_writer, event),
+                    )
+            stall_detector = None
+            if self.args.stall_guard:
+                stall_detector = StallDetector(
+                    response=self.args.stall_guard,
+                    on_event=lambda event: log_writer.write_jsonl("stall.jsonl", event),
+                )
+                llm = StallGuard(llm, stall_detector)
+            tracer = StepTracer(log_writer, otel_endpoint=self.args.otel_endpoint)
+            llm = TracedLLM(llm, tracer)
+            agent_kwargs = {}
+            tab_gatherer = None
+            if self.human_channel is not None or self.args.open_tabs:
+                tools = agent_kwargs["tools"] = Tools()
+                if self.human_channel is not None:
+                    # A step waiting for an answer must not hit browser_use's step timeout first
+                    agent_kwargs["step_timeout"] = agent_step_timeout(self.human_channel.default_timeout)
+                    register_ask_human(tools, self.human_channel, session_log=log_writer, tracer=tracer, source=spec["id"])
+                if self.args.open_tabs:
+                    # Per task, so the limit applies to each agent's browser
+                    tab_gatherer = TabGatherer(max_concurrent=self.args.open_tabs)
+                    register_open_tabs(tools, tab_gatherer, session_log=log_writer)
+            result = {
+                "id": spec["id"],
+                "task": spec["task"],
+                "model": llm.model if hasattr(llm, 'model') else 'unknown',
+                "session_dir": str(session_dir),
+            }
+
+            log_writer.log(f"Starting agent session (batch {self.batch_dir.name})")
+            log_writer.log(f"Session directory: {session_dir}")
+            log_writer.log(f"Task: {spec['task']}")
+            log_writer.log(f"Model: {result['model']}")
+
+            start = time.monotonic()
+            try:
+                async with self.pool.acquire() as browser:
+                    result["browser_ready_s"] = round(time.monotonic() - start, 3)
+                    agent = Agent(
+                        task=spec["task"],
+                        llm=llm,
+                        browser=browser,
+                        register_new_step_callback=tracer.wrap_step_callback(
+                            make_step_callback(log_writer, vision_policy, dom_compactor, stall_detector, macro_recorder, usage_meter)
+                        ),
+                        use_vision=spec.get("use_vision", True),
+                        **agent_kwargs,
+                    )
+                    if stall_detector is not None:
+                        stall_detector.bind(agent)
+                    usage_meter.bind(agent)
+                    if replay_llm is not None:
+                        replay_llm.bind(agent)
+                    try:
+                        history = await agent.run(
+                            max_steps=spec.get("max_steps", self.args.max_steps),
+                            on_step_start=tracer.on_step_start,
+                            on_step_end=tracer.on_step_end,
+                        )
+                    finally:
+                        # The reset on release clears storage of every origin the agent went through
+                        note_visited(browser, agent.history.urls())
+                result["success"] = history.is_successful()
+                result["final_result"] = history.final_result()
+                if result["success"] and macro_recorder is not None and not (replay_llm and replay_llm.completed):
+                    # New macro, or a replay that needed the LLM: keep the trace that worked this time
+                    self.macro_store.save(macro_recorder.macro(session=session_dir.name, model=result["model"]))
+                elif result["success"] and replay_llm is not None:
+                    self.macro_store.mark_replayed(spec["task"])
+                log_writer.log(f"\nAgent completed successfully!")
+                log_writer.log(f"Result: {result['final_result']}")
+            except Exception as e:
+                result["success"] = False
+                result["error"] = str(e)
+                log_writer.log(f"\nAgent encountered an error: {e}")
+                log_writer.log(traceback.format_exc())
+            finally:
+                result["steps"] = log_writer.last_step
+                result["duration_s"] = round(time.monotonic() - start, 3)
+                log_writer.log(f"Total steps: {log_writer.last_step}")
+                if vision_policy is not None:
+                    result["vision"] = vision_policy.stats()
+                    log_writer.log(f"Adaptive vision stats: {result['vision']}")
+                if dom_compactor is not None:
+                    result["dom_compaction"] = dom_compactor.stats()
+                    log_writer.log(f"DOM compaction stats: {result['dom_compaction']}")
+                if replay_llm is not None:
+                    result["replay"] = replay_llm.replay_stats()
+                    log_writer.log(f"Replay stats: {result['replay']}")
+                if stall_detector is not None:
+                    result["stall"] = stall_detector.stats()
+                    log_writer.log(f"Stall detector stats: {result['stall']}")
+                if tab_gatherer is not None:
+                    result["tabs"] = tab_gatherer.stats()
+                    log_writer.log(f"Multi-tab stats: {result['tabs']}")
+                result["usage"] = usage_meter.stats()
+                log_writer.log(f"Token usage: {result['usage']}")
+                if usage_meter.abort_reason is not None:
+                    result["success"] = False
+                    result.setdefault("error", usage_meter.abort_reason)
+                if self.human_channel is not None:
+                    result["human"] = self.human_channel.stats(source=spec["id"])
+                    log_writer.log(f"Human input stats: {result['human']}")
+                if self.args.response_cache:
+                    result["response_cache"] = llm.cache_stats()
+                    log_writer.log(f"Response cache stats: {result['response_cache']}")
+                    llm.close()
+                tracer.close()
+                result["timing"] = tracer.stats()
+                await asyncio.to_thread(log_writer.close)
+
+            self.write_jsonl(self.results_path.name, result)
+            status = "✅" if result["success"] else "❌"
+            print(f"{status} {spec['id']} ({result['duration_s']}s, {result['steps']} steps) -> {session_dir}")
+            return result
+
+    async def run(self, tasks: list[dict]) -> list[dict]:
+        return await asyncio.gather(*(self.run_task(spec) for spec in tasks))
+
+    def close(self):
+        if self.human_channel is not None:
+            self.human_channel.close()
+        # Waits for the queued appends
+        self._closed = True
+        self._writes.shutdown(wait=True)
+
+
+def add_runner_args(parser: argparse.ArgumentParser):
+    """Options shared by batch_runner.py and browser_daemon.py"""
+    parser.add_argument("--parallel", type=int, default=2, help="Maximum number of tasks running at once")
+    parser.add_argument("--pool-size", type=int, help="Warm browsers to keep (default: --parallel)")
+    parser.add_argument("--provider", choices=["openai", "vllm", "ollama"], default="vllm")
+    parser.add_argument("--model", default="InternVL3_5-14B")
+    parser.add_argument("--base-url", help="OpenAI-compatible endpoint(s) for --provider vllm, comma-separated")
+    parser.add_argument("--host", help="Ollama host(s) for --provider ollama, comma-separated")
+    parser.add_argument("--max-steps", type=int, default=50)
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("--archive", action="store_true", help="Write each session as a single session.bsa")
+    parser.add_argument("--prefix-cache", action="store_true", help="Order prompts stable-first for vLLM prefix caching")
+    parser.add_argument("--response-cache", type=Path, help="SQLite file caching LLM responses across runs")
+    parser.add_argument("--adaptive-vision", action="store_true", help="Send screenshots only when the DOM isn't enough")
+    parser.add_argument("--dom-budget", type=int, help="Compact the DOM listing sent to the LLM to about this many tokens")
+    parser.add_argument("--stream", action="store_true", help="Stream vLLM responses (timings and rambling guard)")
+    parser.add_argument("--stall-guard", choices=STALL_RESPONSES, help="Detect stuck or cycling agents and respond this way")
+    parser.add_argument("--otel-endpoint", help="Also export per-step timings as OpenTelemetry spans to this OTLP collector")
+    parser.add_argument("--macros", type=Path, help="Macro directory: replay recorded traces of tasks that succeeded before, record new ones")
+    parser.add_argument("--open-tabs", type=int, metavar="N",
+                        help="Give agents an open_tabs action that reads several pages per step, N loading at once")
+    parser.add_argument("--ask-human", action="append", metavar="FRONTEND",
+                        help="Give agents an ask_human action answered via 'terminal', 'http[:PORT]' or a file-drop directory (repeatable)")
+    parser.add_argument("--ask-human-timeout", type=float, default=300.0, help="Seconds to wait for a human answer (at most 120 on browser_use releases with a fixed 180s step timeout)")
+    parser.add_argument("--ask-human-default", help="Answer used when nobody answers in time (default: the action fails)")
+    parser.add_argument("--prices", type=Path, help="JSON price table (USD per million tokens) extending the built-in one")
+    parser.add_argument("--token-budget", type=int, help="Stop a task after this many prompt + completion tokens")
+    parser.add_argument("--cost-budget", type=float, help="Stop a task after this many USD of LLM calls")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run agent tasks from a JSONL file concurrently")
+    parser.add_argument("tasks", type=Path, help="JSONL file with one task per line")
+    add_runner_args(parser)
+    return parser.parse_args(argv)
+
+
+async def run_batch(args, tasks: list[dict], run=None, name: str = "batch",
+                    screenshot_encoder: ScreenshotEncoder | None = None) -> list[dict]:
+    """
+    Run tasks with the options of add_runner_args and print the batch summary
+
+    run(runner, tasks) replaces BatchRunner.run, e.g. to fan tasks out into subtasks.
+    A caller that starts threads of its own (servers, ...) passes a screenshot_encoder
+    created before them, and closes it.
+    """
+    owns_encoder = screenshot_encoder is None
+    if owns_encoder:
+        # Fork the encoder's workers before any browser or writer thread exists
+        screenshot_encoder = ScreenshotEncoder(ScreenshotPolicy(max_dimension=1280, format="webp", quality=80))
+    pool = BrowserPool(size=args.pool_size or args.parallel, profile_kwargs={"headless": args.headless})
+
+    print(f"Running {len(tasks)} tasks, {args.parallel} at a time, on {pool.size} warm browsers")
+    start = time.monotonic()
+    runner = BatchRunner(args, pool, screenshot_encoder, name=name)
+    try:
+        await pool.start()
+        results = await (run(runner, tasks) if run is not None else runner.run(tasks))
+    finally:
+        runner.close()
+        await pool.close()
+        if owns_encoder:
+            screenshot_encoder.close()
+
+    succeeded = sum(1 for result in results if result["success"])
+    print(f"\nBatch finished in {time.monotonic() - start:.1f}s: {succeeded}/{len(results)} succeeded")
+    print(f"Results: {runner.results_path}")
+    print(f"Browser pool stats: {pool.stats()}")
+    for llm in runner._llms.values():
+        if hasattr(llm, 'stats'):
+            print(f"LLM endpoint stats ({llm.model}): {llm.stats()}")
+        if hasattr(llm, 'prefix_stats'):
+            print(f"Prefix cache stats ({llm.model}): {llm.prefix_stats()}")
+    for (provider, model), streaming in runner._streaming.items():
+        print(f"Streaming stats ({model}): {streaming.stats()}")
+    print(f"Screenshot encoding stats: {screenshot_encoder.stats()}")
+    if runner.human_channel is not None:
+        print(f"Human input stats: {runner.human_channel.stats()}")
+    usage = merge_usage([result.get("usage") for result in results])
+    print(f"Token usage: {usage['prompt_tokens']} prompt ({usage['cached_tokens']} cached, {usage['image_tokens']} image), "
+          f"{usage['completion_tokens']} completion, ${usage['cost_usd']:.4f} over {usage['calls']} calls"
+          + (f", {usage['over_budget']} tasks stopped by their budget" if usage["over_budget"] else ""))
+    for model, totals in usage["by_model"].items():
+        print(f"   {model}: {totals['total_tokens']} tokens, ${totals['cost_usd']:.4f}"
+              + (f" ({totals['estimated_calls']} of {totals['calls']} calls estimated)" if totals["estimated_calls"] else ""))
+    runner.write_jsonl("usage.jsonl", {"timestamp": datetime.now().isoformat(), "tasks": len(results), **usage})
+    replays = [result["replay"] for result in results if "replay" in result]
+    if replays:
+        replayed = sum(replay["replayed_steps"] for replay in replays)
+        print(f"Replay stats: {replayed} steps replayed without the LLM, "
+              f"{sum(replay['completed'] for replay in replays)}/{len(replays)} macros replayed to the end")
+    return results
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    await run_batch(args, load_tasks(args.tasks))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
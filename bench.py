@@ -0,0 +1,351 @@
+"""
+Benchmark harness for the logging and orchestration layers.
+
+Runs entirely on this machine, without Hacker News, Steel or the vLLM box:
+
+  agent mode (default): bench_site.py serves a stub of the recorded sites and
+    llm_stub_server.py replays the recorded sessions' actions as a
+    deterministic OpenAI-compatible model. Every session becomes a task
+    tagged [replay:<session>] that runs through batch_runner (warm browser
+    pool, step logging, timings) with the runner options given here.
+  logging mode: the recorded steps (browser state, screenshot, DOM text,
+    LLM output) are replayed through the real step callback
+    (make_step_callback -> build_step_snapshot -> StepLogWriter) from
+    stand-in browser state objects, with no browser, to measure the callback
+    and writer cost alone.
+
+Reported per run: steps/sec, p50/p95 step latency, callback overhead
+(p50/p95 of the log_callback span, or of the whole step callback in logging
+mode), Python peak RSS and its growth per step, and bytes written per step.
+--json writes the report; --compare checks it against a previous report and
+exits 1 when a metric got worse by more than --tolerance.
+
+Usage:
+    python bench.py --sessions agent_logs/20251024_115204 agent_logs/20251025_160325 --repeat 3 --headless --json bench/base.json
+    python bench.py --headless --prefix-cache --stream --json bench/new.json --compare bench/base.json
+    python bench.py --mode logging --repeat 5 --json bench/logging.json
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from session_analytics import SessionSource, find_sessions, parse_session_log, recorded_actions
+
+LOGS_DIR = Path("agent_logs")
+
+# Metric -> True if higher is better; used by --compare
+METRICS = {
+    "steps_per_s": True,
+    "step_p50_ms": False,
+    "step_p95_ms": False,
+    "callback_p50_ms": False,
+    "callback_p95_ms": False,
+    "bytes_per_step": False,
+    "rss_growth_per_step_kb": False,
+    "max_rss_mb": False,
+}
+
+
+def _percentile(values: list[float], percentile: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))], 2)
+
+
+def _max_rss_kb() -> int:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def _dir_bytes(path: Path) -> int:
+    return sum(file.stat().st_size for file in Path(path).rglob("*") if file.is_file())
+
+
+def recorded_sessions(logs_dir: Path = LOGS_DIR) -> list[Path]:
+    """Sessions with a task and at least one recorded action"""
+    sessions = []
+    for session_dir in find_sessions(logs_dir):
+        source = SessionSource(session_dir)
+        try:
+            log_text = source.log_text()
+            has_actions = any(record.get("actions") for record in source.records("action")) or recorded_actions(log_text)
+            if parse_session_log(log_text)["task"] and has_actions:
+                sessions.append(session_dir)
+        finally:
+            source.close()
+    return sessions
+
+
+def report(mode: str, wall_s: float, steps: int, step_ms: list[float], callback_ms: list[float],
+           bytes_written: int, rss_before_kb: int, extra: dict) -> dict:
+    rss_after_kb = _max_rss_kb()
+    return {
+        "mode": mode,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "steps": steps,
+        "wall_s": round(wall_s, 3),
+        "steps_per_s": round(steps / wall_s, 3) if wall_s else None,
+        "step_p50_ms": _percentile(step_ms, 50),
+        "step_p95_ms": _percentile(step_ms, 95),
+        "callback_p50_ms": _percentile(callback_ms, 50),
+        "callback_p95_ms": _percentile(callback_ms, 95),
+        "bytes_per_step": round(bytes_written / steps) if steps else None,
+        "max_rss_mb": round(rss_after_kb / 1024, 1),
+        "rss_growth_per_step_kb": round((rss_after_kb - rss_before_kb) / steps, 1) if steps else None,
+        **extra,
+    }
+
+
+# ===== AGENT MODE =====
+
+async def bench_agents(args, sessions: list[Path]) -> dict:
+    from batch_runner import run_batch
+    from bench_site import start_site
+    from llm_stub_server import session_script, start_stub_server
+    from screenshot_encoding import ScreenshotEncoder, ScreenshotPolicy
+
+    # Fork the encoder's workers before the site and LLM server threads start
+    screenshot_encoder = ScreenshotEncoder(ScreenshotPolicy(max_dimension=1280, format="webp", quality=80))
+    site, site_url = start_site(delay=args.site_delay)
+    scripts = {session_dir.name: session_script(session_dir, site_url) for session_dir in sessions}
+    llm_server, base_url = start_stub_server(delay=args.llm_delay, scripts=scripts, chunk_delay=args.llm_chunk_delay)
+    args.provider, args.model, args.base_url = "vllm", "stub", base_url
+
+    tasks = []
+    for session_dir in sessions:
+        source = SessionSource(session_dir)
+        try:
+            task = parse_session_log(source.log_text())["task"]
+        finally:
+            source.close()
+        for repeat in range(args.repeat):
+            tasks.append({
+                "id": f"bench-{session_dir.name}-{repeat}",
+                "task": f"{task} [replay:{session_dir.name}]",
+                "max_steps": len(scripts[session_dir.name]) + 2,
+            })
+
+    rss_before_kb = _max_rss_kb()
+    start = time.monotonic()
+    try:
+        results = await run_batch(args, tasks, name="bench", screenshot_encoder=screenshot_encoder)
+        wall_s = time.monotonic() - start
+    finally:
+        llm_server.shutdown()
+        site.shutdown()
+        screenshot_encoder.close()
+
+    step_ms, callback_ms, steps, bytes_written = [], [], 0, 0
+    for result in results:
+        session_dir = Path(result["session_dir"])
+        timings_path = session_dir / "timings.jsonl"
+        if timings_path.exists():
+            with open(timings_path, encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    step_ms.append(record["duration_ms"])
+                    if "log_callback" in record["spans"]:
+                        callback_ms.append(record["spans"]["log_callback"])
+        steps += result.get("steps") or 0
+        bytes_written += _dir_bytes(session_dir)
+        if not args.keep_sessions:
+            shutil.rmtree(session_dir, ignore_errors=True)
+
+    return report("agent", wall_s, steps, step_ms, callback_ms, bytes_written, rss_before_kb, {
+        "sessions": [session_dir.name for session_dir in sessions],
+        "tasks": len(tasks),
+        "succeeded": sum(1 for result in results if result["success"]),
+        "parallel": args.parallel,
+        "site_requests": site.counters["requests"],
+        "llm_requests": llm_server.state.requests,
+    })
+
+
+# ===== LOGGING MODE =====
+
+class RecordedDomState:
+    """dom_state stand-in: the recorded LLM DOM text, no live nodes"""
+
+    def __init__(self, dom_text: str | None, items_count: int):
+        self.dom_text = dom_text
+        self.selector_map = {}
+        self.element_tree = [None] * items_count
+
+    def llm_representation(self) -> str:
+        return self.dom_text or ""
+
+
+def recorded_steps(session_dir: Path) -> list:
+    """
+    The session's steps as (browser_state, agent_output, step_number) stand-ins
+    with the attributes build_step_snapshot reads, so the real step callback can
+    be driven without a browser
+    """
+    from types import SimpleNamespace
+
+    from dom_delta import DOM_SNAPSHOTS, DomSnapshots
+
+    source = SessionSource(session_dir)
+    try:
+        states = {record["step"]: record for record in source.records("browser_state") if "step" in record}
+        actions = {record["step"]: record for record in source.records("action") if "step" in record}
+        dom_records = source.records("jsonl", DOM_SNAPSHOTS)
+        dom_snapshots = DomSnapshots(dom_records) if dom_records else None
+        dom_steps = set(dom_snapshots.steps()) if dom_snapshots else set()
+
+        steps = []
+        for step in sorted(states):
+            state = states[step]
+            screenshot = source.read_artifact(state.get("screenshot") or f"screenshots/step_{step:03d}.png")
+            dom_text = dom_snapshots.reconstruct(step) if step in dom_steps else None
+            if dom_text is None:
+                data = source.read_artifact(f"step_{step:03d}_llm_dom.txt")
+                dom_text = data.decode("utf-8", errors="replace") if data is not None else None
+            page_info = state.get("page_info")
+            browser_state = SimpleNamespace(
+                url=state.get("url"),
+                title=state.get("title"),
+                tabs=[SimpleNamespace(**tab) for tab in state.get("tabs") or []],
+                dom_state=RecordedDomState(dom_text, state.get("dom_items_count") or 0),
+                page_info=SimpleNamespace(**page_info) if page_info else None,
+                screenshot=base64.b64encode(screenshot).decode("ascii") if screenshot else None,
+            )
+            record = actions.get(step, {})
+            agent_output = SimpleNamespace(
+                current_state=SimpleNamespace(
+                    thinking=record.get("thinking"),
+                    evaluation_previous_goal=record.get("evaluation"),
+                    memory=record.get("memory"),
+                    next_goal=record.get("next_goal"),
+                ),
+                action=record.get("actions") or [],
+            )
+            steps.append((browser_state, agent_output, step))
+    finally:
+        source.close()
+    return steps
+
+
+async def bench_logging(args, sessions: list[Path]) -> dict:
+    from screenshot_encoding import ScreenshotEncoder, ScreenshotPolicy
+    from step_logging import make_step_callback, open_step_logger
+
+    recorded = {session_dir.name: recorded_steps(session_dir) for session_dir in sessions}
+    screenshot_encoder = ScreenshotEncoder(ScreenshotPolicy(max_dimension=1280, format="webp", quality=80))
+    out_dir = Path(tempfile.mkdtemp(prefix="bench_logging_"))
+
+    rss_before_kb = _max_rss_kb()
+    callback_ms, step_ms, steps, bytes_written = [], [], 0, 0
+    start = time.monotonic()
+    try:
+        for repeat in range(args.repeat):
+            for name, session_steps in recorded.items():
+                session_dir = out_dir / f"{name}_{repeat}"
+                log_writer = open_step_logger(session_dir, archive=args.archive, screenshot_encoder=screenshot_encoder)
+                step_callback = make_step_callback(log_writer)
+                for browser_state, agent_output, step_number in session_steps:
+                    step_start = time.monotonic()
+                    # The whole callback (snapshot building and submit) is what the agent's event loop pays
+                    await step_callback(browser_state, agent_output, step_number)
+                    callback_ms.append((time.monotonic() - step_start) * 1000)
+                    steps += 1
+                close_start = time.monotonic()
+                await asyncio.to_thread(log_writer.close)
+                # Spread the drain time over the session's steps
+                if session_steps:
+                    drain_ms = (time.monotonic() - close_start) * 1000 / len(session_steps)
+                    step_ms.extend(callback + drain_ms for callback in callback_ms[-len(session_steps):])
+                bytes_written += _dir_bytes(session_dir)
+    finally:
+        screenshot_encoder.close()
+        if not args.keep_sessions:
+            shutil.rmtree(out_dir, ignore_errors=True)
+    wall_s = time.monotonic() - start
+
+    return report("logging", wall_s, steps, step_ms, callback_ms, bytes_written, rss_before_kb, {
+        "sessions": list(recorded),
+        "repeat": args.repeat,
+        "archive": args.archive,
+        "output_dir": str(out_dir) if args.keep_sessions else None,
+    })
+
+
+# ===== COMPARISON =====
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Metrics that got worse than the baseline by more than tolerance (a fraction)"""
+    regressions = []
+    for metric, higher_is_better in METRICS.items():
+        new, old = current.get(metric), baseline.get(metric)
+        if new is None or old is None or old == 0:
+            continue
+        change = (new - old) / abs(old)
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def parse_args(argv=None):
+    from batch_runner import add_runner_args
+
+    parser = argparse.ArgumentParser(description="Benchmark the logging and orchestration layers offline")
+    parser.add_argument("--mode", choices=["agent", "logging"], default="agent")
+    parser.add_argument("--sessions", nargs="+", type=Path, help="Recorded sessions to replay (default: every replayable session in agent_logs)")
+    parser.add_argument("--repeat", type=int, default=1, help="Times each session is replayed")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="Seconds the mock LLM takes per response")
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.0,
+                        help="Seconds between the mock LLM's chunks when streaming (--stream)")
+    parser.add_argument("--site-delay", type=float, default=0.0, help="Seconds the stub site takes per page")
+    parser.add_argument("--keep-sessions", action="store_true", help="Keep the session directories written by the run")
+    parser.add_argument("--json", type=Path, help="Write the report here")
+    parser.add_argument("--compare", type=Path, help="Previous --json report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression per metric")
+    add_runner_args(parser)
+    return parser.parse_args(argv)
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    sessions = args.sessions or recorded_sessions()
+    if not sessions:
+        print("❌ No recorded sessions with actions to replay")
+        return 1
+
+    print(f"Benchmarking {args.mode} mode on {len(sessions)} sessions x {args.repeat}")
+    if args.mode == "agent":
+        result = await bench_agents(args, sessions)
+    else:
+        result = await bench_logging(args, sessions)
+
+    print(json.dumps(result, indent=2))
+    if args.json:
+        args.json.parent.mkdir(parents=True, exist_ok=True)
+        args.json.write_text(json.dumps(result, indent=2), encoding="utf-8")
+        print(f"Report: {args.json}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if baseline.get("mode") != result["mode"]:
+            print(f"⚠️ Baseline is a {baseline.get('mode')} run, this is {result['mode']}")
+        regressions = compare(result, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regressions vs {args.compare}:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print(f"✅ No regressions vs {args.compare} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,243 @@
+"""
+Local stand-in for the sites in our agent logs, for benchmarks.
+
+Serves deterministic pages with Hacker News' markup (the table layout,
+tr.athing rows, span.titleline, td.subtext, a.morelink) so the DOM the agent
+sees has the same shape and size as in the recorded sessions:
+
+    /, /news, /newest     story listings, 30 per page, ?p=N up to `pages`
+    /show                 Show HN listing with the rules line above the stories
+    /item?id=N            story page with a comment tree
+    /user?id=NAME         profile page
+    /ext/<host>/<path>    generic article page, used for every non-HN URL
+                          (github.com, instacart.com, ...) so nothing leaves the machine
+
+rewrite_url() maps a recorded URL onto this site. --delay adds a fixed
+per-page latency to mimic the network.
+
+Usage:
+    python bench_site.py --port 8100
+    server, site_url = start_site(delay=0.05)   # in-process, background thread
+    rewrite_url("https://news.ycombinator.com/show", site_url)  # -> http://127.0.0.1:<port>/show
+"""
+import argparse
+import hashlib
+import threading
+import time
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+HN_HOSTS = ("news.ycombinator.com", "www.showhn.com", "showhn.com")
+PER_PAGE = 30
+FIRST_ITEM_ID = 45600000
+
+# Titles seen in the recorded sessions, followed by generated ones
+_TITLES = [
+    ("Show HN: I built an 8-bit CPU simulator in Python from scratch", "github.com/sql-hkr", "sql-hkr"),
+    ("Show HN: A fast, privacy-first image converter that runs in browser", "imageconverter.app", "wainguo"),
+    ("Show HN: Git for LLMs – A context management interface", "twigg.ai", "jborden"),
+    ("Show HN: macOS live screensaver", "github.com/hauxir", "hauxir"),
+    ("Show HN: Shadcn theme generator", "shadcnthemer.com", "thmr"),
+]
+_WORDS = [
+    "database", "compiler", "terminal", "browser", "editor", "scheduler", "renderer", "protocol", "agent",
+    "visualizer", "tracker", "emulator", "notebook", "search", "cache", "framework", "toolkit", "parser",
+]
+
+
+def _digest(*parts) -> int:
+    return int(hashlib.sha256("/".join(map(str, parts)).encode("utf-8")).hexdigest()[:8], 16)
+
+
+def story(rank: int, listing: str) -> dict:
+    """Deterministic story at a 1-based rank of a listing"""
+    seed = _digest(listing, rank)
+    if listing == "show" and rank <= len(_TITLES):
+        title, site, user = _TITLES[rank - 1]
+    else:
+        first, second = _WORDS[seed % len(_WORDS)], _WORDS[(seed // 7) % len(_WORDS)]
+        prefix = "Show HN: " if listing == "show" else ""
+        title = f"{prefix}A {first} {second} written in {('Rust', 'Go', 'Python', 'Zig', 'C')[seed % 5]}"
+        site, user = f"github.com/user{seed % 997}", f"user{seed % 997}"
+    return {
+        "id": FIRST_ITEM_ID + (_digest(listing) % 1000) * 100 + rank,
+        "rank": rank,
+        "title": title,
+        "site": site,
+        "user": user,
+        "points": 300 // rank + seed % 40,
+        "comments": seed % 120,
+        "age": f"{1 + seed % 23} hours ago",
+    }
+
+
+def _page(title: str, body: str) -> str:
+    return f"""<html lang="en" op="news"><head><meta name="referrer" content="origin">
+<link rel="stylesheet" type="text/css" href="/news.css"><title>{escape(title)}</title></head>
+<body><center><table id="hnmain" border="0" cellpadding="0" cellspacing="0" width="85%" bgcolor="#f6f6ef">
+<tr><td bgcolor="#ff6600"><table border="0" cellpadding="0" cellspacing="0" width="100%" style="padding:2px"><tr>
+<td style="width:18px;padding-right:4px"><a href="/"><img src="/y18.svg" width="18" height="18" style="border:1px white solid;"></a></td>
+<td style="line-height:12pt; height:10px;"><span class="pagetop"><b class="hnname"><a href="/news">Hacker News</a></b>
+<a href="/newest">new</a> | <a href="/front">past</a> | <a href="/newcomments">comments</a> | <a href="/ask">ask</a> |
+<a href="/show">show</a> | <a href="/jobs">jobs</a> | <a href="/submit" rel="nofollow">submit</a></span></td>
+<td style="text-align:right;padding-right:4px;"><span class="pagetop"><a href="/login?goto=news">login</a></span></td>
+</tr></table></td></tr>
+<tr id="bigbox"><td>{body}</td></tr>
+<tr><td><img src="/s.gif" height="10" width="0"><table width="100%" cellspacing="0" cellpadding="1"><tr><td bgcolor="#ff6600"></td></tr></table>
+<br><center><span class="yclinks"><a href="/newsguidelines.html">Guidelines</a> | <a href="/newsfaq.html">FAQ</a> |
+<a href="/lists">Lists</a> | <a href="/security.html">Security</a> | <a href="/legal">Legal</a> | <a href="/contact">Contact</a></span>
+<br><br><form method="get" action="/search">Search: <input type="text" name="q" size="17" autocorrect="off" spellcheck="false" autocapitalize="off" autocomplete="off"></form></center></td></tr>
+</table></center></body></html>"""
+
+
+def listing_page(listing: str, page: int, pages: int) -> str:
+    rows = []
+    if listing == "show":
+        rows.append('<tr><td colspan="2"></td><td>Please read the Show HN <a href="/showhn.html"><u>rules</u></a> '
+                    'and <a href="/item?id=22336638"><u>tips</u></a> before posting. You can browse the newest Show HNs '
+                    '<a href="/shownew"><u>here</u></a>.</td></tr><tr style="height:10px"></tr>')
+    for rank in range((page - 1) * PER_PAGE + 1, page * PER_PAGE + 1):
+        item = story(rank, listing)
+        rows.append(f"""<tr class="athing submission" id="{item['id']}">
+<td align="right" valign="top" class="title"><span class="rank">{rank}.</span></td>
+<td valign="top" class="votelinks"><center><a id="up_{item['id']}" href="/vote?id={item['id']}&how=up&goto={listing}"><div class="votearrow" title="upvote"></div></a></center></td>
+<td class="title"><span class="titleline"><a href="/ext/{item['site']}">{escape(item['title'])}</a>
+<span class="sitebit comhead"> (<a href="/from?site={quote(item['site'])}"><span class="sitestr">{item['site']}</span></a>)</span></span></td></tr>
+<tr><td colspan="2"></td><td class="subtext"><span class="subline">
+<span class="score" id="score_{item['id']}">{item['points']} points</span> by <a href="/user?id={item['user']}" class="hnuser">{item['user']}</a>
+<span class="age" title="2025-10-24T10:00:00"><a href="/item?id={item['id']}">{item['age']}</a></span> <span id="unv_{item['id']}"></span> |
+<a href="/hide?id={item['id']}&goto={listing}">hide</a> | <a href="/item?id={item['id']}">{item['comments']}&nbsp;comments</a></span></td></tr>
+<tr class="spacer" style="height:5px"></tr>""")
+    if page < pages:
+        rows.append(f'<tr class="morespace" style="height:10px"></tr><tr><td colspan="2"></td>'
+                    f'<td class="title"><a href="/{listing}?p={page + 1}" class="morelink" rel="next">More</a></td></tr>')
+    title = {"news": "Hacker News", "newest": "New Links | Hacker News", "show": "Show | Hacker News"}[listing]
+    return _page(title, f'<table border="0" cellpadding="0" cellspacing="0">{"".join(rows)}</table>')
+
+
+def item_page(item_id: int) -> str:
+    seed = _digest("item", item_id)
+    title = f"Item {item_id}"
+    for listing in ("show", "news", "newest"):
+        rank = item_id - FIRST_ITEM_ID - (_digest(listing) % 1000) * 100
+        if 1 <= rank <= 1000:
+            title = story(rank, listing)["title"]
+            break
+    comments = []
+    for i in range(seed % 25 + 5):
+        depth = (seed >> i) % 3 if i else 0
+        comments.append(f"""<tr class="athing comtr" id="{item_id * 100 + i}"><td><table border="0"><tr>
+<td class="ind" indent="{depth}"><img src="/s.gif" height="1" width="{depth * 40}"></td>
+<td valign="top" class="votelinks"><center><a id="up_{item_id * 100 + i}" href="/vote?id={item_id * 100 + i}&how=up"><div class="votearrow" title="upvote"></div></a></center></td>
+<td class="default"><div style="margin-top:2px; margin-bottom:-10px;"><span class="comhead">
+<a href="/user?id=commenter{i}" class="hnuser">commenter{i}</a> <span class="age"><a href="/item?id={item_id * 100 + i}">{i + 1} hours ago</a></span></span></div><br>
+<div class="comment"><div class="commtext c00">This is comment {i} on {escape(title)}. It goes into some detail about the {_WORDS[(seed + i) % len(_WORDS)]}.</div>
+<div class="reply"><p><font size="1"><u><a href="/reply?id={item_id * 100 + i}" rel="nofollow">reply</a></u></font></p></div></div></td></tr></table></td></tr>""")
+    body = (f'<table class="fatitem" border="0"><tr class="athing submission" id="{item_id}"><td class="title">'
+            f'<span class="titleline"><a href="/ext/github.com/item{item_id}">{escape(title)}</a></span></td></tr></table><br>'
+            f'<form action="/comment" method="post"><textarea name="text" rows="8" cols="80"></textarea><br><br>'
+            f'<input type="submit" value="add comment"></form><br><br>'
+            f'<table border="0" class="comment-tree">{"".join(comments)}</table>')
+    return _page(f"{title} | Hacker News", body)
+
+
+def user_page(name: str) -> str:
+    return _page(f"Profile: {name} | Hacker News",
+                 f'<table border="0"><tr><td valign="top">user:</td><td><a href="/user?id={escape(name)}" class="hnuser">{escape(name)}</a></td></tr>'
+                 f'<tr><td valign="top">karma:</td><td>{_digest("karma", name) % 5000}</td></tr>'
+                 f'<tr><td></td><td><a href="/submitted?id={escape(name)}"><u>submissions</u></a></td></tr></table>')
+
+
+def external_page(path: str) -> str:
+    """Generic article for any non-HN URL"""
+    seed = _digest("ext", path)
+    paragraphs = "".join(
+        f"<p>Section {i + 1} of {escape(path)}: notes on the {_WORDS[(seed + i) % len(_WORDS)]}, "
+        f"with benchmarks, installation steps and a short FAQ.</p>"
+        for i in range(seed % 8 + 4)
+    )
+    links = "".join(f'<li><a href="/ext/{escape(path)}/page{i}">Related page {i}</a></li>' for i in range(1, 8))
+    return (f"<html><head><title>{escape(path)}</title></head><body><header><a href=\"/ext/{escape(path.split('/')[0])}\">Home</a> "
+            f"<input type=\"search\" placeholder=\"Search\"><button>Search</button></header>"
+            f"<main><h1>{escape(path)}</h1>{paragraphs}<ul>{links}</ul><button>Add to cart</button></main></body></html>")
+
+
+def rewrite_url(url: str, site_url: str) -> str:
+    """Point a recorded URL at the stub site"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https"):
+        return url
+    if parsed.netloc in HN_HOSTS:
+        path = parsed.path if parsed.path not in ("", "/") else "/news"
+        return f"{site_url}{path}" + (f"?{parsed.query}" if parsed.query else "")
+    return f"{site_url}/ext/{parsed.netloc}{parsed.path.rstrip('/')}"
+
+
+def make_handler(delay: float, pages: int, counters: dict):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: str, content_type: str = "text/html; charset=utf-8"):
+            data = body.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            counters["requests"] += 1
+            if delay:
+                time.sleep(delay)
+            parsed = urlparse(self.path)
+            query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+            path = parsed.path.rstrip("/") or "/news"
+            try:
+                page = max(1, min(int(query.get("p", 1)), pages))
+                if path in ("/news", "/front", "/newest", "/show", "/shownew", "/ask", "/jobs"):
+                    listing = {"/newest": "newest", "/shownew": "newest", "/show": "show"}.get(path, "news")
+                    self._send(200, listing_page(listing, page, pages))
+                elif path == "/item":
+                    self._send(200, item_page(int(query.get("id", FIRST_ITEM_ID))))
+                elif path == "/user":
+                    self._send(200, user_page(query.get("id", "anonymous")))
+                elif path.startswith("/ext/"):
+                    self._send(200, external_page(path[len("/ext/"):]))
+                elif path.endswith((".css", ".svg", ".gif")):
+                    self._send(200, "", "text/css" if path.endswith(".css") else "image/svg+xml")
+                else:
+                    self._send(200, _page("Hacker News", f"<p>{escape(path)}</p>"))
+            except ValueError:
+                self._send(400, _page("Bad request", "<p>Bad request</p>"))
+
+    return Handler
+
+
+def start_site(port: int = 0, delay: float = 0.0, pages: int = 5):
+    """Start the site on a background thread; returns (server, site_url). Stop with server.shutdown()."""
+    counters = {"requests": 0}
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(delay, pages, counters))
+    server.counters = counters
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stub of the sites in the agent logs")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per listing")
+    args = parser.parse_args(argv)
+
+    server, site_url = start_site(args.port, args.delay, args.pages)
+    print(f"🧪 Stub site at {site_url} (Show HN: {site_url}/show)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Long-lived browser daemon: warm browsers that accept agent tasks over a local socket.
+
+The single-task scripts keep the browser open by parking on
+asyncio.Event().wait(), which leaves a Chromium process idling until the
+script is killed. The daemon instead keeps a BrowserPool running and takes
+tasks from clients: between tasks each browser is reset (cookies, storage,
+extra tabs), and it is relaunched after --recycle-after tasks or once its
+processes use more than --max-memory-mb, which is also checked while idle.
+
+Protocol: newline-delimited JSON over a Unix socket (or 127.0.0.1:--port).
+Each request line gets one response line.
+    {"cmd": "run", "task": "...", "id": "optional", "model": "...", "max_steps": 30}
+        -> the batch_runner result record (success, final_result, steps, session_dir, ...)
+    {"cmd": "stats"}     -> pool and runner counters
+    {"cmd": "shutdown"}  -> stops accepting work, closes the browsers
+
+Usage:
+    python browser_daemon.py serve --pool-size 2 --recycle-after 20 --max-memory-mb 2000
+    python browser_daemon.py submit "Find the number 1 post on Show HN"
+    python browser_daemon.py submit --file tasks.jsonl
+    python browser_daemon.py stats
+    python browser_daemon.py shutdown
+"""
+import argparse
+import asyncio
+import json
+import time
+import traceback
+from pathlib import Path
+
+from batch_runner import BatchRunner, add_runner_args, load_tasks
+from browser_pool import BrowserPool
+from screenshot_encoding import ScreenshotEncoder, ScreenshotPolicy
+
+DEFAULT_SOCKET = "/tmp/browser_use_daemon.sock"
+
+
+async def _open_connection(args):
+    if args.port:
+        return await asyncio.open_connection("127.0.0.1", args.port, limit=16 * 1024 * 1024)
+    return await asyncio.open_unix_connection(args.socket, limit=16 * 1024 * 1024)
+
+
+class BrowserDaemon:
+    """Serves run/stats/shutdown requests on top of a BatchRunner and its BrowserPool"""
+
+    def __init__(self, args, pool: BrowserPool, screenshot_encoder: ScreenshotEncoder):
+        self.args = args
+        self.pool = pool
+        self.runner = BatchRunner(args, pool, screenshot_encoder, name="daemon")
+        self.started = time.monotonic()
+        self._shutdown = asyncio.Event()
+
+        # Counters
+        self.tasks_received = 0
+        self.tasks_running = 0
+        self.tasks_failed = 0
+
+    async def _run(self, request: dict) -> dict:
+        self.tasks_received += 1
+        spec = {key: value for key, value in request.items() if key != "cmd"}
+        spec.setdefault("id", f"task{self.tasks_received:03d}")
+        self.tasks_running += 1
+        try:
+            result = await self.runner.run_task(spec)
+        finally:
+            self.tasks_running -= 1
+        self.tasks_failed += not result["success"]
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "uptime_s": round(time.monotonic() - self.started, 1),
+            "tasks_received": self.tasks_received,
+            "tasks_running": self.tasks_running,
+            "tasks_failed": self.tasks_failed,
+            "results": str(self.runner.results_path),
+            "pool": self.pool.stats(),
+        }
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while not reader.at_eof():
+                line = await reader.readline()
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    cmd = request.get("cmd", "run")
+                    if cmd == "run":
+                        if "task" not in request:
+                            raise ValueError("missing 'task'")
+                        response = await self._run(request)
+                    elif cmd == "stats":
+                        response = self.stats()
+                    elif cmd == "shutdown":
+                        self._shutdown.set()
+                        response = {"ok": True}
+                    else:
+                        raise ValueError(f"unknown cmd {cmd!r}")
+                except Exception as e:
+                    response = {"error": str(e)}
+                writer.write((json.dumps(response, ensure_ascii=False, default=str) + "\n").encode("utf-8"))
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def _watch_idle_memory(self):
+        while not self._shutdown.is_set():
+            try:
+                await asyncio.wait_for(self._shutdown.wait(), timeout=self.args.idle_check_interval)
+            except asyncio.TimeoutError:
+                try:
+                    await self.pool.check_idle()
+                except Exception as e:
+                    print(f"⚠️ Idle browser check failed: {e}")
+
+    async def serve(self):
+        if self.args.port:
+            server = await asyncio.start_server(self.handle_client, "127.0.0.1", self.args.port, limit=16 * 1024 * 1024)
+            where = f"127.0.0.1:{self.args.port}"
+        else:
+            Path(self.args.socket).unlink(missing_ok=True)
+            server = await asyncio.start_unix_server(self.handle_client, self.args.socket, limit=16 * 1024 * 1024)
+            where = self.args.socket
+        print(f"🌐 Browser daemon listening on {where} with {self.pool.size} warm browsers")
+
+        watcher = asyncio.create_task(self._watch_idle_memory())
+        async with server:
+            await self._shutdown.wait()
+        await watcher
+        if not self.args.port:
+            Path(self.args.socket).unlink(missing_ok=True)
+
+
+async def serve(args):
+    # Fork the encoder's workers before any browser or writer thread exists
+    screenshot_encoder = ScreenshotEncoder(ScreenshotPolicy(max_dimension=1280, format="webp", quality=80))
+    pool = BrowserPool(
+        size=args.pool_size or args.parallel,
+        profile_kwargs={"headless": args.headless},
+        max_tasks_per_browser=args.recycle_after,
+        max_memory_mb=args.max_memory_mb,
+    )
+    daemon = None
+    try:
+        await pool.start()
+        daemon = BrowserDaemon(args, pool, screenshot_encoder)
+        await daemon.serve()
+        print(f"Daemon stats: {daemon.stats()}")
+    finally:
+        if daemon is not None:
+            daemon.runner.close()
+        await pool.close()
+        screenshot_encoder.close()
+
+
+async def request(args, payload: dict) -> dict:
+    try:
+        reader, writer = await _open_connection(args)
+    except (ConnectionRefusedError, FileNotFoundError):
+        raise ConnectionError(f"no daemon running at {args.port or args.socket}") from None
+    try:
+        writer.write((json.dumps(payload) + "\n").encode("utf-8"))
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+
+
+async def submit(args):
+    if args.file:
+        specs = load_tasks(args.file)
+    elif args.task:
+        specs = [{"task": args.task}]
+    else:
+        raise SystemExit("submit needs a task or --file")
+    for spec in specs:
+        if args.max_steps is not None:
+            spec.setdefault("max_steps", args.max_steps)
+
+    # One connection per task so the daemon can run them concurrently
+    results = await asyncio.gather(*(request(args, {"cmd": "run", **spec}) for spec in specs))
+    for result in results:
+        print(json.dumps(result, ensure_ascii=False, default=str))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Warm browser daemon for agent tasks")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path")
+    parser.add_argument("--port", type=int, help="Listen on / connect to 127.0.0.1:PORT instead of the socket")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Start the daemon")
+    add_runner_args(serve_parser)
+    serve_parser.add_argument("--recycle-after", type=int, default=20, help="Relaunch a browser after N tasks (0 = never)")
+    serve_parser.add_argument("--max-memory-mb", type=float, default=2048, help="Relaunch a browser above this RSS (0 = never)")
+    serve_parser.add_argument("--idle-check-interval", type=float, default=60.0, help="Seconds between idle memory checks")
+
+    submit_parser = commands.add_parser("submit", help="Run a task on the daemon and print its result")
+    submit_parser.add_argument("task", nargs="?")
+    submit_parser.add_argument("--file", type=Path, help="JSONL tasks file, as for batch_runner.py")
+    submit_parser.add_argument("--max-steps", type=int)
+
+    commands.add_parser("stats", help="Print daemon counters")
+    commands.add_parser("shutdown", help="Stop the daemon")
+    return parser.parse_args(argv)
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    try:
+        if args.command == "serve":
+            await serve(args)
+        elif args.command == "submit":
+            await submit(args)
+        else:
+            print(json.dumps(await request(args, {"cmd": args.command}), indent=2))
+    except ConnectionError as e:
+        print(f"❌ {e}")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,328 @@
+"""
+Pool of warm browsers shared by concurrent agents.
+
+Launching Chromium dominates the wall time of short tasks, so BrowserPool
+starts `size` keep_alive browsers up front and leases them to agents. When
+a lease ends the browser is reset (extra tabs closed, cookies and storage
+cleared, back to about:blank) instead of being relaunched. A browser whose
+reset fails is killed and replaced.
+
+Storage (localStorage, IndexedDB, service workers, caches) can only be
+cleared per origin, so the reset covers every origin in the open tabs'
+back/forward history plus whatever was reported with note_visited() during
+the lease: the agent's history URLs and pages read in tabs that are
+already closed.
+
+Long-lived pools (browser_daemon.py) also recycle browsers: after
+max_tasks_per_browser leases, or when the Chromium process tree uses more
+than max_memory_mb of resident memory, the browser is killed and relaunched
+on release instead of being reset.
+
+A relaunch that fails is retried with exponential backoff (launch_retries,
+launch_backoff_s). If it still fails the slot is given up and the pool runs
+with one browser fewer; once no browsers are left, acquire() raises
+RuntimeError instead of waiting forever.
+
+Usage:
+    pool = BrowserPool(size=4)
+    await pool.start()
+    async with pool.acquire() as browser:
+        agent = Agent(task=task, llm=llm, browser=browser)
+        try:
+            await agent.run()
+        finally:
+            note_visited(browser, agent.history.urls())
+    await pool.close()
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from browser_use import Browser, BrowserProfile
+from browser_use.browser.events import CloseTabEvent, NavigateToUrlEvent
+
+
+# id(browser) -> origins visited since the last reset
+_visited_origins: dict[int, set] = {}
+
+
+def _origin(url: str | None) -> str | None:
+    if not url or not url.startswith(("http://", "https://")):
+        return None
+    return "/".join(url.split("/", 3)[:3])
+
+
+def note_visited(browser: Browser, urls):
+    """Record URLs a lease went through so reset_browser also clears their origins' storage"""
+    origins = _visited_origins.setdefault(id(browser), set())
+    origins.update(origin for origin in map(_origin, urls) if origin)
+
+
+async def _tab_history_origins(browser: Browser, tab) -> set:
+    try:
+        cdp_session = await browser.get_or_create_cdp_session(tab.target_id, focus=False)
+        history = await cdp_session.cdp_client.send.Page.getNavigationHistory(session_id=cdp_session.session_id)
+    except Exception:
+        return set()
+    return {origin for origin in (_origin(entry.get("url")) for entry in history.get("entries", [])) if origin}
+
+
+async def reset_browser(browser: Browser):
+    """Bring a browser back to a single about:blank tab with no cookies or site storage"""
+    origins = _visited_origins.pop(id(browser), set())
+    tabs = await browser.get_tabs()
+    for tab in tabs:
+        origins.add(_origin(tab.url))
+        origins |= await _tab_history_origins(browser, tab)
+    origins.discard(None)
+
+    # Clear site data while the origins are still known
+    cdp_session = await browser.get_or_create_cdp_session()
+    send = cdp_session.cdp_client.send
+    await send.Network.clearBrowserCookies(session_id=cdp_session.session_id)
+    await send.Network.clearBrowserCache(session_id=cdp_session.session_id)
+    for origin in origins:
+        await send.Storage.clearDataForOrigin(
+            params={"origin": origin, "storageTypes": "all"}, session_id=cdp_session.session_id
+        )
+
+    # Keep the first tab, close the rest
+    for tab in tabs[1:]:
+        event = browser.event_bus.dispatch(CloseTabEvent(target_id=tab.target_id))
+        await event
+    event = browser.event_bus.dispatch(NavigateToUrlEvent(url="about:blank"))
+    await event
+
+
+def _rss_bytes(pid: int) -> int:
+    if psutil is not None:
+        return psutil.Process(pid).memory_info().rss
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+async def browser_memory_mb(browser: Browser) -> float | None:
+    """Resident memory of the browser's processes (browser, renderers, GPU), or None if it can't be read"""
+    try:
+        cdp_session = await browser.get_or_create_cdp_session()
+        info = await cdp_session.cdp_client.send.SystemInfo.getProcessInfo()
+        total = 0
+        for process in info.get("processInfo", []):
+            try:
+                total += _rss_bytes(process["id"])
+            except (OSError, ValueError):
+                pass  # Process exited between the two calls
+        return total / (1024 * 1024) if total else None
+    except Exception:
+        return None
+
+
+class BrowserPool:
+    """Fixed-size pool of keep_alive browsers"""
+
+    def __init__(
+        self,
+        size: int = 2,
+        profile_kwargs: dict | None = None,
+        browser_factory=None,
+        max_tasks_per_browser: int | None = None,
+        max_memory_mb: float | None = None,
+        launch_retries: int = 2,
+        launch_backoff_s: float = 1.0,
+    ):
+        """
+        Args:
+            size: Number of browsers kept running
+            profile_kwargs: BrowserProfile arguments (keep_alive is always set)
+            browser_factory: Callable returning an unstarted Browser, overrides profile_kwargs
+            max_tasks_per_browser: Relaunch a browser after this many leases (None = never)
+            max_memory_mb: Relaunch a browser whose processes exceed this resident memory (None = never)
+            launch_retries: Extra attempts when relaunching a browser fails
+            launch_backoff_s: Delay before the first retry, doubled for each further one
+        """
+        self.size = size
+        self.max_tasks_per_browser = max_tasks_per_browser
+        self.max_memory_mb = max_memory_mb
+        self.launch_retries = launch_retries
+        self.launch_backoff_s = launch_backoff_s
+        self.profile_kwargs = {"keep_alive": True, **(profile_kwargs or {})}
+        # browser_factory() -> unstarted Browser; lets callers supply e.g. CDP-connected browsers
+        self.browser_factory = browser_factory or (lambda: Browser(browser_profile=BrowserProfile(**self.profile_kwargs)))
+
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._all: set = set()
+        self._uses: dict = {}
+        self._slots = size  # Browsers the pool still has, leased or idle; lowered when a relaunch fails for good
+        self._closed = False
+
+        # Counters
+        self.launches = 0
+        self.leases = 0
+        self.resets = 0
+        self.reset_failures = 0
+        self.launch_failures = 0
+        self.lost_browsers = 0
+        self.recycled_tasks = 0
+        self.recycled_memory = 0
+        self.last_memory_mb = {}
+        self.launch_seconds_total = 0.0
+        self.acquire_wait_seconds_total = 0.0
+
+    async def _launch(self) -> Browser:
+        start = time.monotonic()
+        browser = self.browser_factory()
+        try:
+            await browser.start()
+        except Exception:
+            self.launch_failures += 1
+            try:
+                await browser.kill()
+            except Exception:
+                pass
+            raise
+        self.launch_seconds_total += time.monotonic() - start
+        self.launches += 1
+        self._all.add(browser)
+        self._uses[browser] = 0
+        return browser
+
+    async def _discard(self, browser: Browser):
+        _visited_origins.pop(id(browser), None)
+        self._all.discard(browser)
+        self._uses.pop(browser, None)
+        self.last_memory_mb.pop(id(browser), None)
+        try:
+            await browser.kill()
+        except Exception:
+            pass
+
+    async def _relaunch(self) -> Browser | None:
+        """Launch a replacement, retrying with backoff; None once the slot is given up"""
+        for attempt in range(self.launch_retries + 1):
+            if attempt:
+                await asyncio.sleep(self.launch_backoff_s * 2 ** (attempt - 1))
+            try:
+                return await self._launch()
+            except Exception:
+                if self._closed:
+                    break
+        self._lose_slot()
+        return None
+
+    def _lose_slot(self):
+        self._slots -= 1
+        self.lost_browsers += 1
+        if self._slots <= 0:
+            # Wake every waiter in acquire() so it can raise instead of waiting forever
+            self._idle.put_nowait(None)
+
+    async def start(self):
+        """Launch every browser in parallel so the first tasks start warm"""
+        browsers = await asyncio.gather(*(self._launch() for _ in range(self.size)), return_exceptions=True)
+        errors = [browser for browser in browsers if isinstance(browser, BaseException)]
+        if len(errors) == self.size:
+            raise errors[0]
+        self._slots = self.size - len(errors)
+        self.lost_browsers += len(errors)
+        for browser in browsers:
+            if not isinstance(browser, BaseException):
+                self._idle.put_nowait(browser)
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Lease a browser; it is reset and returned to the pool when the block exits"""
+        start = time.monotonic()
+        if self._slots <= 0 and self._idle.empty():
+            raise RuntimeError("No browsers left in the pool: every relaunch failed")
+        browser = await self._idle.get()
+        if browser is None:
+            self._idle.put_nowait(None)  # Pass the wake-up on to the next waiter
+            raise RuntimeError("No browsers left in the pool: every relaunch failed")
+        self.acquire_wait_seconds_total += time.monotonic() - start
+        self.leases += 1
+        self._uses[browser] = self._uses.get(browser, 0) + 1
+        try:
+            yield browser
+        finally:
+            await self._release(browser)
+
+    async def _recycle_reason(self, browser: Browser) -> str | None:
+        if self.max_tasks_per_browser and self._uses.get(browser, 0) >= self.max_tasks_per_browser:
+            return "tasks"
+        if self.max_memory_mb:
+            memory_mb = await browser_memory_mb(browser)
+            if memory_mb is not None:
+                self.last_memory_mb[id(browser)] = round(memory_mb, 1)
+                if memory_mb > self.max_memory_mb:
+                    return "memory"
+        return None
+
+    async def _replace(self, browser: Browser, reason: str) -> Browser | None:
+        if reason == "tasks":
+            self.recycled_tasks += 1
+        elif reason == "memory":
+            self.recycled_memory += 1
+        else:
+            self.reset_failures += 1
+        await self._discard(browser)
+        return await self._relaunch()
+
+    async def _release(self, browser: Browser):
+        if self._closed:
+            await self._discard(browser)
+            return
+        reason = await self._recycle_reason(browser)
+        if reason is None:
+            try:
+                await reset_browser(browser)
+                self.resets += 1
+            except Exception:
+                reason = "reset_failed"
+        if reason is not None:
+            browser = await self._replace(browser, reason)
+        if browser is not None:
+            self._idle.put_nowait(browser)
+
+    async def check_idle(self):
+        """Recycle idle browsers that have grown past max_memory_mb while waiting for work"""
+        if not self.max_memory_mb or self._closed:
+            return
+        for _ in range(self._idle.qsize()):
+            browser = self._idle.get_nowait()
+            if browser is None:
+                self._idle.put_nowait(browser)
+                continue
+            if await self._recycle_reason(browser) == "memory":
+                browser = await self._replace(browser, "memory")
+            if browser is not None:
+                self._idle.put_nowait(browser)
+
+    async def close(self):
+        self._closed = True
+        await asyncio.gather(*(self._discard(browser) for browser in list(self._all)))
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "launches": self.launches,
+            "leases": self.leases,
+            "resets": self.resets,
+            "reset_failures": self.reset_failures,
+            "launch_failures": self.launch_failures,
+            "lost_browsers": self.lost_browsers,
+            "recycled_tasks": self.recycled_tasks,
+            "recycled_memory": self.recycled_memory,
+            "browsers": self._slots,
+            "idle": self._idle.qsize() if self._slots > 0 else 0,
+            "memory_mb": list(self.last_memory_mb.values()),
+            "launch_s_total": round(self.launch_seconds_total, 3),
+            "acquire_wait_s_total": round(self.acquire_wait_seconds_total, 3),
+        }
@@ -0,0 +1,413 @@
+"""
+Token-budgeted compaction of the DOM listing sent to the LLM.
+
+dom_state.llm_representation() lists every indexed element on every step
+(about 10 KB for a Hacker News page), and prefill time grows with it.
+DomCompactor rewrites the element listing inside <browser_state> to fit a
+per-step token budget:
+
+  1. text lines longer than max_text_chars are truncated
+  2. repetitive sibling lists (the same run of tags repeated, like HN story
+     rows) keep their first keep_items items plus any item matching the
+     task; the rest become one "... N similar items omitted" line
+  3. if still over budget, elements are ranked by task keyword relevance,
+     interactivity and position on the page (earlier = closer to the
+     viewport top) and the lowest-ranked ones are dropped; each run of
+     dropped elements becomes one "... N elements omitted ..." line, and
+     those lines count against the budget (a run shorter than its summary
+     is kept as is)
+
+Element lines are kept verbatim, so "[N]" indices stay valid and actions on
+any element that is still shown resolve as before. Ancestors of kept
+elements are kept so the indentation still describes the tree. Tokens are
+estimated as chars / 4.
+
+DomCompaction is the chat model wrapper that applies a DomCompactor to every
+request; the scripts copy compactor.last_result into each step's
+actions.jsonl record:
+
+    {"step": 3, ..., "dom_compaction": {"tokens_before": 2748, "tokens_after": 1496, "collapsed_items": 22, ...}}
+
+Usage:
+    dom_compactor = DomCompactor(budget_tokens=1500)
+    llm = DomCompaction(ChatOpenAI(...), dom_compactor)
+"""
+import re
+from dataclasses import dataclass, field
+
+_BROWSER_STATE = re.compile(r"(<browser_state>)(.*?)(</browser_state>)", re.DOTALL)
+_USER_REQUEST = re.compile(r"<user_request>(.*?)</user_request>", re.DOTALL)
+_ELEMENT = re.compile(r"^\*?\[(\d+)\]<([\w-]+)([^>]*)>")
+_WORD = re.compile(r"[a-z0-9]{3,}")
+
+_STOPWORDS = {
+    "the", "and", "for", "with", "from", "that", "this", "find", "then", "into", "your", "what", "which",
+    "page", "click", "open", "go", "get", "number", "post", "www", "http", "https", "com",
+}
+_INPUT_TAGS = {"input", "textarea", "select", "button", "option"}
+_INTERACTIVE_ROLES = re.compile(r"role=(button|link|checkbox|radio|tab|menuitem|option|combobox|textbox|switch)")
+
+
+def _omitted(count: int, noun: str, detail: str = "") -> str:
+    return f"... {count} {noun}{'s' if count != 1 else ''} omitted{detail} ..."
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def task_keywords(task: str) -> set[str]:
+    return {word for word in _WORD.findall(task.lower()) if word not in _STOPWORDS}
+
+
+@dataclass
+class _Unit:
+    """An element line plus the text lines directly under it (or a standalone text line)"""
+    start: int
+    lines: list
+    depth: int
+    tag: str | None
+    attrs: str = ""
+    parent: int | None = None  # Index of the parent unit
+    score: float = 0.0
+    children: list = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(self.lines)
+
+    def signature(self) -> tuple:
+        return (self.depth, self.tag)
+
+
+def _depth(line: str) -> int:
+    return len(line) - len(line.lstrip("\t"))
+
+
+def parse_units(lines: list[str]) -> list[_Unit]:
+    units = []
+    stack = []  # (depth, unit index) of open element units
+    for i, line in enumerate(lines):
+        depth = _depth(line)
+        match = _ELEMENT.match(line.lstrip("\t"))
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        if match is None and units and units[-1].tag is not None and stack and stack[-1][1] == len(units) - 1:
+            # Text directly under the element that was just opened
+            units[-1].lines.append(line)
+            continue
+        parent = stack[-1][1] if stack else None
+        unit = _Unit(i, [line], depth, match.group(2).lower() if match else None, match.group(3) if match else "", parent)
+        units.append(unit)
+        if parent is not None:
+            units[parent].children.append(len(units) - 1)
+        if match is not None:
+            stack.append((depth, len(units) - 1))
+    return units
+
+
+def _subtree_end(units: list[_Unit], index: int) -> int:
+    """Index one past the last unit in the subtree rooted at units[index]"""
+    end = index + 1
+    while end < len(units) and units[end].depth > units[index].depth:
+        end += 1
+    return end
+
+
+@dataclass
+class CompactionResult:
+    text: str
+    tokens_before: int
+    tokens_after: int
+    truncated_lines: int = 0
+    collapsed_items: int = 0
+    dropped_elements: int = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "truncated_lines": self.truncated_lines,
+            "collapsed_items": self.collapsed_items,
+            "dropped_elements": self.dropped_elements,
+        }
+
+
+class DomCompactor:
+    """Fits the DOM listing of a state message into budget_tokens"""
+
+    def __init__(
+        self,
+        budget_tokens: int = 1500,
+        max_text_chars: int = 160,
+        keep_items: int = 5,
+        min_repeats: int = 4,
+        max_period: int = 16,
+    ):
+        """
+        Args:
+            budget_tokens: Target size of the element listing
+            max_text_chars: Longer text lines are cut to this length
+            keep_items: Items kept from each repetitive list (besides task matches)
+            min_repeats: Repetitions needed before a run of siblings counts as a list
+            max_period: Longest run of sibling units treated as one list item
+        """
+        self.budget_tokens = budget_tokens
+        self.max_text_chars = max_text_chars
+        self.keep_items = keep_items
+        self.min_repeats = min_repeats
+        self.max_period = max_period
+        self.last_result = None
+
+        # Counters
+        self.steps = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    # ===== STAGE 1: TRUNCATE =====
+    def _truncate(self, lines: list[str]) -> tuple[list[str], int]:
+        out = []
+        truncated = 0
+        for line in lines:
+            stripped = line.lstrip("\t")
+            if len(stripped) > self.max_text_chars and not _ELEMENT.match(stripped):
+                line = line[:_depth(line) + self.max_text_chars] + "…"
+                truncated += 1
+            out.append(line)
+        return out, truncated
+
+    # ===== STAGE 2: COLLAPSE REPETITIVE SIBLINGS =====
+    def _collapse(self, lines: list[str], keywords: set[str]) -> tuple[list[str], int]:
+        units = parse_units(lines)
+        # Sibling groups: units sharing a parent, in order
+        groups = {}
+        for index, unit in enumerate(units):
+            groups.setdefault(unit.parent, []).append(index)
+
+        omit = {}  # first line of an omitted run -> (last line + 1, summary line)
+        collapsed = 0
+        for siblings in groups.values():
+            signatures = [units[i].signature() for i in siblings]
+            position = 0
+            while position < len(siblings):
+                period, repeats = self._find_period(signatures, position)
+                if period is None:
+                    position += 1
+                    continue
+                items = [siblings[position + k * period:position + (k + 1) * period] for k in range(repeats)]
+                run = []
+                for ordinal, item in enumerate(items):
+                    first_line = units[item[0]].start
+                    end_unit = _subtree_end(units, item[-1])
+                    end_line = units[end_unit].start if end_unit < len(units) else len(lines)
+                    text = "\n".join(lines[first_line:end_line]).lower()
+                    if ordinal < self.keep_items or any(keyword in text for keyword in keywords):
+                        collapsed += self._flush_run(run, omit, lines)
+                        run = []
+                    else:
+                        run.append((first_line, end_line, units[item[0]].depth))
+                collapsed += self._flush_run(run, omit, lines)
+                position += period * repeats
+        out = []
+        i = 0
+        while i < len(lines):
+            if i in omit:
+                end, summary = omit[i]
+                out.append(summary)
+                i = end
+            else:
+                out.append(lines[i])
+                i += 1
+        return out, collapsed
+
+    def _find_period(self, signatures: list, position: int) -> tuple[int | None, int]:
+        for period in range(1, self.max_period + 1):
+            pattern = signatures[position:position + period]
+            if len(pattern) < period:
+                break
+            repeats = 1
+            while signatures[position + repeats * period:position + (repeats + 1) * period] == pattern:
+                repeats += 1
+            if repeats >= self.min_repeats:
+                return period, repeats
+        return None, 0
+
+    @staticmethod
+    def _flush_run(run: list, omit: dict, lines: list[str]) -> int:
+        """Replace a run of omitted items with one summary line; returns the number of items omitted"""
+        if len(run) < 2:
+            # A summary line would save next to nothing
+            return 0
+        first_line, _, depth = run[0]
+        end_line = run[-1][1]
+        indices = [int(m.group(1)) for line in lines[first_line:end_line] if (m := _ELEMENT.match(line.lstrip("\t")))]
+        span = f" (indices {indices[0]}-{indices[-1]})" if indices else ""
+        omit[first_line] = (end_line, "\t" * depth + _omitted(len(run), "similar item", span))
+        return len(run)
+
+    # ===== STAGE 3: DROP LOW-RANKED ELEMENTS =====
+    def _score(self, unit: _Unit, position: float, keywords: set[str]) -> float:
+        text = unit.text.lower()
+        relevance = 0.0
+        if keywords:
+            hits = sum(1 for keyword in keywords if keyword in text)
+            relevance = min(1.0, hits / min(3, len(keywords)))
+        if unit.tag is None:
+            interactivity = 0.2
+        elif unit.tag in _INPUT_TAGS:
+            interactivity = 1.0
+        elif unit.tag == "a" or _INTERACTIVE_ROLES.search(unit.attrs):
+            interactivity = 0.8
+        else:
+            interactivity = 0.4
+        is_new = 0.1 if unit.lines[0].lstrip("\t").startswith("*") else 0.0
+        return 0.5 * relevance + 0.3 * interactivity + 0.2 * (1.0 - position) + is_new
+
+    def _drop(self, lines: list[str], keywords: set[str], budget_chars: int) -> tuple[list[str], int]:
+        units = parse_units(lines)
+        for index, unit in enumerate(units):
+            unit.score = self._score(unit, index / max(1, len(units) - 1), keywords)
+
+        kept = set()
+        used = 0
+        for index in sorted(range(len(units)), key=lambda i: -units[i].score):
+            # Keeping a unit means keeping its ancestors too
+            chain = []
+            current = index
+            while current is not None and current not in kept:
+                chain.append(current)
+                current = units[current].parent
+            cost = sum(len(units[i].text) + 1 for i in chain)
+            if used + cost > budget_chars:
+                continue
+            kept.update(chain)
+            used += cost
+
+        out, dropped = self._render(units, kept)
+        # The "... N elements omitted ..." lines count against the budget too: give up
+        # the lowest-ranked kept leaves until the rendered listing fits
+        while len("\n".join(out)) > budget_chars and kept:
+            leaves = [index for index in kept if not any(child in kept for child in units[index].children)]
+            kept.discard(min(leaves, key=lambda i: units[i].score))
+            out, dropped = self._render(units, kept)
+        return out, dropped
+
+    @staticmethod
+    def _render(units: list[_Unit], kept: set) -> tuple[list[str], int]:
+        """Kept units verbatim, each run of dropped units as one summary line; returns the lines and dropped elements"""
+        out = []
+        dropped = 0
+        run = []
+
+        def flush():
+            nonlocal dropped
+            if not run:
+                return
+            summary = "\t" * units[run[0]].depth + _omitted(len(run), "element")
+            run_lines = [line for index in run for line in units[index].lines]
+            if len("\n".join(run_lines)) <= len(summary):
+                # Shorter than its own summary: showing it costs nothing extra
+                out.extend(run_lines)
+            else:
+                out.append(summary)
+                dropped += sum(units[index].tag is not None for index in run)
+            run.clear()
+
+        for index, unit in enumerate(units):
+            if index in kept:
+                flush()
+                out.extend(unit.lines)
+            else:
+                run.append(index)
+        flush()
+        return out, dropped
+
+    # ===== ENTRY POINTS =====
+    def compact_listing(self, listing: str, task: str = "") -> CompactionResult:
+        """Compact an llm_representation()-style element listing"""
+        lines = listing.split("\n")
+        result = CompactionResult(listing, estimate_tokens(listing), estimate_tokens(listing))
+        keywords = task_keywords(task)
+
+        lines, result.truncated_lines = self._truncate(lines)
+        if estimate_tokens("\n".join(lines)) > self.budget_tokens:
+            lines, result.collapsed_items = self._collapse(lines, keywords)
+        if estimate_tokens("\n".join(lines)) > self.budget_tokens:
+            lines, result.dropped_elements = self._drop(lines, keywords, self.budget_tokens * 4)
+
+        result.text = "\n".join(lines)
+        result.tokens_after = estimate_tokens(result.text)
+        return result
+
+    def compact_browser_state(self, state: str, task: str = "") -> CompactionResult:
+        """Compact only the element listing inside a <browser_state> body, keeping the header and footer lines"""
+        lines = state.split("\n")
+        element_lines = [i for i, line in enumerate(lines) if _ELEMENT.match(line.lstrip("\t"))]
+        if not element_lines:
+            return CompactionResult(state, estimate_tokens(state), estimate_tokens(state))
+        start = element_lines[0]
+        end = len(lines)
+        # Footer: "[End of page]" / "... N pages below ..." lines after the last element
+        while end > element_lines[-1] + 1 and (lines[end - 1].startswith("[End of page") or "pages below" in lines[end - 1] or not lines[end - 1].strip()):
+            end -= 1
+        result = self.compact_listing("\n".join(lines[start:end]), task)
+        result.text = "\n".join(lines[:start] + [result.text] + lines[end:])
+        return result
+
+    def apply(self, messages: list) -> list:
+        """Return messages with the state message's element listing compacted"""
+        # The state message is the last user message; the system prompt has its own
+        # example <browser_state> block, which must be left alone
+        for index in reversed(range(len(messages))):
+            message = messages[index]
+            if getattr(message, "role", None) == "system":
+                continue
+            content = getattr(message, "content", None)
+            parts = [content] if isinstance(content, str) else list(content or [])
+            for part_index, part in enumerate(parts):
+                text = part if isinstance(part, str) else getattr(part, "text", None)
+                match = _BROWSER_STATE.search(text) if text else None
+                if match is None:
+                    continue
+                task = _USER_REQUEST.search(text)
+                result = self.compact_browser_state(match.group(2), task.group(1) if task else "")
+                self.steps += 1
+                self.tokens_before += result.tokens_before
+                self.tokens_after += result.tokens_after
+                self.last_result = result.as_dict()
+
+                new_text = text[:match.start(2)] + result.text + text[match.end(2):]
+                if isinstance(part, str):
+                    new_content = new_text
+                else:
+                    parts[part_index] = part.model_copy(update={"text": new_text})
+                    new_content = parts
+                shaped = list(messages)
+                shaped[index] = message.model_copy(update={"content": new_content})
+                return shaped
+        return messages
+
+    def stats(self) -> dict:
+        return {
+            "steps": self.steps,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "ratio": round(self.tokens_after / self.tokens_before, 4) if self.tokens_before else None,
+        }
+
+
+class DomCompaction:
+    """Chat model wrapper that applies a DomCompactor to every request"""
+
+    def __init__(self, llm, compactor: DomCompactor | None = None):
+        self.llm = llm
+        self.compactor = compactor or DomCompactor()
+
+    def __getattr__(self, name):
+        # model, provider, name, stats(), ... come from the wrapped model
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    async def ainvoke(self, messages, output_format=None):
+        return await self.llm.ainvoke(self.compactor.apply(messages), output_format)
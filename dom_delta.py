@@ -0,0 +1,241 @@
+"""
+Delta-encoded DOM snapshots.
+
+Consecutive llm_representation() dumps are mostly identical (paging and
+scrolling through the same listing), so instead of a full
+step_NNN_llm_dom.txt per step, dom_snapshots.jsonl holds a full keyframe
+every `keyframe_interval` steps and line-level deltas in between. A delta
+that would be larger than the text itself is written as an extra keyframe
+(which does not restart the interval).
+
+Two things keep deltas small on real sessions:
+  - The "*" new-element marker in front of "[N]<tag />" flips on almost
+    every line between steps, so lines are diffed without it and the marked
+    line numbers are stored separately as ranges.
+  - Agents bounce between pages (listing -> article -> listing), so the base
+    is the previous step or the closest earlier step since the last interval
+    keyframe (the one sharing the most lines, same URL breaking ties),
+    whichever gives the smaller delta. Bases never reach behind an interval
+    keyframe, so rebuilding a step replays fewer than keyframe_interval
+    deltas.
+
+Record formats:
+    {"step": 3, "type": "key", "text": "..."}
+    {"step": 4, "type": "delta", "base": 3, "ops": [[i1, i2, ["new", "lines"]], ...], "marks": [[0, 12], ...]}
+
+Each op replaces base lines [i1:i2] (marker-stripped) with the given lines
+(an empty list deletes, i1 == i2 inserts); ops are in ascending order of i1.
+"marks" lists [start, end) line ranges of the new text that carry the "*"
+marker.
+
+Usage:
+    encoder = DomDeltaEncoder(keyframe_interval=10)
+    record = encoder.encode(step, dom_text, url)
+    session_log.write_jsonl(DOM_SNAPSHOTS, record)
+
+    snapshots = DomSnapshots.from_session("agent_logs/20251024_150203")
+    snapshots.reconstruct(5)
+    snapshots.changed_lines(5)  # what changed relative to the step's base
+"""
+import difflib
+import json
+import re
+from pathlib import Path
+
+from session_archive import ARCHIVE_NAME, SessionArchive
+
+DOM_SNAPSHOTS = "dom_snapshots.jsonl"
+
+_MARKER = re.compile(r"^(\t*)\*(?=\[)")
+
+
+def _split(text: str) -> list[str]:
+    return text.split("\n")
+
+
+def _join(lines: list[str]) -> str:
+    return "\n".join(lines)
+
+
+def strip_markers(lines: list[str]) -> tuple[list[str], list[list[int]]]:
+    """Remove the "*" new-element markers; return plain lines and [start, end) ranges of marked lines"""
+    plain = []
+    marks = []
+    for i, line in enumerate(lines):
+        stripped = _MARKER.sub(r"\1", line, count=1)
+        plain.append(stripped)
+        if stripped != line:
+            if marks and marks[-1][1] == i:
+                marks[-1][1] = i + 1
+            else:
+                marks.append([i, i + 1])
+    return plain, marks
+
+
+def restore_markers(plain: list[str], marks: list[list[int]]) -> list[str]:
+    lines = list(plain)
+    for start, end in marks:
+        for i in range(start, end):
+            indent = len(lines[i]) - len(lines[i].lstrip("\t"))
+            lines[i] = lines[i][:indent] + "*" + lines[i][indent:]
+    return lines
+
+
+def diff_ops(old_lines: list[str], new_lines: list[str]) -> list:
+    """Line-level edit script turning old_lines into new_lines"""
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    return [
+        [i1, i2, new_lines[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_ops(base_lines: list[str], ops: list) -> list[str]:
+    out = []
+    position = 0
+    for i1, i2, lines in ops:
+        out.extend(base_lines[position:i1])
+        out.extend(lines)
+        position = i2
+    out.extend(base_lines[position:])
+    return out
+
+
+def _delta_size(record: dict) -> int:
+    return len(json.dumps(record["ops"], ensure_ascii=False)) + len(json.dumps(record["marks"]))
+
+
+class DomDeltaEncoder:
+    """Turns a stream of per-step DOM texts into keyframe/delta records"""
+
+    def __init__(self, keyframe_interval: int = 10, url_window: int = 8):
+        self.keyframe_interval = keyframe_interval
+        self.url_window = url_window
+        self._recent = []  # (step, url, plain lines, set of lines) of steps since the last interval keyframe, newest last
+        self._since_keyframe = 0
+
+        # Counters
+        self.keyframes = 0
+        self.deltas = 0
+        self.chars_in = 0
+        self.chars_out = 0
+
+    def _candidate_bases(self, url: str | None, lines: set):
+        """The previous step, and the earlier step sharing the most lines with this one"""
+        yield self._recent[-1]
+        if len(self._recent) > 1:
+            # Line overlap is cheap next to a SequenceMatcher diff, so only the closest one is diffed
+            yield max(self._recent[:-1], key=lambda entry: (len(lines & entry[3]), url is not None and entry[1] == url))
+
+    def encode(self, step: int, text: str, url: str | None = None) -> dict:
+        plain, marks = strip_markers(_split(text))
+        record = None
+
+        if self._recent and self._since_keyframe < self.keyframe_interval - 1:
+            for base_step, _, base_plain, _ in self._candidate_bases(url, set(plain)):
+                delta = {"step": step, "type": "delta", "base": base_step, "ops": diff_ops(base_plain, plain), "marks": marks}
+                if _delta_size(delta) < len(text) and (record is None or _delta_size(delta) < _delta_size(record)):
+                    record = delta
+
+        if record is None:
+            record = {"step": step, "type": "key", "text": text}
+            self.keyframes += 1
+            if not self._recent or self._since_keyframe >= self.keyframe_interval - 1:
+                self._since_keyframe = 0
+                self._recent.clear()
+            else:
+                self._since_keyframe += 1
+        else:
+            self._since_keyframe += 1
+            self.deltas += 1
+
+        self._recent.append((step, url, plain, set(plain)))
+        del self._recent[:-self.url_window]
+        self.chars_in += len(text)
+        self.chars_out += len(record["text"]) if record["type"] == "key" else _delta_size(record)
+        return record
+
+    def stats(self) -> dict:
+        return {
+            "keyframes": self.keyframes,
+            "deltas": self.deltas,
+            "chars_in": self.chars_in,
+            "chars_out": self.chars_out,
+            "ratio": round(self.chars_out / self.chars_in, 4) if self.chars_in else None,
+        }
+
+
+class DomSnapshots:
+    """Rebuilds any step's DOM text from keyframe/delta records"""
+
+    def __init__(self, records: list[dict]):
+        self._records = {record["step"]: record for record in records}
+        self._cache_step = None
+        self._cache_lines = None
+
+    @classmethod
+    def from_session(cls, session_dir: Path) -> "DomSnapshots":
+        """Load from dom_snapshots.jsonl or from session.bsa"""
+        session_dir = Path(session_dir)
+        records = []
+        if (session_dir / ARCHIVE_NAME).exists():
+            with SessionArchive(session_dir / ARCHIVE_NAME) as archive:
+                for record, data in archive.iter_records("jsonl"):
+                    if record.name == DOM_SNAPSHOTS:
+                        records.append(json.loads(data))
+        else:
+            with open(session_dir / DOM_SNAPSHOTS, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        return cls(records)
+
+    def steps(self) -> list[int]:
+        return sorted(self._records)
+
+    def _lines(self, step: int) -> list[str]:
+        """Marker-stripped lines of a step"""
+        if step == self._cache_step:
+            return self._cache_lines
+
+        # Walk back to the nearest keyframe (or to the cached step), then replay deltas forward
+        chain = []
+        current = step
+        while True:
+            record = self._records[current]
+            if current == self._cache_step:
+                lines = self._cache_lines
+                break
+            if record["type"] == "key":
+                lines = strip_markers(_split(record["text"]))[0]
+                break
+            chain.append(record)
+            current = record["base"]
+
+        for record in reversed(chain):
+            lines = apply_ops(lines, record["ops"])
+
+        self._cache_step, self._cache_lines = step, lines
+        return lines
+
+    def _full_lines(self, step: int) -> list[str]:
+        record = self._records[step]
+        if record["type"] == "key":
+            return _split(record["text"])
+        return restore_markers(self._lines(step), record["marks"])
+
+    def reconstruct(self, step: int) -> str:
+        """Full DOM text of a step"""
+        return _join(self._full_lines(step))
+
+    def changed_lines(self, step: int) -> list[str]:
+        """Lines added or replaced at this step relative to its base, without markers (everything for a keyframe)"""
+        record = self._records[step]
+        if record["type"] == "key":
+            return _split(record["text"])
+        return [line for _, _, lines in record["ops"] for line in lines]
+
+    def diff(self, step_a: int, step_b: int) -> str:
+        """Unified diff between two steps' DOM texts"""
+        return "\n".join(difflib.unified_diff(
+            self._full_lines(step_a), self._full_lines(step_b), f"step_{step_a:03d}", f"step_{step_b:03d}", lineterm="",
+        ))
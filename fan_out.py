@@ -0,0 +1,253 @@
+"""
+Planner/executor mode: split a task into subtasks and run them as parallel agents.
+
+A task like basic.py's ("what medicine should I take, where can I buy it
+nearby, order it on instacart") runs fully serially in one Agent. Here a
+planning call first splits the task into subtasks with dependencies:
+
+    research   "Find which over-the-counter medicine treats a cough and sore throat"
+    stores     "Find pharmacies near the user that sell cough medicine"
+    order      "Order <medicine> on instacart"             depends_on: [research]
+
+Each subtask runs as its own Agent on its own browser from the BrowserPool
+(through BatchRunner, so it gets the usual session directory and logs) and
+starts as soon as the subtasks it depends on have finished. Their results are
+added to the dependent subtasks' prompts, and all results are merged into the
+parent record in plan order. A subtask whose dependency failed is skipped
+and recorded as failed ("dependency <id> failed"). A task the planner
+doesn't split runs as a single agent.
+
+The batch directory gets one fanout.jsonl record per parent task with the
+plan, each branch's start offset and duration, the maximum fan-out width and
+the wall-clock time against the serial sum of the branches. The token usage
+and cost of the planning call and every branch are summed into the parent's
+"usage".
+
+Usage:
+    python fan_out.py "I've been coughing for two days ... order it for me now" --parallel 3
+    python fan_out.py --tasks tasks.jsonl --max-branches 4 --provider openai --model gpt-4.1-mini
+"""
+import argparse
+import asyncio
+import time
+from pathlib import Path
+
+from browser_use.llm.messages import SystemMessage, UserMessage
+from pydantic import BaseModel, Field
+
+from batch_runner import add_runner_args, load_tasks, run_batch
+from token_usage import MeteredLLM, UsageMeter, merge_usage
+
+PLANNER_PROMPT = """You split browser automation tasks into independent subtasks that separate agents can run in parallel, each in its own browser.
+
+Rules:
+- Only split off work that can be done on its own: separate lookups, research on different sites, comparisons.
+- A subtask that needs another subtask's result (e.g. ordering the product found by research) lists it in depends_on.
+- Every subtask must be self-contained: include all details from the original task that it needs.
+- Do not split tasks that are a single sequence of steps on one site; return one subtask with the original task instead.
+- Use at most {max_branches} subtasks."""
+
+
+class Subtask(BaseModel):
+    id: str = Field(..., description="Short identifier, e.g. 'research'")
+    task: str = Field(..., description="Complete instructions for the agent running this subtask")
+    depends_on: list[str] = Field(default_factory=list, description="Ids of subtasks whose results this one needs")
+
+
+class TaskPlan(BaseModel):
+    subtasks: list[Subtask]
+
+
+def _validate_plan(plan: TaskPlan, max_branches: int) -> str | None:
+    """Why the plan can't be executed, or None"""
+    ids = [subtask.id for subtask in plan.subtasks]
+    if not ids:
+        return "no subtasks"
+    if len(ids) > max_branches:
+        return f"{len(ids)} subtasks (max {max_branches})"
+    if len(set(ids)) != len(ids):
+        return "duplicate subtask ids"
+    for subtask in plan.subtasks:
+        unknown = set(subtask.depends_on) - set(ids)
+        if unknown:
+            return f"{subtask.id} depends on unknown {sorted(unknown)}"
+
+    # Reject cycles (every subtask must be reachable by repeatedly taking ready ones)
+    done = set()
+    remaining = {subtask.id: set(subtask.depends_on) for subtask in plan.subtasks}
+    while remaining:
+        ready = [subtask_id for subtask_id, deps in remaining.items() if deps <= done]
+        if not ready:
+            return f"dependency cycle among {sorted(remaining)}"
+        for subtask_id in ready:
+            done.add(subtask_id)
+            del remaining[subtask_id]
+    return None
+
+
+async def plan_task(llm, task: str, max_branches: int = 4) -> tuple[TaskPlan | None, str | None]:
+    """Ask the model for a subtask plan; returns (plan, None) or (None, reason it isn't usable)"""
+    messages = [
+        SystemMessage(content=PLANNER_PROMPT.format(max_branches=max_branches)),
+        UserMessage(content=f"Task: {task}"),
+    ]
+    try:
+        response = await llm.ainvoke(messages, output_format=TaskPlan)
+    except Exception as e:
+        return None, f"planning failed: {type(e).__name__}: {e}"
+    plan = response.completion
+    reason = _validate_plan(plan, max_branches)
+    return (None, reason) if reason else (plan, None)
+
+
+def _subtask_prompt(parent_task: str, subtask: Subtask, results: dict[str, dict]) -> str:
+    prompt = (
+        f"{subtask.task}\n\n"
+        f"This is one part of a larger job handled by several agents: \"{parent_task}\". "
+        "Only do the part described above, then finish with done and report what you found or did."
+    )
+    if subtask.depends_on:
+        prompt += "\n\nResults from the parts this one builds on:"
+        for dependency in subtask.depends_on:
+            result = results[dependency]
+            prompt += f"\n- {dependency}: {result.get('final_result') or 'failed: ' + str(result.get('error', 'no result'))}"
+    return prompt
+
+
+def _max_width(intervals: list[tuple[float, float]]) -> int:
+    """Largest number of branches running at the same time"""
+    edges = sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals])
+    width = best = 0
+    for _, delta in edges:
+        width += delta
+        best = max(best, width)
+    return best
+
+
+async def run_fan_out(runner, spec: dict, max_branches: int = 4) -> dict:
+    """Plan spec["task"], run its subtasks concurrently on the runner and merge the results"""
+    start = time.monotonic()
+    planner_meter = UsageMeter(runner.prices)
+    plan, reason = await plan_task(MeteredLLM(runner.llm_for(spec), planner_meter), spec["task"], max_branches)
+    plan_s = time.monotonic() - start
+
+    if plan is None or len(plan.subtasks) == 1:
+        print(f"🧭 {spec['id']}: running as a single agent ({reason or 'planner did not split it'})")
+        result = await runner.run_task(spec)
+        record = {
+            "id": spec["id"],
+            "task": spec["task"],
+            "branches": 1,
+            "plan_s": round(plan_s, 3),
+            "reason": reason or "not split",
+            "usage": merge_usage([planner_meter.stats(), result.get("usage")]),
+        }
+        runner.write_jsonl("fanout.jsonl", record)
+        return {**result, "usage": record["usage"], "fan_out": record}
+
+    print(f"🧭 {spec['id']}: {len(plan.subtasks)} subtasks: "
+          + ", ".join(s.id + (f" (after {', '.join(s.depends_on)})" if s.depends_on else "") for s in plan.subtasks))
+
+    results: dict[str, dict] = {}
+    timings: dict[str, tuple[float, float]] = {}
+    branches: dict[str, asyncio.Task] = {}
+
+    async def run_branch(subtask: Subtask) -> dict:
+        if subtask.depends_on:
+            await asyncio.gather(*(branches[dependency] for dependency in subtask.depends_on), return_exceptions=True)
+            failed = next((d for d in subtask.depends_on if not results.get(d, {}).get("success")), None)
+            if failed is not None:
+                # Its prompt would be built on a missing result; don't spend an agent run on it
+                results[subtask.id] = {"success": False, "error": f"dependency {failed} failed", "skipped": True}
+                return results[subtask.id]
+        branch_spec = {
+            **{key: value for key, value in spec.items() if key not in ("id", "task")},
+            "id": f"{spec['id']}-{subtask.id}",
+            "task": _subtask_prompt(spec["task"], subtask, results),
+        }
+        result = await runner.run_task(branch_spec)
+        # duration_s starts once the branch holds a runner slot, so queueing for --parallel isn't counted
+        end = time.monotonic() - start
+        timings[subtask.id] = (end - result.get("duration_s", 0.0), end)
+        results[subtask.id] = result
+        return result
+
+    # Created in plan order; a branch only awaits the tasks of its dependencies
+    for subtask in plan.subtasks:
+        branches[subtask.id] = asyncio.create_task(run_branch(subtask))
+    await asyncio.gather(*branches.values(), return_exceptions=True)
+    for subtask_id, branch in branches.items():
+        if branch.exception() is not None:
+            results[subtask_id] = {"success": False, "error": str(branch.exception())}
+
+    wall_s = time.monotonic() - start
+    serial_s = sum(end - branch_start for branch_start, end in timings.values())
+    record = {
+        "id": spec["id"],
+        "task": spec["task"],
+        "branches": len(plan.subtasks),
+        "max_width": _max_width(list(timings.values())),
+        "plan_s": round(plan_s, 3),
+        "wall_s": round(wall_s, 3),
+        "serial_s": round(serial_s, 3),
+        "speedup": round(serial_s / (wall_s - plan_s), 2) if wall_s > plan_s else None,
+        "usage": merge_usage([planner_meter.stats()] + [result.get("usage") for result in results.values()]),
+        "subtasks": [
+            {
+                "id": subtask.id,
+                "task": subtask.task,
+                "depends_on": subtask.depends_on,
+                "start_s": round(timings[subtask.id][0], 3) if subtask.id in timings else None,
+                "duration_s": round(timings[subtask.id][1] - timings[subtask.id][0], 3) if subtask.id in timings else None,
+                "success": results[subtask.id].get("success", False),
+                "error": results[subtask.id].get("error"),
+                "session_dir": results[subtask.id].get("session_dir"),
+                "result": results[subtask.id].get("final_result"),
+                "cost_usd": (results[subtask.id].get("usage") or {}).get("cost_usd"),
+            }
+            for subtask in plan.subtasks
+        ],
+    }
+    runner.write_jsonl("fanout.jsonl", record)
+
+    succeeded = all(result.get("success") for result in results.values())
+    status = "✅" if succeeded else "❌"
+    print(f"{status} {spec['id']}: {record['branches']} branches, width {record['max_width']}, "
+          f"{record['wall_s']}s wall vs {record['serial_s']}s serial")
+    return {
+        "id": spec["id"],
+        "task": spec["task"],
+        "success": succeeded,
+        "final_result": "\n".join(f"{subtask.id}: {results[subtask.id].get('final_result')}" for subtask in plan.subtasks),
+        "duration_s": record["wall_s"],
+        "usage": record["usage"],
+        "fan_out": record,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Split tasks into subtasks and run them as parallel agents")
+    parser.add_argument("task", nargs="?", help="Task to run (or use --tasks)")
+    parser.add_argument("--tasks", type=Path, help="JSONL file with one task per line")
+    parser.add_argument("--max-branches", type=int, default=4, help="Maximum number of subtasks per task")
+    add_runner_args(parser)
+    args = parser.parse_args(argv)
+    if not args.task and not args.tasks:
+        parser.error("give a task or --tasks")
+    return args
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    tasks = load_tasks(args.tasks) if args.tasks else [{"id": "task001", "task": args.task}]
+
+    async def fan_out_all(runner, tasks):
+        return await asyncio.gather(*(run_fan_out(runner, spec, args.max_branches) for spec in tasks))
+
+    results = await run_batch(args, tasks, run=fan_out_all, name="fanout")
+    for result in results:
+        print(f"\n{result['id']}:\n{result.get('final_result')}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,196 @@
+"""
+Full-document HTML capture for step logging.
+
+The selector map only holds interactive elements, so it never contains the
+document node. find_document_root() instead takes any node from the DOM
+state and follows parent_node links up to the #document node; that is
+cheap enough to do on the event loop. HtmlCapture then serializes the
+document on the log writer thread:
+
+  - streaming: the top `stream_depth` levels of the tree are written tag by
+    tag and only the subtrees below them go through HTMLSerializer, one at a
+    time, so peak memory is the largest such subtree rather than the page
+    (a page that is one huge subtree deep down is still built as one string)
+  - size cap: output stops at max_bytes with a truncation comment
+  - cache: each tree is fingerprinted (node names, attributes and text,
+    hashed while walking it, without building any HTML); if the DOM is
+    unchanged since the previous step, the previous file is referenced
+    instead of serializing again
+
+Usage:
+    root = find_document_root(browser_state.dom_state)        # event loop
+    result = html_capture.write(session_log, step_number, root)  # writer thread
+"""
+import hashlib
+from dataclasses import dataclass
+from html import escape
+
+from browser_use.dom.serializer.html_serializer import HTMLSerializer
+
+from session_logger import SessionLogger
+
+ELEMENT_NODE = 1
+DOCUMENT_NODE = 9
+DOCUMENT_TYPE_NODE = 10
+
+_VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr",
+}
+
+
+def _node_type(node) -> int | None:
+    node_type = getattr(node, "node_type", None)
+    return getattr(node_type, "value", node_type)
+
+
+def find_document_root(dom_state):
+    """Walk parent_node links from any known node up to the top-level #document node"""
+    start = None
+    root = getattr(dom_state, "_root", None)
+    if root is not None:
+        start = getattr(root, "original_node", None)
+    if start is None and getattr(dom_state, "selector_map", None):
+        start = next(iter(dom_state.selector_map.values()))
+    if start is None:
+        return None
+
+    node = start
+    document = node if _node_type(node) == DOCUMENT_NODE else None
+    seen = set()
+    while getattr(node, "parent_node", None) is not None and id(node) not in seen:
+        seen.add(id(node))
+        node = node.parent_node
+        if _node_type(node) == DOCUMENT_NODE:
+            # Keep walking: an iframe's document sits below the top-level one
+            document = node
+    return document
+
+
+_END_OF_CHILDREN = object()
+
+
+def dom_fingerprint(root) -> str:
+    """Hash of a DOM tree's structure, attributes and text; changes whenever its HTML would"""
+    digest = hashlib.blake2b(digest_size=16)
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node is _END_OF_CHILDREN:
+            digest.update(b"\x02")
+            continue
+        header = f"{_node_type(node)}|{getattr(node, 'node_name', '')}|{getattr(node, 'node_value', None) or ''}"
+        for name, value in sorted((getattr(node, "attributes", None) or {}).items()):
+            header += f"|{name}={value}"
+        digest.update(header.encode("utf-8", "replace") + b"\x01")
+        children = list(getattr(node, "children_nodes", None) or [])
+        children += list(getattr(node, "shadow_roots", None) or [])
+        if getattr(node, "content_document", None) is not None:
+            children.append(node.content_document)
+        stack.append(_END_OF_CHILDREN)
+        stack.extend(reversed(children))
+    return digest.hexdigest()
+
+
+@dataclass
+class HtmlCaptureResult:
+    path: str
+    bytes: int
+    truncated: bool = False
+    same_as_step: int | None = None
+
+
+class _CappedWriter:
+    def __init__(self, f, max_bytes: int):
+        self.f = f
+        self.max_bytes = max_bytes
+        self.written = 0
+        self.truncated = False
+
+    def write(self, text: str):
+        if self.truncated:
+            return
+        data = text.encode("utf-8")
+        if self.written + len(data) > self.max_bytes:
+            # Cut on a character boundary
+            data = data[:self.max_bytes - self.written].decode("utf-8", "ignore").encode("utf-8")
+            self.truncated = True
+        self.f.write(data)
+        self.written += len(data)
+
+
+class _Truncated(Exception):
+    pass
+
+
+class HtmlCapture:
+    """Serializes the document root of each step to step_NNN_full_page.html. Use from one thread."""
+
+    def __init__(self, max_bytes: int = 5 * 1024 * 1024, stream_depth: int = 4):
+        self.max_bytes = max_bytes
+        self.stream_depth = stream_depth
+        self.serializer = HTMLSerializer(extract_links=True)
+
+        self._last_fingerprint = None
+        self._last_result = None
+        self._last_step = None
+
+        # Counters
+        self.pages_serialized = 0
+        self.cache_hits = 0
+        self.truncated = 0
+
+    def write(self, session_log: SessionLogger, step: int, root) -> HtmlCaptureResult:
+        fingerprint = dom_fingerprint(root)
+        if fingerprint == self._last_fingerprint and self._last_result is not None:
+            self.cache_hits += 1
+            return HtmlCaptureResult(self._last_result.path, self._last_result.bytes, self._last_result.truncated, self._last_step)
+
+        path = f"step_{step:03d}_full_page.html"
+        with session_log.open_artifact(path) as f:
+            out = _CappedWriter(f, self.max_bytes)
+            try:
+                self._stream(root, out, 0)
+            except _Truncated:
+                pass
+            if out.truncated:
+                f.write(f"\n<!-- truncated at {self.max_bytes} bytes -->\n".encode("utf-8"))
+
+        self.pages_serialized += 1
+        self.truncated += out.truncated
+        result = HtmlCaptureResult(path, out.written, out.truncated)
+        self._last_fingerprint, self._last_result, self._last_step = fingerprint, result, step
+        return result
+
+    def _stream(self, node, out: _CappedWriter, depth: int):
+        if out.truncated:
+            raise _Truncated()
+        node_type = _node_type(node)
+        children = getattr(node, "children_nodes", None) or []
+
+        if node_type == DOCUMENT_NODE:
+            for child in children:
+                self._stream(child, out, depth + 1)
+        elif node_type == DOCUMENT_TYPE_NODE:
+            out.write("<!DOCTYPE html>\n")
+        elif (
+            node_type == ELEMENT_NODE and children and depth < self.stream_depth
+            # Shadow roots and iframe documents are left to HTMLSerializer
+            and not getattr(node, "shadow_roots", None) and not getattr(node, "content_document", None)
+        ):
+            tag = (getattr(node, "node_name", None) or "div").lower()
+            attributes = getattr(node, "attributes", None) or {}
+            attrs = "".join(f' {name}="{escape(str(value), quote=True)}"' for name, value in attributes.items())
+            out.write(f"<{tag}{attrs}>")
+            for child in children:
+                self._stream(child, out, depth + 1)
+            if tag not in _VOID_ELEMENTS:
+                out.write(f"</{tag}>")
+        else:
+            out.write(self.serializer.serialize(node))
+
+    def stats(self) -> dict:
+        return {
+            "pages_serialized": self.pages_serialized,
+            "cache_hits": self.cache_hits,
+            "truncated": self.truncated,
+        }
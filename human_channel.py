@@ -0,0 +1,521 @@
+"""
+Non-blocking human-in-the-loop channel for agents.
+
+The ask_human action used to call input() inside an async action, which
+froze the whole event loop (CDP keepalives, other agents) until somebody
+typed an answer. HumanChannel instead puts each question in a queue and
+awaits a future; frontends running on their own threads deliver the answers:
+
+  - TerminalFrontend: a stdin reader thread. With several questions pending,
+    answer with "<id>: <answer>" (e.g. "q2: blue")
+  - HttpFrontend: GET /questions lists pending questions,
+    POST /questions/<id> with {"answer": "..."} (or a plain text body) answers one
+  - FileDropFrontend: writes <dir>/<id>.question.json and picks up
+    <dir>/<id>.answer.txt
+
+Every question has a timeout; when it expires the action gets the default
+answer (or an error if there is none). Any number of agents can wait at
+once. The time spent waiting is recorded in human.jsonl and, with a
+StepTracer, as a separate "human_wait" span so it doesn't count as action
+time in timings.jsonl.
+
+The question is asked from inside an agent step, and browser_use cancels a
+step that runs too long. Releases up to 0.7.x honour Agent(step_timeout=...)
+(120s by default): pass step_timeout=agent_step_timeout(channel.default_timeout)
+so the question times out first. 0.9.x ignores the argument and cancels
+every step after a hard-coded 180s, so there register_ask_human clamps each
+question's timeout to question_timeout_limit() (120s) instead. A question
+whose step is cancelled anyway is logged as "abandoned".
+
+Usage:
+    channel = HumanChannel(default_timeout=300, frontends=[TerminalFrontend(), HttpFrontend(port=8765)])
+    tools = Tools()
+    register_ask_human(tools, channel, session_log=log_writer, tracer=tracer)
+    agent = Agent(task=task, llm=llm, tools=tools, step_timeout=agent_step_timeout(channel.default_timeout))
+    ...
+    channel.close()
+
+    curl localhost:8765/questions
+    curl -d '{"answer": "42 Main St"}' localhost:8765/questions/q1
+"""
+import asyncio
+import functools
+import inspect
+import itertools
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from browser_use.agent.views import ActionResult
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+_ADDRESSED = re.compile(r"^(q\d+)\s*[:>]\s?(.*)$", re.DOTALL)
+
+# Agent step_timeout default in the releases that honour it (0.7.x)
+DEFAULT_STEP_TIMEOUT = 120
+# Step timeout browser_use 0.9.x hard-codes in Agent.run, whatever step_timeout says
+HARD_CODED_STEP_TIMEOUT = 180
+# Agent step_timeout when questions wait forever
+NO_STEP_TIMEOUT = 7 * 24 * 3600
+
+
+@functools.lru_cache(maxsize=None)
+def step_timeout_configurable() -> bool:
+    """True if the installed browser_use passes Agent(step_timeout=...) to its per-step wait_for"""
+    from browser_use import Agent
+
+    try:
+        return "settings.step_timeout" in inspect.getsource(Agent.run)
+    except (OSError, TypeError):
+        return False
+
+
+def agent_step_timeout(question_timeout: float | None, margin: float = 60.0) -> int:
+    """Agent step_timeout long enough for a step to wait out a question plus the rest of the step"""
+    if question_timeout is None:
+        return NO_STEP_TIMEOUT
+    return max(DEFAULT_STEP_TIMEOUT, int(question_timeout + margin + 0.999))
+
+
+def question_timeout_limit(margin: float = 60.0) -> float | None:
+    """Longest question timeout that still ends before the step is cancelled, or None if step_timeout can be raised"""
+    if step_timeout_configurable():
+        return None
+    return HARD_CODED_STEP_TIMEOUT - margin
+
+
+@dataclass
+class Question:
+    id: str
+    text: str
+    source: str | None
+    timeout: float | None
+    default: str | None
+    asked_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    _future: asyncio.Future | None = field(default=None, repr=False)
+    _loop: asyncio.AbstractEventLoop | None = field(default=None, repr=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "question": self.text,
+            "source": self.source,
+            "asked_at": self.asked_at,
+            "timeout_s": self.timeout,
+            "default": self.default,
+        }
+
+
+@dataclass
+class HumanAnswer:
+    question_id: str
+    answer: str | None
+    timed_out: bool
+    wait_s: float
+    responder: str | None = None
+    abandoned: bool = False
+
+
+class HumanChannel:
+    """Queue of questions for humans, answered from any thread by the frontends"""
+
+    def __init__(self, default_timeout: float | None = 300.0, default_answer: str | None = None, frontends=None, on_event=None):
+        """
+        Args:
+            default_timeout: Seconds to wait for an answer (None waits forever)
+            default_answer: Answer used when a question times out (None makes the action fail instead)
+            frontends: TerminalFrontend / HttpFrontend / FileDropFrontend instances
+            on_event: Called with a dict for every question asked and resolved
+        """
+        self.default_timeout = default_timeout
+        self.default_answer = default_answer
+        self.on_event = on_event
+        self.frontends = []
+        self._pending: dict[str, Question] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+        # Counters
+        self.asked = 0
+        self.answered = 0
+        self.timed_out = 0
+        self.abandoned = 0
+        self.wait_s = 0.0
+        self.max_wait_s = 0.0
+        self.by_source = {}
+
+        for frontend in frontends or []:
+            self.add_frontend(frontend)
+
+    def add_frontend(self, frontend):
+        self.frontends.append(frontend)
+        frontend.start(self)
+
+    def pending(self) -> list[Question]:
+        with self._lock:
+            return list(self._pending.values())
+
+    def _emit(self, event: dict):
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def _notify(self, method: str, *args):
+        for frontend in self.frontends:
+            try:
+                getattr(frontend, method)(*args)
+            except Exception as e:
+                logger.warning("Human channel frontend %s failed: %s", type(frontend).__name__, e)
+
+    async def ask(self, text: str, source: str | None = None, timeout: float | None = ..., default: str | None = ...) -> HumanAnswer:
+        """Queue a question and wait for the answer without blocking the event loop"""
+        timeout = self.default_timeout if timeout is ... else timeout
+        default = self.default_answer if default is ... else default
+        loop = asyncio.get_running_loop()
+        question = Question(f"q{next(self._ids)}", text, source, timeout, default, _future=loop.create_future(), _loop=loop)
+        with self._lock:
+            self._pending[question.id] = question
+        self.asked += 1
+        self._emit({"event": "asked", **question.to_dict()})
+        self._notify("notify", question)
+
+        start = time.monotonic()
+        timed_out = False
+        try:
+            answer, responder = await asyncio.wait_for(asyncio.shield(question._future), timeout)
+        except asyncio.TimeoutError:
+            answer, responder, timed_out = default, None, True
+        except asyncio.CancelledError:
+            # The agent's step timed out or the run was stopped while waiting
+            self._resolve(question, HumanAnswer(question.id, None, False, time.monotonic() - start, abandoned=True))
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(question.id, None)
+        return self._resolve(question, HumanAnswer(question.id, answer, timed_out, time.monotonic() - start, responder))
+
+    def _resolve(self, question: Question, result: HumanAnswer) -> HumanAnswer:
+        self.wait_s += result.wait_s
+        self.max_wait_s = max(self.max_wait_s, result.wait_s)
+        per_source = self.by_source.setdefault(question.source, {"questions": 0, "timed_out": 0, "abandoned": 0, "wait_s": 0.0})
+        per_source["questions"] += 1
+        per_source["wait_s"] += result.wait_s
+        if result.abandoned:
+            self.abandoned += 1
+            per_source["abandoned"] += 1
+            event = "abandoned"
+        elif result.timed_out:
+            self.timed_out += 1
+            per_source["timed_out"] += 1
+            event = "timed_out"
+        else:
+            self.answered += 1
+            event = "answered"
+
+        self._emit({
+            "event": event,
+            "id": question.id,
+            "source": question.source,
+            "answer": result.answer,
+            "responder": result.responder,
+            "wait_s": round(result.wait_s, 3),
+        })
+        self._notify("resolved", question, result)
+        return result
+
+    def answer(self, question_id: str, text: str, responder: str = "unknown") -> bool:
+        """Answer a pending question; safe to call from any thread. False if it isn't pending."""
+        with self._lock:
+            question = self._pending.get(question_id)
+        if question is None:
+            return False
+
+        def resolve():
+            if not question._future.done():
+                question._future.set_result((text, responder))
+
+        question._loop.call_soon_threadsafe(resolve)
+        return True
+
+    def stats(self, source: str | None = ...) -> dict:
+        """Totals, or the counters of one source (e.g. a batch task id)"""
+        if source is not ...:
+            per_source = self.by_source.get(source, {"questions": 0, "timed_out": 0, "abandoned": 0, "wait_s": 0.0})
+            return {**per_source, "wait_s": round(per_source["wait_s"], 3)}
+        return {
+            "asked": self.asked,
+            "answered": self.answered,
+            "timed_out": self.timed_out,
+            "abandoned": self.abandoned,
+            "pending": len(self._pending),
+            "wait_s": round(self.wait_s, 3),
+            "max_wait_s": round(self.max_wait_s, 3),
+        }
+
+    def close(self):
+        for frontend in self.frontends:
+            frontend.close()
+
+
+# ===== FRONTENDS =====
+
+class TerminalFrontend:
+    """Prints questions and reads answers from stdin on a daemon thread"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdin
+        self.channel = None
+        self._thread = None
+
+    def start(self, channel: HumanChannel):
+        self.channel = channel
+
+    def notify(self, question: Question):
+        if self._thread is None:
+            # Started on the first question so scripts that never ask don't hold stdin
+            self._thread = threading.Thread(target=self._read, name="human-terminal", daemon=True)
+            self._thread.start()
+        pending = self.channel.pending()
+        print("\n" + "="*80)
+        print(f"🤔 AGENT NEEDS YOUR INPUT [{question.id}]" + (f" ({question.source})" if question.source else ""))
+        print("="*80)
+        print(f"Question: {question.text}")
+        if question.timeout is not None:
+            print(f"(answer within {question.timeout:g}s" + (f", default: {question.default!r})" if question.default is not None else ")"))
+        if len(pending) > 1:
+            print(f"{len(pending)} questions pending; answer as '<id>: <answer>' ({', '.join(item.id for item in pending)})")
+        print("-"*80)
+
+    def resolved(self, question: Question, result: HumanAnswer):
+        if result.abandoned:
+            print(f"⏱️ [{question.id}] the agent stopped waiting after {result.wait_s:.0f}s; answer no longer needed")
+        elif result.timed_out:
+            print(f"⏱️ [{question.id}] no answer after {result.wait_s:.0f}s" + (f", using {result.answer!r}" if result.answer is not None else ""))
+
+    def _read(self):
+        for line in self.stream:
+            line = line.rstrip("\n")
+            pending = self.channel.pending()
+            match = _ADDRESSED.match(line.strip())
+            if match and any(item.id == match.group(1) for item in pending):
+                self.channel.answer(match.group(1), match.group(2).strip(), responder="terminal")
+            elif len(pending) == 1:
+                self.channel.answer(pending[0].id, line.strip(), responder="terminal")
+            elif pending:
+                print(f"⚠️ {len(pending)} questions pending; prefix the answer with its id ({', '.join(item.id for item in pending)})")
+
+    def close(self):
+        pass  # Daemon thread; blocked in readline until the process exits
+
+
+def _make_http_handler(channel: HumanChannel):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/questions":
+                self._send_json(200, [question.to_dict() for question in channel.pending()])
+            elif self.path.rstrip("/") == "/stats":
+                self._send_json(200, channel.stats())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            parts = self.path.strip("/").split("/")
+            if len(parts) != 2 or parts[0] != "questions":
+                self._send_json(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length).decode("utf-8")
+            try:
+                answer = json.loads(body)["answer"]
+            except (ValueError, KeyError, TypeError):
+                answer = body.strip()
+            if channel.answer(parts[1], str(answer), responder=f"http:{self.client_address[0]}"):
+                self._send_json(200, {"id": parts[1], "answer": answer})
+            else:
+                self._send_json(404, {"error": f"no pending question {parts[1]}"})
+
+    return Handler
+
+
+class HttpFrontend:
+    """Local HTTP endpoint for listing and answering questions"""
+
+    def __init__(self, port: int = 8765, host: str = "127.0.0.1"):
+        self.port = port
+        self.host = host
+        self.server = None
+
+    def start(self, channel: HumanChannel):
+        self.server = ThreadingHTTPServer((self.host, self.port), _make_http_handler(channel))
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, name="human-http", daemon=True).start()
+        print(f"🙋 Answer agent questions at http://{self.host}:{self.port}/questions")
+
+    def notify(self, question: Question):
+        print(f"🤔 [{question.id}] {question.text}  ->  POST http://{self.host}:{self.port}/questions/{question.id}")
+
+    def resolved(self, question: Question, result: HumanAnswer):
+        pass
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class FileDropFrontend:
+    """Questions as <id>.question.json files; answers are picked up from <id>.answer.txt"""
+
+    def __init__(self, directory, poll_interval: float = 0.5):
+        self.directory = Path(directory)
+        self.poll_interval = poll_interval
+        self.channel = None
+        self._stop = threading.Event()
+
+    def start(self, channel: HumanChannel):
+        self.channel = channel
+        self.directory.mkdir(parents=True, exist_ok=True)
+        threading.Thread(target=self._poll, name="human-files", daemon=True).start()
+
+    def notify(self, question: Question):
+        path = self.directory / f"{question.id}.question.json"
+        path.write_text(json.dumps(question.to_dict(), ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"🤔 [{question.id}] {question.text}  ->  write the answer to {self.directory / f'{question.id}.answer.txt'}")
+
+    def resolved(self, question: Question, result: HumanAnswer):
+        (self.directory / f"{question.id}.question.json").unlink(missing_ok=True)
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            for question in self.channel.pending():
+                path = self.directory / f"{question.id}.answer.txt"
+                if path.exists():
+                    answer = path.read_text(encoding="utf-8").strip()
+                    path.replace(path.with_suffix(".done"))
+                    self.channel.answer(question.id, answer, responder="file")
+
+    def close(self):
+        self._stop.set()
+
+
+def make_frontend(spec: str):
+    """ "terminal", "http" / "http:PORT", or a directory for file drops"""
+    if spec == "terminal":
+        return TerminalFrontend()
+    if spec == "http" or spec.startswith("http:"):
+        return HttpFrontend(port=int(spec.partition(":")[2] or 8765))
+    return FileDropFrontend(spec)
+
+
+# ===== ASK_HUMAN ACTION =====
+
+class AskHumanAction(BaseModel):
+    question: str = Field(
+        ...,
+        description="The question to ask the human user. Be specific about what information you need."
+    )
+
+
+def register_ask_human(tools, channel: HumanChannel, session_log=None, tracer=None, source: str | None = None,
+                       timeout: float | None = ..., default: str | None = ...):
+    """
+    Register the ask_human action on a browser_use Tools instance.
+
+    Args:
+        tools: Tools passed to the Agent
+        channel: HumanChannel the question goes to (can be shared by several agents)
+        session_log: StepLogWriter (or SessionLogger) that gets the question/answer log lines and human.jsonl
+        tracer: StepTracer that records the wait as a human_wait span
+        source: Label shown with the question (e.g. the batch task id)
+        timeout, default: Override the channel's timeout and default answer
+
+    Pass step_timeout=agent_step_timeout(timeout) to the Agent; a step that times out first cancels the question.
+    On releases that ignore step_timeout, the timeout is clamped to question_timeout_limit() instead.
+    """
+    limit = question_timeout_limit()
+    if limit is not None:
+        requested = channel.default_timeout if timeout is ... else timeout
+        if requested is None or requested > limit:
+            logger.warning(
+                "browser_use cancels steps after %ss regardless of step_timeout; questions time out after %.0fs instead of %s",
+                HARD_CODED_STEP_TIMEOUT, limit, "never" if requested is None else f"{requested:.0f}s",
+            )
+            timeout = limit
+
+    @tools.registry.action(
+        "Ask the human user for information when you need clarification or additional details that you cannot find or determine yourself. Use this when you are stuck or need user-specific information like passwords, preferences, addresses, or choices.",
+        param_model=AskHumanAction,
+    )
+    async def ask_human(params: AskHumanAction):
+        """Queue the question for a human and wait for the answer without blocking other work"""
+        if session_log is not None:
+            session_log.log(f"Agent asked human: {params.question}")
+        start = time.monotonic()
+        try:
+            result = await channel.ask(params.question, source=source, timeout=timeout, default=default)
+        except asyncio.CancelledError:
+            # Step timeout or stop: log the question that was left unanswered, then let the cancellation through
+            if tracer is not None:
+                tracer.record_human_wait(start, time.monotonic())
+            if session_log is not None:
+                wait_s = time.monotonic() - start
+                session_log.log(f"Question abandoned after {wait_s:.1f}s: the agent stopped waiting")
+                session_log.write_jsonl("human.jsonl", {
+                    "timestamp": datetime.now().isoformat(),
+                    "question": params.question,
+                    "answer": None,
+                    "timed_out": False,
+                    "abandoned": True,
+                    "responder": None,
+                    "wait_s": round(wait_s, 3),
+                })
+            raise
+        if tracer is not None:
+            tracer.record_human_wait(start, time.monotonic())
+        if session_log is not None:
+            if not result.timed_out:
+                session_log.log(f"Human answered ({result.wait_s:.1f}s): {result.answer}")
+            else:
+                session_log.log(f"No human answer after {result.wait_s:.1f}s" + (f"; using default: {result.answer}" if result.answer else ""))
+            session_log.write_jsonl("human.jsonl", {
+                "timestamp": datetime.now().isoformat(),
+                "id": result.question_id,
+                "question": params.question,
+                "answer": result.answer,
+                "timed_out": result.timed_out,
+                "responder": result.responder,
+                "wait_s": round(result.wait_s, 3),
+            })
+
+        if not result.answer:
+            return ActionResult(
+                extracted_content="User provided no answer",
+                error="No answer received from user" + (f" within {result.wait_s:.0f}s" if result.timed_out else ""),
+            )
+        if result.timed_out:
+            memory = f"Asked user: '{params.question}'. No answer in time; assumed: '{result.answer}'"
+        else:
+            memory = f"Asked user: '{params.question}'. User answered: '{result.answer}'"
+        return ActionResult(extracted_content=result.answer, long_term_memory=memory)
+
+    return ask_human
@@ -0,0 +1,265 @@
+"""
+Load-balanced chat model over several vLLM / Ollama endpoints.
+
+EndpointPool looks like a single browser_use chat model (model, provider,
+ainvoke) but holds one client per endpoint and sends each request to the
+least-loaded healthy endpoint: the score is (in-flight requests + 1) times
+the endpoint's latency EWMA, so a fast idle server wins over a slow or busy
+one.
+
+  - ejection: after eject_after consecutive failures (connection errors,
+    timeouts, 5xx, 429) an endpoint is skipped for eject_seconds; the
+    request is retried on the next endpoint
+  - hedging: once hedge_min_samples latencies are known, a request still
+    running after the hedge_percentile latency is duplicated on the next
+    best endpoint and whichever answers first wins
+  - 4xx errors other than 429 are the request's fault and are raised as-is
+
+Usage:
+    llm = EndpointPool(
+        ["http://158.130.4.155:11434/v1", "http://158.130.4.156:11434/v1"],
+        model="InternVL3_5-14B",
+        temperature=0.7,
+        max_completion_tokens=4096,
+        timeout=120.0,
+    )
+    agent = Agent(task=task, llm=llm)
+    print(llm.stats())
+
+Endpoints can also come from the environment: EndpointPool.from_env("LLM_ENDPOINTS", ...)
+reads a comma-separated list.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+
+
+@dataclass(eq=False)
+class Endpoint:
+    url: str
+    llm: object
+    in_flight: int = 0
+    ewma_latency: float | None = None
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0
+
+    # Counters
+    requests: int = 0
+    errors: int = 0
+    ejections: int = 0
+    hedges_won: int = 0
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+
+def _is_endpoint_failure(error: Exception) -> bool:
+    """True if the error says something about the server rather than the request"""
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError, OSError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        # Client libraries wrap connection problems in their own types (APIConnectionError, ConnectTimeout, ...)
+        name = type(error).__name__
+        return "Connect" in name or "Timeout" in name
+    return status >= 500 or status == 429
+
+
+def _percentile(values, percentile: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(percentile / 100 * len(ordered)))]
+
+
+class EndpointPool:
+    """Chat model that spreads requests over several OpenAI-compatible (or Ollama) endpoints"""
+
+    def __init__(
+        self,
+        endpoints: list[str],
+        model: str,
+        llm_factory=None,
+        ewma_alpha: float = 0.3,
+        eject_after: int = 3,
+        eject_seconds: float = 30.0,
+        hedge_percentile: float | None = 95,
+        hedge_min_samples: int = 20,
+        **chat_kwargs,
+    ):
+        """
+        Args:
+            endpoints: Base URLs, e.g. http://host:11434/v1 for vLLM or http://host:11434 for Ollama
+            model: Model name served by every endpoint
+            llm_factory: llm_factory(url, model, **chat_kwargs) -> chat model; defaults to ChatOpenAI with api_key="EMPTY"
+            ewma_alpha: Weight of the newest latency in the EWMA
+            eject_after: Consecutive failures before an endpoint is ejected
+            eject_seconds: How long an ejected endpoint is skipped
+            hedge_percentile: Latency percentile after which a request is hedged (None disables hedging)
+            hedge_min_samples: Latencies needed before hedging starts
+            chat_kwargs: Passed to every client (temperature, max_completion_tokens, timeout, ...)
+        """
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        if llm_factory is None:
+            from browser_use import ChatOpenAI
+
+            def llm_factory(url, model, **kwargs):
+                return ChatOpenAI(model=model, base_url=url, api_key="EMPTY", **kwargs)
+
+        self.model = model
+        self.endpoints = [Endpoint(url, llm_factory(url, model, **chat_kwargs)) for url in endpoints]
+        self.ewma_alpha = ewma_alpha
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self._latencies = deque(maxlen=500)  # Across endpoints, for the hedge threshold
+
+        # Counters
+        self.requests = 0
+        self.retries = 0
+        self.hedges = 0
+
+    @classmethod
+    def from_env(cls, variable: str, model: str, default: str, **kwargs) -> "EndpointPool":
+        urls = [url.strip() for url in os.getenv(variable, default).split(",") if url.strip()]
+        return cls(urls, model, **kwargs)
+
+    # browser_use reads these off the chat model
+    @property
+    def provider(self) -> str:
+        return getattr(self.endpoints[0].llm, "provider", "openai")
+
+    @property
+    def name(self) -> str:
+        return self.model
+
+    @property
+    def model_name(self) -> str:
+        return self.model
+
+    def _pick(self, exclude=()) -> Endpoint | None:
+        now = time.monotonic()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        if not candidates:
+            return None
+        healthy = [endpoint for endpoint in candidates if endpoint.healthy(now)]
+        if not healthy:
+            # Everything is ejected: try the one that comes back first rather than failing outright
+            return min(candidates, key=lambda endpoint: endpoint.ejected_until)
+        known = [endpoint.ewma_latency for endpoint in healthy if endpoint.ewma_latency is not None]
+        default_latency = sum(known) / len(known) if known else 1.0
+        return min(
+            healthy,
+            key=lambda endpoint: (endpoint.in_flight + 1) * (endpoint.ewma_latency or default_latency),
+        )
+
+    def _hedge_after(self) -> float | None:
+        if self.hedge_percentile is None or len(self.endpoints) < 2 or len(self._latencies) < self.hedge_min_samples:
+            return None
+        return _percentile(self._latencies, self.hedge_percentile)
+
+    def _start(self, endpoint: Endpoint, messages, output_format) -> asyncio.Task:
+        # Count the request as in flight now, so concurrent picks already see it
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+        return asyncio.create_task(self._call(endpoint, messages, output_format))
+
+    async def _call(self, endpoint: Endpoint, messages, output_format):
+        start = time.monotonic()
+        try:
+            result = await endpoint.llm.ainvoke(messages, output_format)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            endpoint.errors += 1
+            if _is_endpoint_failure(e):
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.eject_after:
+                    endpoint.ejected_until = time.monotonic() + self.eject_seconds
+                    endpoint.ejections += 1
+                    endpoint.consecutive_failures = 0
+            raise
+        finally:
+            endpoint.in_flight -= 1
+
+        latency = time.monotonic() - start
+        endpoint.consecutive_failures = 0
+        endpoint.ewma_latency = latency if endpoint.ewma_latency is None else (
+            self.ewma_alpha * latency + (1 - self.ewma_alpha) * endpoint.ewma_latency
+        )
+        self._latencies.append(latency)
+        return result
+
+    async def _attempt(self, endpoint: Endpoint, tried: list, messages, output_format):
+        """One request, hedged onto a second endpoint if it runs past the latency percentile"""
+        primary = self._start(endpoint, messages, output_format)
+        hedge_after = self._hedge_after()
+        if hedge_after is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+        if done:
+            return primary.result()
+        backup_endpoint = self._pick(exclude=tried)
+        if backup_endpoint is None or not backup_endpoint.healthy(time.monotonic()):
+            return await primary
+
+        tried.append(backup_endpoint)
+        self.hedges += 1
+        backup = self._start(backup_endpoint, messages, output_format)
+        pending = {primary, backup}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            backup_endpoint.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def ainvoke(self, messages, output_format=None):
+        self.requests += 1
+        tried = []
+        while True:
+            endpoint = self._pick(exclude=tried)
+            if endpoint is None:
+                raise last_error
+            tried.append(endpoint)
+            try:
+                return await self._attempt(endpoint, tried, messages, output_format)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not _is_endpoint_failure(e):
+                    raise
+                last_error = e
+                self.retries += 1
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_after_s": round(self._hedge_after(), 3) if self._hedge_after() is not None else None,
+            "endpoints": [
+                {
+                    "url": endpoint.url,
+                    "requests": endpoint.requests,
+                    "errors": endpoint.errors,
+                    "ejections": endpoint.ejections,
+                    "hedges_won": endpoint.hedges_won,
+                    "in_flight": endpoint.in_flight,
+                    "ewma_latency_s": round(endpoint.ewma_latency, 3) if endpoint.ewma_latency is not None else None,
+                    "ejected": not endpoint.healthy(time.monotonic()),
+                }
+                for endpoint in self.endpoints
+            ],
+        }
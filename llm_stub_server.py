@@ -0,0 +1,318 @@
+"""
+Minimal OpenAI-compatible chat server for exercising the LLM plumbing without a GPU.
+
+Answers POST /v1/chat/completions (and GET /v1/models) with a canned agent
+reply that finishes the task, after an optional delay, and can be told to
+fail a fraction of requests with 503. Usage fields mimic vLLM, including
+prompt_tokens_details.cached_tokens for the longest prompt prefix this
+server has already seen.
+
+Requests with "stream": true get the reply as text/event-stream chunks
+(chunk_chars characters each, chunk_delay seconds apart), like vLLM. With
+stream_options.include_usage a final chunk carries the usage, and with
+continuous_usage_stats every chunk does, so StreamingChat's early dispatch
+can be benchmarked (bench.py --stream).
+
+With --replay, the server instead plays back the actions of recorded
+sessions, one step per request: a task tagged "[replay:<session>]" gets that
+session's step N reply when its prompt's <agent_history> holds N-1 model
+steps (counted with agent_history.model_steps, so every browser_use history
+format works), so runs are deterministic even with concurrent agents. Recorded URLs are
+pointed at the stub site (bench_site.py) and waits are capped.
+
+Usage:
+    python llm_stub_server.py --port 8001 --delay 0.5
+    python llm_stub_server.py --port 8002 --delay 2.0 --fail-rate 0.3
+    python llm_stub_server.py --port 8003 --delay 0.3 --chunk-delay 0.02   # streamed replies arrive over time
+    python llm_stub_server.py --replay agent_logs/20251024_115204 --site http://127.0.0.1:8100
+
+    llm = EndpointPool(["http://127.0.0.1:8001/v1", "http://127.0.0.1:8002/v1"], model="stub")
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from agent_history import model_steps
+
+DEFAULT_REPLY = {
+    "thinking": "Stub server: finishing immediately.",
+    "evaluation_previous_goal": "Unknown",
+    "memory": "",
+    "next_goal": "Finish the task",
+    "action": [{"done": {"text": "stub result", "success": True}}],
+}
+
+
+_REPLAY_TAG = re.compile(r"\[replay:([\w.-]+)\]")
+_URL_PARAMS = ("url",)
+# Actions that can't be replayed without the original environment
+_SKIPPED_ACTIONS = {"ask_human", "upload_file", "open_tabs"}
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def session_script(session_dir: Path, site_url: str | None = None, max_wait: float = 1.0) -> list[dict]:
+    """
+    Agent replies replaying a recorded session, one per step, ending with done
+
+    Actions come from actions.jsonl or, for sessions logged before it captured
+    them, from the Result line of full_session.log (one action per step then).
+    """
+    from bench_site import rewrite_url
+    from session_analytics import SessionSource, recorded_actions
+
+    source = SessionSource(Path(session_dir))
+    try:
+        records = [record for record in source.records("action") if "step" in record]
+        # (actions, record) pairs, so thinking and memory stay with their step's actions
+        steps = [(record["actions"], record) for record in records if record.get("actions")]
+        if not steps:
+            steps = [([action], {}) for action in recorded_actions(source.log_text())]
+    finally:
+        source.close()
+
+    script = []
+    for i, (actions, record) in enumerate(steps):
+        replayable = []
+        for action in actions:
+            name = next(iter(action))
+            params = dict(action[name] or {})
+            if name in _SKIPPED_ACTIONS:
+                continue
+            if site_url:
+                for key in _URL_PARAMS:
+                    if isinstance(params.get(key), str):
+                        params[key] = rewrite_url(params[key], site_url)
+            if name == "wait":
+                params["seconds"] = min(params.get("seconds", 1), max_wait)
+            replayable.append({name: params})
+        if not replayable:
+            continue
+        script.append({
+            "thinking": record.get("thinking", f"Replaying recorded step {i + 1}."),
+            "evaluation_previous_goal": record.get("evaluation", "Unknown"),
+            "memory": record.get("memory", ""),
+            "next_goal": record.get("next_goal", f"Recorded step {i + 1}"),
+            "action": replayable,
+        })
+        if any("done" in action for action in replayable):
+            break
+    if not script or "done" not in script[-1]["action"][-1]:
+        script.append({**DEFAULT_REPLY, "action": [{"done": {"text": "Replay finished", "success": True}}]})
+    return script
+
+
+def _prompt_text(messages: list) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        elif isinstance(content, list):
+            parts.extend(part.get("text", "") for part in content if isinstance(part, dict))
+    return "\n".join(parts)
+
+
+class StubState:
+    def __init__(self, delay: float, jitter: float, fail_rate: float, reply: dict, scripts: dict | None = None,
+                 chunk_chars: int = 16, chunk_delay: float = 0.0):
+        self.delay = delay
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.reply = reply
+        self.scripts = scripts or {}  # "[replay:<name>]" tag -> session_script() replies
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_delay
+        self.lock = threading.Lock()
+        self.prompts_seen = []  # Prompt texts, for the cached-prefix estimate
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+
+    def cached_prefix_chars(self, prompt: str) -> int:
+        best = 0
+        with self.lock:
+            for seen in self.prompts_seen[-50:]:
+                limit = min(len(seen), len(prompt))
+                i = 0
+                while i < limit and seen[i] == prompt[i]:
+                    i += 1
+                best = max(best, i)
+            self.prompts_seen.append(prompt)
+        return best
+
+    def content_for(self, request: dict) -> str:
+        """Assistant message for a request: the scripted or canned agent reply, or plain text for non-agent calls"""
+        prompt = _prompt_text(request.get("messages", []))
+        if self.scripts and "response_format" not in request and "<agent_history>" not in prompt:
+            # e.g. page extraction, which asks for free text
+            return "Stub extraction result."
+        tag = _REPLAY_TAG.search(prompt)
+        script = self.scripts.get(tag.group(1)) if tag else None
+        if not script:
+            return json.dumps(self.reply)
+        step = model_steps(prompt)
+        return json.dumps(script[min(step, len(script) - 1)])
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _send_stream(self, request: dict, completion_id: str, content: str, usage):
+            """content as chat.completion.chunk server-sent events; usage(text) -> usage dict"""
+            options = request.get("stream_options") or {}
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+
+            def event(choices: list, chunk_usage=None):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": choices,
+                }
+                if chunk_usage is not None:
+                    chunk["usage"] = chunk_usage
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            try:
+                sent = 0
+                while sent < len(content):
+                    if sent and state.chunk_delay:
+                        time.sleep(state.chunk_delay)
+                    piece = content[sent:sent + state.chunk_chars]
+                    sent += len(piece)
+                    delta = {"role": "assistant", "content": piece} if sent == len(piece) else {"content": piece}
+                    event([{"index": 0, "delta": delta, "finish_reason": None}],
+                          usage(content[:sent]) if options.get("continuous_usage_stats") else None)
+                event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                if options.get("include_usage"):
+                    event([], usage(content))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The client closed the stream early (StreamingChat's early dispatch)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send_json(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+            elif self.path.rstrip("/").endswith("/stats"):
+                self._send_json(200, {"requests": state.requests, "failures": state.failures, "in_flight": state.in_flight})
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+
+            with state.lock:
+                state.requests += 1
+                state.in_flight += 1
+            try:
+                time.sleep(max(0.0, state.delay + random.uniform(-state.jitter, state.jitter)))
+                if random.random() < state.fail_rate:
+                    with state.lock:
+                        state.failures += 1
+                    self._send_json(503, {"error": {"message": "stub overloaded", "type": "server_error"}})
+                    return
+
+                prompt = json.dumps(request.get("messages", []), sort_keys=True)
+                content = state.content_for(request)
+                prompt_tokens = _approx_tokens(prompt)
+                cached_tokens = min(prompt_tokens, state.cached_prefix_chars(prompt) // 4)
+
+                def usage(completion: str) -> dict:
+                    return {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": _approx_tokens(completion),
+                        "total_tokens": prompt_tokens + _approx_tokens(completion),
+                        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                    }
+
+                completion_id = f"chatcmpl-stub-{state.requests}"
+                if request.get("stream"):
+                    self._send_stream(request, completion_id, content, usage)
+                    return
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage(content),
+                })
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+    return Handler
+
+
+def start_stub_server(port: int = 0, delay: float = 0.0, jitter: float = 0.0, fail_rate: float = 0.0, reply: dict | None = None,
+                      scripts: dict | None = None, chunk_delay: float = 0.0):
+    """Start a stub server on a background thread; returns (server, base_url). Stop with server.shutdown()."""
+    state = StubState(delay, jitter, fail_rate, reply or DEFAULT_REPLY, scripts, chunk_delay=chunk_delay)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub chat server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.2, help="Seconds per response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- seconds added to the delay")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between chunks of a streamed reply")
+    parser.add_argument("--reply", help="JSON file with the assistant reply to return")
+    parser.add_argument("--replay", nargs="+", type=Path, metavar="SESSION_DIR",
+                        help="Replay these sessions' actions for tasks tagged [replay:<session name>]")
+    parser.add_argument("--site", help="Stub site URL that recorded URLs are pointed at (see bench_site.py)")
+    args = parser.parse_args(argv)
+
+    reply = None
+    if args.reply:
+        with open(args.reply, encoding="utf-8") as f:
+            reply = json.load(f)
+    scripts = {session_dir.name: session_script(session_dir, args.site) for session_dir in args.replay or []}
+    server, base_url = start_stub_server(args.port, args.delay, args.jitter, args.fail_rate, reply, scripts, args.chunk_delay)
+    print(f"🧪 Stub LLM server at {base_url} (delay {args.delay}s, fail rate {args.fail_rate})")
+    for name, script in scripts.items():
+        print(f"   replaying {name}: {len(script)} steps, tag tasks with [replay:{name}]")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
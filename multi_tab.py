@@ -0,0 +1,215 @@
+"""
+Open several pages at once and read them all in one agent step.
+
+browser_use acts on one tab per step, so "open the top five Show HN links
+and summarize them" costs five navigate + LLM round trips. The open_tabs
+action registered here takes a list of URLs, opens them in background tabs
+concurrently (at most max_concurrent loading at a time), waits for each to
+finish loading and returns every page's title and visible text to the model
+in a single ActionResult. The agent's own tab stays focused; the extra tabs
+are closed afterwards unless keep_open is set.
+
+Each call is recorded in tabs.jsonl with per-tab load times, so the wall
+time of the call can be compared with the sum of the loads.
+
+Usage:
+    tab_gatherer = TabGatherer(max_concurrent=4)
+    tools = Tools()
+    register_open_tabs(tools, tab_gatherer, session_log=log_writer)
+    agent = Agent(task="Open the top 5 Show HN posts and summarize each", llm=llm, tools=tools)
+    ...
+    print(tab_gatherer.stats())
+"""
+import asyncio
+import json
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+from browser_use.agent.views import ActionResult
+from browser_use.browser.events import CloseTabEvent
+from pydantic import BaseModel, Field
+
+from browser_pool import note_visited
+
+# Loaded: the navigation away from the initial about:blank has committed and finished
+_READY_JS = 'document.readyState === "complete" && location.href !== "about:blank"'
+# Visible text, title and final URL of a page, with whitespace runs collapsed
+_PAGE_TEXT_JS = """(() => {
+    const text = (document.body ? document.body.innerText : '').replace(/[ \\t]+/g, ' ').replace(/\\n\\s*\\n+/g, '\\n');
+    return JSON.stringify({url: location.href, title: document.title, text: text});
+})()"""
+
+
+@dataclass
+class TabPage:
+    url: str
+    final_url: str | None = None
+    title: str | None = None
+    text: str | None = None
+    chars: int = 0
+    truncated: bool = False
+    load_ms: float | None = None
+    error: str | None = None
+    target_id: str | None = None
+
+
+class OpenTabsAction(BaseModel):
+    urls: list[str] = Field(..., description="Absolute URLs to open, one tab each")
+    keep_open: bool = Field(False, description="Leave the tabs open afterwards (e.g. to interact with one of them next)")
+
+
+class TabGatherer:
+    """Loads pages in concurrent background tabs and extracts their text"""
+
+    def __init__(self, max_concurrent: int = 4, max_tabs: int = 10, timeout: float = 20.0, max_chars_per_page: int = 4000):
+        """
+        Args:
+            max_concurrent: Tabs loading at the same time, across every call and agent using this gatherer
+            max_tabs: Most URLs accepted in one call (the rest are reported as skipped)
+            timeout: Seconds to wait for a page to finish loading; slower pages are read as they are
+            max_chars_per_page: Text returned to the model per page
+        """
+        self.max_concurrent = max_concurrent
+        self.max_tabs = max_tabs
+        self.timeout = timeout
+        self.max_chars_per_page = max_chars_per_page
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+        # Counters
+        self.calls = 0
+        self.tabs = 0
+        self.failed_tabs = 0
+        self.wall_s = 0.0
+        self.load_s = 0.0
+
+    async def _evaluate(self, cdp_session, expression: str):
+        result = await cdp_session.cdp_client.send.Runtime.evaluate(
+            params={"expression": expression, "returnByValue": True}, session_id=cdp_session.session_id
+        )
+        return result.get("result", {}).get("value")
+
+    async def _load(self, browser, url: str) -> TabPage:
+        page = TabPage(url=url)
+        async with self._semaphore:
+            start = time.monotonic()
+            try:
+                root = await browser.get_or_create_cdp_session()
+                created = await root.cdp_client.send.Target.createTarget(params={"url": url, "background": True})
+                page.target_id = created["targetId"]
+                cdp_session = await browser.get_or_create_cdp_session(page.target_id, focus=False)
+
+                # A new target is on about:blank, already "complete", until the navigation commits
+                ready_js = _READY_JS if url != "about:blank" else 'document.readyState === "complete"'
+                deadline = start + self.timeout
+                while time.monotonic() < deadline:
+                    try:
+                        if await self._evaluate(cdp_session, ready_js):
+                            break
+                    except Exception:
+                        # The execution context is destroyed while the navigation commits; poll again
+                        pass
+                    await asyncio.sleep(0.1)
+
+                data = json.loads(await self._evaluate(cdp_session, _PAGE_TEXT_JS) or "{}")
+                text = data.get("text", "").strip()
+                page.final_url = data.get("url")
+                page.title = data.get("title")
+                page.chars = len(text)
+                page.truncated = len(text) > self.max_chars_per_page
+                page.text = text[:self.max_chars_per_page]
+            except Exception as e:
+                page.error = f"{type(e).__name__}: {e}"
+            page.load_ms = round((time.monotonic() - start) * 1000, 1)
+        return page
+
+    async def _close(self, browser, pages: list[TabPage]):
+        for page in pages:
+            if page.target_id is None:
+                continue
+            try:
+                await browser.event_bus.dispatch(CloseTabEvent(target_id=page.target_id))
+            except Exception:
+                pass
+
+    async def gather(self, browser, urls: list[str], keep_open: bool = False) -> tuple[list[TabPage], list[str]]:
+        """Open urls concurrently; returns (pages in the order given, skipped urls)"""
+        urls, skipped = urls[:self.max_tabs], urls[self.max_tabs:]
+        start = time.monotonic()
+        pages = await asyncio.gather(*(self._load(browser, url) for url in urls))
+        # These tabs are closed before the pool resets the browser; report their origins for clearing
+        note_visited(browser, [page.final_url or page.url for page in pages])
+        if not keep_open:
+            await self._close(browser, pages)
+
+        self.calls += 1
+        self.tabs += len(pages)
+        self.failed_tabs += sum(1 for page in pages if page.error)
+        self.wall_s += time.monotonic() - start
+        self.load_s += sum(page.load_ms for page in pages) / 1000
+        return pages, skipped
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "tabs": self.tabs,
+            "failed_tabs": self.failed_tabs,
+            "wall_s": round(self.wall_s, 3),
+            "sequential_load_s": round(self.load_s, 3),
+        }
+
+
+def format_pages(pages: list[TabPage], skipped: list[str]) -> str:
+    """Text the model gets back from open_tabs"""
+    parts = []
+    for i, page in enumerate(pages, 1):
+        if page.error:
+            parts.append(f"<tab_{i} url=\"{page.url}\">\nFailed to load: {page.error}\n</tab_{i}>")
+            continue
+        note = f"\n[truncated, {page.chars} chars total]" if page.truncated else ""
+        parts.append(f"<tab_{i} url=\"{page.final_url or page.url}\" title=\"{page.title or ''}\">\n{page.text}{note}\n</tab_{i}>")
+    if skipped:
+        parts.append(f"Not opened (limit of {len(pages)} tabs per call): {', '.join(skipped)}")
+    return "\n\n".join(parts)
+
+
+def register_open_tabs(tools, gatherer: TabGatherer, session_log=None):
+    """
+    Register the open_tabs action on a browser_use Tools instance.
+
+    Args:
+        tools: Tools passed to the Agent
+        gatherer: TabGatherer with the concurrency limit (can be shared by several agents)
+        session_log: StepLogWriter (or SessionLogger) that gets a log line and a tabs.jsonl record per call
+    """
+    @tools.registry.action(
+        "Open several URLs at once in background tabs and read all of them in one step. Returns each page's title and text. "
+        "Use this instead of visiting pages one by one when you need to read or compare several pages, e.g. the top 5 results of a listing.",
+        param_model=OpenTabsAction,
+    )
+    async def open_tabs(params: OpenTabsAction, browser_session):
+        """Load the pages concurrently and return their text"""
+        start = time.monotonic()
+        pages, skipped = await gatherer.gather(browser_session, params.urls, keep_open=params.keep_open)
+        wall_ms = round((time.monotonic() - start) * 1000, 1)
+        if session_log is not None:
+            session_log.log(f"Opened {len(pages)} tabs in {wall_ms:.0f} ms "
+                            f"(sequential would be ~{sum(page.load_ms for page in pages):.0f} ms)")
+            session_log.write_jsonl("tabs.jsonl", {
+                "timestamp": datetime.now().isoformat(),
+                "wall_ms": wall_ms,
+                "max_concurrent": gatherer.max_concurrent,
+                "skipped": skipped,
+                "tabs": [
+                    {key: value for key, value in asdict(page).items() if key not in ("text", "target_id")}
+                    for page in pages
+                ],
+            })
+
+        loaded = [page for page in pages if not page.error]
+        if not loaded:
+            return ActionResult(error=f"None of the {len(pages)} pages could be loaded", extracted_content=format_pages(pages, skipped))
+        memory = f"Opened {len(pages)} tabs at once, read {len(loaded)}: " + "; ".join(page.title or page.url for page in loaded)
+        return ActionResult(extracted_content=format_pages(pages, skipped), long_term_memory=memory)
+
+    return open_tabs
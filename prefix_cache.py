@@ -0,0 +1,171 @@
+"""
+Prefix-cache-friendly message assembly for vLLM.
+
+vLLM's automatic prefix caching only skips prefill for the longest prefix
+that is byte-identical to an earlier request. browser_use's state message
+(see LLM_INPUT_EXPLANATION.md) puts <agent_history> first and the task inside
+<agent_state>, next to the step number and the current time, so after the
+system prompt almost nothing is reused between steps, and nothing at all
+between agents.
+
+PrefixCacheShaper wraps a chat model and reorders each request so content
+goes from most to least stable:
+
+    system prompt
+    output schema (the action/tool JSON schema, serialized deterministically)
+    <user_request> task </user_request>
+    <agent_history> ... </agent_history>        append-only within a run
+    rest of <agent_state>, <browser_state>, ...  changes every step
+    screenshot
+
+Every call's usage is reported through on_usage with the share of prompt
+tokens the server served from cache (usage.prompt_cached_tokens; vLLM fills
+it when started with --enable-prompt-tokens-details).
+
+Usage:
+    llm = PrefixCacheShaper(
+        EndpointPool.from_env("LLM_ENDPOINTS", model="InternVL3_5-14B", default="http://158.130.4.155:11434/v1"),
+        on_usage=lambda record: log_writer.write_jsonl("prefix_cache.jsonl", record),
+    )
+    agent = Agent(task=task, llm=llm)
+"""
+import json
+import re
+import time
+from datetime import datetime
+
+from browser_use.llm.messages import ContentPartTextParam, SystemMessage, UserMessage
+
+_USER_REQUEST = re.compile(r"<user_request>\n?(.*?)\n?</user_request>\n?", re.DOTALL)
+_AGENT_HISTORY = re.compile(r"<agent_history>.*?</agent_history>\n?", re.DOTALL)
+
+
+def _text_of(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(part.text for part in content if hasattr(part, 'text'))
+
+
+def shape_state_message(message: UserMessage) -> UserMessage | None:
+    """
+    Reorder one browser_use state message as task, history, volatile state.
+    Returns None if the message isn't a state message.
+    """
+    parts = [ContentPartTextParam(text=message.content)] if isinstance(message.content, str) else list(message.content)
+    if not parts or not hasattr(parts[0], 'text'):
+        return None
+    state_text = parts[0].text
+    request_match = _USER_REQUEST.search(state_text)
+    if "<agent_state>" not in state_text or request_match is None:
+        return None
+
+    history_match = _AGENT_HISTORY.search(state_text)
+    history = history_match.group(0) if history_match else ""
+    volatile = _USER_REQUEST.sub("", _AGENT_HISTORY.sub("", state_text, count=1), count=1)
+
+    shaped = [
+        ContentPartTextParam(text=f"<user_request>\n{request_match.group(1).strip()}\n</user_request>\n"),
+    ]
+    if history:
+        shaped.append(ContentPartTextParam(text=history))
+    shaped.append(ContentPartTextParam(text=volatile.lstrip("\n")))
+    # Screenshot parts (and their captions) stay last
+    shaped.extend(parts[1:])
+    return message.model_copy(update={"content": shaped})
+
+
+class PrefixCacheShaper:
+    """Chat model wrapper that assembles requests stable-first and reports cached-prefix ratios"""
+
+    def __init__(self, llm, include_output_schema: bool = True, on_usage=None):
+        """
+        Args:
+            llm: Wrapped chat model (ChatOpenAI, EndpointPool, ...)
+            include_output_schema: Append the output JSON schema to the system prompt
+            on_usage: Called with a dict per request (prompt/cached tokens, ratio, stable prefix size)
+        """
+        self.llm = llm
+        self.include_output_schema = include_output_schema
+        self.on_usage = on_usage
+        self._schemas = {}
+
+        # Counters
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.calls_without_usage = 0
+
+    def __getattr__(self, name):
+        # model, provider, name, stats(), ... come from the wrapped model
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def _schema_text(self, output_format) -> str | None:
+        if output_format is None or not self.include_output_schema or not hasattr(output_format, 'model_json_schema'):
+            return None
+        if output_format not in self._schemas:
+            schema = json.dumps(output_format.model_json_schema(), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+            self._schemas[output_format] = f"\n\n<output_schema>\n{schema}\n</output_schema>"
+        return self._schemas[output_format]
+
+    def shape(self, messages: list, output_format=None) -> tuple[list, int]:
+        """Return the reordered messages and the length in chars of the part meant to be identical across steps"""
+        schema_text = self._schema_text(output_format)
+        shaped = []
+        stable_chars = 0
+        in_stable_prefix = True
+        for message in messages:
+            if isinstance(message, SystemMessage):
+                text = _text_of(message.content) + (schema_text or "")
+                shaped.append(message.model_copy(update={"content": text}))
+                if in_stable_prefix:
+                    stable_chars += len(text)
+                continue
+            if isinstance(message, UserMessage):
+                state = shape_state_message(message)
+                if state is not None:
+                    shaped.append(state)
+                    if in_stable_prefix:
+                        stable_chars += len(state.content[0].text)
+                    in_stable_prefix = False
+                    continue
+            shaped.append(message)
+            in_stable_prefix = False
+        return shaped, stable_chars
+
+    async def ainvoke(self, messages, output_format=None):
+        shaped, stable_chars = self.shape(messages, output_format)
+        start = time.monotonic()
+        result = await self.llm.ainvoke(shaped, output_format)
+        self.calls += 1
+
+        usage = getattr(result, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", None) if usage else None
+        cached_tokens = getattr(usage, "prompt_cached_tokens", None) if usage else None
+        if prompt_tokens:
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens or 0
+        else:
+            self.calls_without_usage += 1
+
+        if self.on_usage is not None:
+            self.on_usage({
+                "call": self.calls,
+                "timestamp": datetime.now().isoformat(),
+                "prompt_tokens": prompt_tokens,
+                "cached_tokens": cached_tokens,
+                "cached_ratio": round(cached_tokens / prompt_tokens, 4) if prompt_tokens and cached_tokens is not None else None,
+                "stable_prefix_chars": stable_chars,
+                "latency_s": round(time.monotonic() - start, 3),
+            })
+        return result
+
+    def prefix_stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cached_ratio": round(self.cached_tokens / self.prompt_tokens, 4) if self.prompt_tokens else None,
+            "calls_without_usage": self.calls_without_usage,
+        }
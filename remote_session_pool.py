@@ -0,0 +1,284 @@
+"""
+Pool of remote browser sessions (Steel) shared across agent tasks.
+
+Creating a Steel session adds seconds to every task, and a session that is
+never released keeps billing until Steel times it out. RemoteSessionPool
+creates `size` sessions up front, health-checks each one before leasing it,
+hands the same session to task after task (resetting the browser in
+between), and releases sessions that sit idle longer than idle_timeout or
+get close to max_age (Steel ends sessions at their own timeout). Released
+capacity is refilled on the next acquire. close() releases everything.
+
+A provider creates, checks and releases sessions:
+  - SteelProvider: client.sessions.create() / retrieve() / release()
+  - LocalCdpProvider: existing local Chromium instances started with
+    --remote-debugging-port, for running the same code path without Steel
+
+Usage:
+    pool = RemoteSessionPool(SteelProvider(STEEL_API_KEY), size=2)
+    await pool.start()
+    async with pool.acquire_browser() as (browser, session):
+        print(f"View live session at: {session.viewer_url}")
+        agent = Agent(task=task, llm=llm, browser=browser)
+        await agent.run()
+    await pool.close()  # releases every session
+"""
+import asyncio
+import itertools
+import json
+import time
+import urllib.request
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+from browser_use import Browser, BrowserProfile
+
+from browser_pool import reset_browser
+
+
+@dataclass
+class RemoteSession:
+    id: str
+    cdp_url: str
+    viewer_url: str | None = None
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    leases: int = 0
+
+
+class SteelProvider:
+    """Steel cloud sessions; the Steel client is synchronous, so calls run in a thread"""
+
+    def __init__(self, api_key: str, **create_kwargs):
+        """
+        Args:
+            api_key: STEEL_API_KEY
+            create_kwargs: Passed to client.sessions.create(), e.g. timeout=900000
+        """
+        from steel import Steel
+
+        self.api_key = api_key
+        self.client = Steel(steel_api_key=api_key)
+        self.create_kwargs = create_kwargs
+
+    async def create(self) -> RemoteSession:
+        session = await asyncio.to_thread(self.client.sessions.create, **self.create_kwargs)
+        return RemoteSession(
+            id=session.id,
+            cdp_url=f"wss://connect.steel.dev?apiKey={self.api_key}&sessionId={session.id}",
+            viewer_url=getattr(session, "session_viewer_url", None),
+        )
+
+    async def is_healthy(self, session: RemoteSession) -> bool:
+        info = await asyncio.to_thread(self.client.sessions.retrieve, session.id)
+        return getattr(info, "status", "live") == "live"
+
+    async def release(self, session: RemoteSession):
+        await asyncio.to_thread(self.client.sessions.release, session.id)
+
+
+class LocalCdpProvider:
+    """Stand-in for Steel backed by local Chromium CDP endpoints (http://127.0.0.1:9222 ...)"""
+
+    def __init__(self, cdp_urls: list[str]):
+        self.cdp_urls = [url.rstrip("/") for url in cdp_urls]
+        self._in_use = set()
+        self._ids = itertools.count(1)
+
+    async def create(self) -> RemoteSession:
+        free = [url for url in self.cdp_urls if url not in self._in_use]
+        if not free:
+            raise RuntimeError(f"All {len(self.cdp_urls)} local CDP endpoints are in use")
+        self._in_use.add(free[0])
+        return RemoteSession(id=f"local-{next(self._ids)}", cdp_url=free[0], viewer_url=free[0])
+
+    async def is_healthy(self, session: RemoteSession) -> bool:
+        def fetch():
+            with urllib.request.urlopen(f"{session.cdp_url}/json/version", timeout=5) as response:
+                return json.load(response)
+        return "webSocketDebuggerUrl" in await asyncio.to_thread(fetch)
+
+    async def release(self, session: RemoteSession):
+        self._in_use.discard(session.cdp_url)
+
+
+def _percentile(values: list[float], percentile: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(percentile / 100 * len(ordered)))]
+
+
+class RemoteSessionPool:
+    """Leases pre-created remote sessions to agents and reuses them across tasks"""
+
+    def __init__(
+        self,
+        provider,
+        size: int = 2,
+        idle_timeout: float = 120.0,
+        max_age: float = 240.0,
+        reap_interval: float = 15.0,
+    ):
+        """
+        Args:
+            provider: SteelProvider, LocalCdpProvider or anything with create/is_healthy/release
+            size: Maximum number of sessions held at once (all created by start())
+            idle_timeout: Release a session unused for this many seconds
+            max_age: Release a session this old instead of leasing it again (keep below Steel's session timeout)
+            reap_interval: Seconds between idle/age sweeps
+        """
+        self.provider = provider
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self.reap_interval = reap_interval
+
+        self._idle: list[RemoteSession] = []
+        self._slots = asyncio.Semaphore(size)  # one per session, leased or not yet created
+        self._lock = asyncio.Lock()
+        self._reaper = None
+        self._closed = False
+
+        # Counters
+        self.created = 0
+        self.released = 0
+        self.leases = 0
+        self.reused = 0
+        self.health_failures = 0
+        self.expired_idle = 0
+        self.expired_age = 0
+        self.acquire_latencies = []
+
+    async def _create(self) -> RemoteSession:
+        session = await self.provider.create()
+        self.created += 1
+        return session
+
+    async def _release(self, session: RemoteSession):
+        try:
+            await self.provider.release(session)
+        except Exception as e:
+            print(f"⚠️ Failed to release remote session {session.id}: {e}")
+        self.released += 1
+
+    async def start(self):
+        """Create every session in parallel so the first tasks don't wait for provisioning"""
+        results = await asyncio.gather(*(self._create() for _ in range(self.size)), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            # Don't leave the sessions that did start billing until the provider times them out
+            await asyncio.gather(*(self._release(result) for result in results if not isinstance(result, BaseException)))
+            raise errors[0]
+        self._idle.extend(results)
+        self._reaper = asyncio.create_task(self._reap_loop())
+
+    async def _healthy(self, session: RemoteSession) -> bool:
+        try:
+            return await self.provider.is_healthy(session)
+        except Exception:
+            return False
+
+    async def _take(self) -> RemoteSession:
+        while True:
+            async with self._lock:
+                session = self._idle.pop() if self._idle else None  # Most recently used first
+            if session is None:
+                return await self._create()
+            if time.monotonic() - session.created_at > self.max_age:
+                self.expired_age += 1
+                await self._release(session)
+                continue
+            if await self._healthy(session):
+                self.reused += session.leases > 0
+                return session
+            self.health_failures += 1
+            await self._release(session)
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Lease a healthy session; it returns to the pool when the block exits"""
+        start = time.monotonic()
+        await self._slots.acquire()
+        try:
+            session = await self._take()
+        except BaseException:
+            self._slots.release()
+            raise
+        self.acquire_latencies.append(time.monotonic() - start)
+        self.leases += 1
+        session.leases += 1
+        try:
+            yield session
+        finally:
+            session.last_used = time.monotonic()
+            if self._closed:
+                await self._release(session)
+            else:
+                async with self._lock:
+                    self._idle.append(session)
+            self._slots.release()
+
+    @asynccontextmanager
+    async def acquire_browser(self, **profile_kwargs):
+        """Lease a session and connect a Browser to it; the browser is reset before the session is reused"""
+        async with self.acquire() as session:
+            browser = Browser(browser_profile=BrowserProfile(cdp_url=session.cdp_url, keep_alive=True, **profile_kwargs))
+            await browser.start()
+            try:
+                yield browser, session
+            finally:
+                try:
+                    await reset_browser(browser)
+                except Exception as e:
+                    # The next lease's health check decides whether the session is still usable
+                    print(f"⚠️ Failed to reset remote browser {session.id}: {e}")
+                try:
+                    await browser.kill()  # Drops the CDP connection; the remote browser belongs to the provider
+                except Exception:
+                    pass
+
+    async def _reap_loop(self):
+        while not self._closed:
+            await asyncio.sleep(self.reap_interval)
+            await self.reap()
+
+    async def reap(self):
+        """Release idle sessions past idle_timeout or max_age"""
+        now = time.monotonic()
+        async with self._lock:
+            expired = [
+                session for session in self._idle
+                if now - session.last_used > self.idle_timeout or now - session.created_at > self.max_age
+            ]
+            self._idle = [session for session in self._idle if session not in expired]
+        for session in expired:
+            if now - session.created_at > self.max_age:
+                self.expired_age += 1
+            else:
+                self.expired_idle += 1
+            await self._release(session)
+
+    async def close(self):
+        self._closed = True
+        if self._reaper is not None:
+            self._reaper.cancel()
+        async with self._lock:
+            idle, self._idle = self._idle, []
+        await asyncio.gather(*(self._release(session) for session in idle))
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "idle": len(self._idle),
+            "created": self.created,
+            "released": self.released,
+            "leases": self.leases,
+            "reused": self.reused,
+            "health_failures": self.health_failures,
+            "expired_idle": self.expired_idle,
+            "expired_age": self.expired_age,
+            "acquire_ms_p50": round(_percentile(self.acquire_latencies, 50) * 1000, 1) if self.acquire_latencies else None,
+            "acquire_ms_p95": round(_percentile(self.acquire_latencies, 95) * 1000, 1) if self.acquire_latencies else None,
+            "acquire_ms_max": round(max(self.acquire_latencies) * 1000, 1) if self.acquire_latencies else None,
+        }
@@ -0,0 +1,433 @@
+"""
+Replay recorded action traces without LLM calls.
+
+A macro is the step-by-step trace of a successful run: for each step the
+page URL, a structural fingerprint of the DOM the model saw, and the model's
+output (thinking, memory, actions). ReplayLLM answers the agent's step
+requests from a macro instead of calling the model, so browser_use still
+extracts the DOM, executes the actions and logs the steps, but a repeated
+task like "Find the number 1 post on Show HN" costs no inference rounds.
+
+Before each replayed step the current page is checked against the recording:
+  - same URL (scheme, host and path; the query string is ignored)
+  - similar DOM structure (element tags and attribute names, not text,
+    so a listing whose entries changed since the recording still matches)
+  - every element an action targets by index has the same tag, attribute
+    names and nesting depth, with a similar neighbourhood
+  - the previous step's actions didn't return an error (ActionResult.error
+    of the bound agent; unbound, agent_history.last_step_failed, which reads
+    only the "Result:" lines of the last step, never the model's own
+    evaluation or memory)
+
+On the first mismatch ReplayLLM falls back to the real model for the rest
+of the run; requests that aren't agent steps (e.g. page extraction) always
+go to the model. MacroRecorder records every run from the step callback, so
+a run that needed the model can replace its macro once it succeeds.
+
+Macros are JSON files under agent_logs/macros/, keyed by the normalized task.
+
+Usage:
+    macro_store = MacroStore()
+    recorder = MacroRecorder(task)
+    macro = macro_store.get(task)
+    if macro:
+        llm = ReplayLLM(llm, macro)
+    agent = Agent(task=task, llm=llm, register_new_step_callback=make_step_callback(log_writer, macro_recorder=recorder))
+    if macro:
+        llm.bind(agent)  # Checks the previous step's action errors directly
+    history = await agent.run()
+    if history.is_successful():
+        macro_store.save(recorder.macro(session=SESSION_DIR.name))
+
+    # SESSION is a session logged with its actions ("actions" in actions.jsonl);
+    # the sessions in agent_logs/ predate that and can't be turned into macros
+    python replay.py save agent_logs/SESSION      # macro from a recorded session
+    python replay.py list
+    python replay.py run agent_logs/SESSION --headless   # replay it (saves the macro first)
+    python batch_runner.py tasks.jsonl --macros agent_logs/macros
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import re
+import sys
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlparse
+
+from browser_use.llm.views import ChatInvokeCompletion
+
+from agent_history import last_step_failed
+
+MACROS_DIR = Path("agent_logs/macros")
+
+_BROWSER_STATE = re.compile(r"<browser_state>(.*?)</browser_state>", re.DOTALL)
+_ELEMENT = re.compile(r"^(\t*)\*?\[(\d+)\]<([\w-]+)([^>]*)>", re.MULTILINE)
+_ATTRIBUTE = re.compile(r"([\w:-]+)=")
+_CURRENT_TAB = re.compile(r"Current tab: (\S+)")
+_TAB = re.compile(r"^Tab (\S+): (\S+)", re.MULTILINE)
+# Agent output fields as named in actions.jsonl records
+_OUTPUT_FIELDS = {
+    "thinking": "thinking",
+    "evaluation": "evaluation_previous_goal",
+    "memory": "memory",
+    "next_goal": "next_goal",
+}
+
+
+# ===== FINGERPRINTS =====
+
+def element_signatures(dom_text: str) -> dict[int, str]:
+    """Index -> "depth/tag/attribute,names" for every interactive element of an llm_representation() dump"""
+    signatures = {}
+    for match in _ELEMENT.finditer(dom_text or ""):
+        depth, index, tag, attributes = match.groups()
+        names = ",".join(sorted(set(_ATTRIBUTE.findall(attributes))))
+        signatures[int(index)] = f"{len(depth)}/{tag}/{names}"
+    return signatures
+
+
+def normalize_url(url: str | None) -> str:
+    if not url:
+        return ""
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}{parsed.path.rstrip('/')}"
+
+
+def task_key(task: str) -> str:
+    return hashlib.sha256(" ".join(task.lower().split()).encode("utf-8")).hexdigest()[:16]
+
+
+def _similarity(a: Counter, b: Counter) -> float:
+    if not a and not b:
+        return 1.0
+    return sum((a & b).values()) / max(1, sum((a | b).values()))
+
+
+def _context(signatures: dict[int, str], index: int, radius: int = 2) -> list[str]:
+    ordered = sorted(signatures)
+    if index not in signatures:
+        return []
+    position = ordered.index(index)
+    return [signatures[i] for i in ordered[max(0, position - radius):position + radius + 1]]
+
+
+def _targets(output: dict) -> list[int]:
+    """Element indexes the step's actions refer to"""
+    indexes = []
+    for action in output.get("action") or []:
+        for params in action.values():
+            if isinstance(params, dict) and isinstance(params.get("index"), int):
+                indexes.append(params["index"])
+    return indexes
+
+
+def macro_step(step: int, url: str | None, dom_text: str | None, output: dict) -> dict:
+    signatures = element_signatures(dom_text or "")
+    return {
+        "step": step,
+        "url": url,
+        "skeleton": dict(Counter(signatures.values())),
+        "targets": {
+            str(index): {"signature": signatures.get(index), "context": _context(signatures, index)}
+            for index in _targets(output)
+        },
+        "output": output,
+    }
+
+
+# ===== RECORDING AND STORAGE =====
+
+class MacroRecorder:
+    """Collects a run's steps from the step callback"""
+
+    def __init__(self, task: str):
+        self.task = task
+        self.steps = []
+
+    def record(self, step: int, browser_state, agent_output, dom_text: str | None = ...):
+        """dom_text: the step's llm_representation() if the caller already has it"""
+        if dom_text is ...:
+            try:
+                dom_text = browser_state.dom_state.llm_representation()
+            except Exception:
+                dom_text = None
+        output = agent_output.model_dump(exclude_none=True, mode="json") if hasattr(agent_output, 'model_dump') else dict(agent_output)
+        self.steps.append(macro_step(step, browser_state.url, dom_text, output))
+
+    def macro(self, **metadata) -> dict:
+        return {
+            "task": self.task,
+            "key": task_key(self.task),
+            "created": datetime.now().isoformat(),
+            "steps": self.steps,
+            **metadata,
+        }
+
+
+def macro_from_session(session_dir: Path) -> dict:
+    """Build a macro from a recorded session directory (or its session.bsa)"""
+    from dom_delta import DOM_SNAPSHOTS, DomSnapshots
+    from session_analytics import SessionSource, parse_session_log
+
+    session_dir = Path(session_dir)
+    source = SessionSource(session_dir)
+    try:
+        actions = {record["step"]: record for record in source.records("action") if "step" in record}
+        states = {record["step"]: record for record in source.records("browser_state") if "step" in record}
+        dom_records = source.records("jsonl", DOM_SNAPSHOTS)
+        snapshots = DomSnapshots(dom_records) if dom_records else None
+        snapshot_steps = set(snapshots.steps()) if snapshots is not None else set()
+        task = parse_session_log(source.log_text())["task"]
+        if not task:
+            raise ValueError(f"{session_dir}: no 'Task:' line in full_session.log")
+
+        steps = []
+        for step in sorted(actions):
+            record = actions[step]
+            if not record.get("actions"):
+                raise ValueError(
+                    f"{session_dir}: step {step} has no recorded actions (sessions logged before actions were captured can't be replayed)"
+                )
+            output = {field: record[key] for key, field in _OUTPUT_FIELDS.items() if key in record}
+            output["action"] = record["actions"]
+            # The DOM as the model saw it: delta-encoded snapshots, the per-step dump, then the raw dom_text
+            dom_text = None
+            if snapshots is not None and step in snapshot_steps:
+                dom_text = snapshots.reconstruct(step)
+            if dom_text is None:
+                data = source.read_artifact(f"step_{step:03d}_llm_dom.txt")
+                dom_text = data.decode("utf-8", errors="replace") if data is not None else None
+            if dom_text is None:
+                dom_text = states.get(step, {}).get("dom_text") or ""
+            steps.append(macro_step(step, states.get(step, {}).get("url"), dom_text, output))
+    finally:
+        source.close()
+
+    if not steps:
+        raise ValueError(f"{session_dir}: no steps recorded")
+    return {"task": task, "key": task_key(task), "created": datetime.now().isoformat(), "session": session_dir.name, "steps": steps}
+
+
+class MacroStore:
+    """One JSON file per task under a directory"""
+
+    def __init__(self, path=MACROS_DIR):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, task: str) -> Path:
+        return self.path / f"{task_key(task)}.json"
+
+    def get(self, task: str) -> dict | None:
+        path = self._file(task)
+        if not path.exists():
+            return None
+        macro = json.loads(path.read_text(encoding="utf-8"))
+        # Guard against hash collisions between different tasks
+        return macro if task_key(macro["task"]) == task_key(task) else None
+
+    def save(self, macro: dict) -> Path:
+        path = self._file(macro["task"])
+        previous = self.get(macro["task"])
+        macro = {**macro, "replays": previous.get("replays", 0) if previous else 0}
+        tmp_path = path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(macro, ensure_ascii=False, indent=1), encoding="utf-8")
+        tmp_path.replace(path)
+        return path
+
+    def mark_replayed(self, task: str):
+        macro = self.get(task)
+        if macro is not None:
+            macro["replays"] = macro.get("replays", 0) + 1
+            macro["last_replayed"] = datetime.now().isoformat()
+            self._file(task).write_text(json.dumps(macro, ensure_ascii=False, indent=1), encoding="utf-8")
+
+    def list(self) -> list[dict]:
+        macros = []
+        for path in sorted(self.path.glob("*.json")):
+            macro = json.loads(path.read_text(encoding="utf-8"))
+            macros.append({
+                "key": macro["key"],
+                "task": macro["task"],
+                "steps": len(macro["steps"]),
+                "replays": macro.get("replays", 0),
+                "created": macro.get("created"),
+                "session": macro.get("session"),
+            })
+        return macros
+
+
+# ===== REPLAY =====
+
+class ReplayLLM:
+    """Chat model wrapper that answers agent steps from a macro while the page matches the recording"""
+
+    def __init__(self, llm, macro: dict, min_similarity: float = 0.5, on_event=None):
+        """
+        Args:
+            llm: Real chat model, used for non-step requests and after a divergence
+            macro: Recorded trace (MacroStore.get / macro_from_session)
+            min_similarity: Minimum DOM structure similarity (0-1) for a step to be replayed
+            on_event: Called with a dict for every replayed step and for the divergence
+        """
+        self.llm = llm
+        self.macro = macro
+        self.min_similarity = min_similarity
+        self.on_event = on_event
+        self.position = 0
+        self.diverged = None  # Reason the replay stopped, once it has
+        self._agent = None
+
+        # Counters
+        self.replayed_steps = 0
+        self.llm_steps = 0
+        self.passthrough_calls = 0
+
+    def __getattr__(self, name):
+        # model, provider, name, stats(), ... come from the wrapped model
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def bind(self, agent):
+        """Give the replay the Agent so action errors are read from its results instead of the prompt"""
+        self._agent = agent
+
+    def _previous_step_failed(self, state_text: str) -> bool:
+        if self._agent is not None and hasattr(self._agent, 'state'):
+            return any(getattr(result, "error", None) for result in (self._agent.state.last_result or []))
+        return last_step_failed(state_text)
+
+    @property
+    def completed(self) -> bool:
+        """Every recorded step was replayed without falling back"""
+        return self.diverged is None and self.position >= len(self.macro["steps"])
+
+    def _emit(self, event: dict):
+        if self.on_event is not None:
+            self.on_event(event)
+
+    def _state_text(self, messages) -> str:
+        for message in reversed(messages):
+            content = getattr(message, "content", None)
+            if isinstance(content, str):
+                text = content
+            elif content:
+                text = "".join(part.text for part in content if hasattr(part, 'text'))
+            else:
+                continue
+            if "<browser_state>" in text:
+                return text
+        return ""
+
+    def check(self, state_text: str, recorded: dict) -> str | None:
+        """Why the current page doesn't match a recorded step, or None if it does"""
+        if self.replayed_steps and self._previous_step_failed(state_text):
+            return "previous_action_failed"
+
+        match = _BROWSER_STATE.search(state_text)
+        browser_state = match.group(1) if match else ""
+        tabs = dict(_TAB.findall(browser_state))
+        current = _CURRENT_TAB.search(browser_state)
+        url = tabs.get(current.group(1)) if current else (next(iter(tabs.values())) if len(tabs) == 1 else None)
+        if url is not None and normalize_url(url) != normalize_url(recorded["url"]):
+            return f"url {url} != {recorded['url']}"
+
+        signatures = element_signatures(browser_state)
+        similarity = _similarity(Counter(signatures.values()), Counter(recorded["skeleton"]))
+        if similarity < self.min_similarity:
+            return f"dom similarity {similarity:.2f}"
+
+        for index, target in recorded["targets"].items():
+            index = int(index)
+            if signatures.get(index) != target["signature"]:
+                return f"element {index} is {signatures.get(index)}, recorded {target['signature']}"
+            context = _context(signatures, index)
+            if _similarity(Counter(context), Counter(target["context"])) < self.min_similarity:
+                return f"element {index} neighbourhood changed"
+        return None
+
+    async def ainvoke(self, messages, output_format=None):
+        is_step = output_format is not None and "action" in getattr(output_format, "model_fields", {})
+        if not is_step:
+            self.passthrough_calls += 1
+            return await self.llm.ainvoke(messages, output_format)
+
+        if self.diverged is None:
+            if self.position >= len(self.macro["steps"]):
+                self.diverged = "trace exhausted"
+            else:
+                recorded = self.macro["steps"][self.position]
+                reason = self.check(self._state_text(messages), recorded)
+                completion = None
+                if reason is None:
+                    try:
+                        completion = output_format.model_validate(recorded["output"])
+                    except Exception as e:
+                        reason = f"recorded output no longer validates: {e}"
+                if reason is None:
+                    self.position += 1
+                    self.replayed_steps += 1
+                    self._emit({"event": "replayed", "step": recorded["step"], "position": self.position})
+                    return ChatInvokeCompletion(completion=completion, usage=None)
+                self.diverged = reason
+            self._emit({"event": "diverged", "position": self.position, "reason": self.diverged})
+
+        self.llm_steps += 1
+        return await self.llm.ainvoke(messages, output_format)
+
+    def replay_stats(self) -> dict:
+        return {
+            "macro_steps": len(self.macro["steps"]),
+            "replayed_steps": self.replayed_steps,
+            "llm_steps": self.llm_steps,
+            "passthrough_calls": self.passthrough_calls,
+            "completed": self.completed,
+            "diverged": self.diverged,
+        }
+
+
+# ===== CLI =====
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Record and replay agent action traces")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    save_parser = sub.add_parser("save", help="Save a recorded session as the macro for its task")
+    save_parser.add_argument("session_dir", type=Path)
+    save_parser.add_argument("--macros", type=Path, default=MACROS_DIR)
+
+    list_parser = sub.add_parser("list", help="List stored macros")
+    list_parser.add_argument("--macros", type=Path, default=MACROS_DIR)
+
+    run_parser = sub.add_parser("run", help="Replay a recorded session's task (batch_runner options apply)")
+    run_parser.add_argument("session_dir", type=Path)
+
+    args, extra = parser.parse_known_args(argv)
+
+    if args.command == "save":
+        macro = macro_from_session(args.session_dir)
+        path = MacroStore(args.macros).save(macro)
+        print(f"✅ Saved {len(macro['steps'])} steps for task {macro['task']!r} to {path}")
+        return 0
+
+    if args.command == "list":
+        for entry in MacroStore(args.macros).list():
+            print(f"{entry['key']}  {entry['steps']:3d} steps  {entry['replays']:3d} replays  {entry['task']}")
+        return 0
+
+    from batch_runner import parse_args, run_batch
+
+    runner_args = parse_args(["-"] + extra)
+    runner_args.macros = runner_args.macros or MACROS_DIR
+    macro = macro_from_session(args.session_dir)
+    MacroStore(runner_args.macros).save(macro)
+    results = asyncio.run(run_batch(runner_args, [{"id": f"replay-{args.session_dir.name}", "task": macro["task"]}]))
+    return 0 if all(result["success"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
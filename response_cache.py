@@ -0,0 +1,250 @@
+"""
+On-disk LLM response cache for repeated agent steps.
+
+Agents often send the same state again: a stuck about:blank step after step,
+or the same Show HN page when a regression task is re-run. ResponseCache
+wraps a chat model and answers such requests from a SQLite file instead of
+calling the server.
+
+The key is a SHA-256 over a normalized view of the request, not the raw
+messages, so per-step noise doesn't defeat it:
+  - model name and output format
+  - the state message (task, file system, DOM representation, read state,
+    ...), whitespace-collapsed, with the "*" new-element markers removed and
+    <agent_history> cut down to its last `history_items` entries (parsed
+    with agent_history.py, so every browser_use history format counts)
+  - every other non-system message, e.g. a StallGuard hint or the context
+    messages browser_use adds after an error
+  - SHA-256 of each attached screenshot
+
+Only <step_info> (step number and date) is left out. The system prompt is
+left out too; it only changes with the browser_use release or the tools, and
+the model and output format already cover those. Requests that aren't agent
+state messages (no <user_request>) bypass the cache, as do requests made
+while bypass is set.
+
+Entries expire after ttl_seconds and the least recently used ones are evicted
+above max_entries. SQLite runs in a worker thread, not on the event loop. A
+hit's last_used/hits update is kept in memory and written with the next
+store (or on close), so hits don't commit. Counters (hits, misses, bypasses,
+...) are per instance, i.e. per session.
+
+Usage:
+    llm = ResponseCache(ChatOpenAI(model="gpt-4.1-mini"), "agent_logs/response_cache.sqlite")
+    agent = Agent(task=task, llm=llm)
+    print(llm.cache_stats())
+"""
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from browser_use.llm.views import ChatInvokeCompletion
+
+from agent_history import AGENT_HISTORY, history_items as parse_history_items
+
+_USER_REQUEST = re.compile(r"<user_request>(.*?)</user_request>", re.DOTALL)
+_STEP_INFO = re.compile(r"<step_info>.*?</step_info>", re.DOTALL)
+_MARKER = re.compile(r"(?m)^(\s*)\*(?=\[)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", _MARKER.sub(r"\1", text)).strip()
+
+
+def _parts(message) -> list:
+    content = getattr(message, "content", None)
+    if content is None:
+        return []
+    if isinstance(content, str):
+        return [content]
+    return list(content)
+
+
+def _state_key_text(state_text: str, history_items: int) -> str:
+    recent = parse_history_items(state_text)[-history_items:] if history_items else []
+    # A function replacement, so backslashes in the history aren't read as group references
+    text = AGENT_HISTORY.sub(lambda _: "<agent_history>\n" + "\n".join(recent) + "\n</agent_history>", state_text, count=1)
+    return _normalize(_STEP_INFO.sub("", text))
+
+
+def cache_key(model: str, messages: list, output_format=None, history_items: int = 3) -> str | None:
+    """Normalized request hash, or None if the request isn't an agent state request"""
+    message_texts = []
+    image_hashes = []
+    for message in messages:
+        if getattr(message, "role", None) == "system":
+            continue
+        texts = []
+        for part in _parts(message):
+            if isinstance(part, str):
+                texts.append(part)
+            elif hasattr(part, 'text'):
+                texts.append(part.text)
+            elif hasattr(part, 'image_url'):
+                url = getattr(part.image_url, "url", part.image_url)
+                image_hashes.append(hashlib.sha256(str(url).encode("utf-8")).hexdigest())
+        message_texts.append("\n".join(texts))
+
+    # The state message is the last one with the task; the others go into the key verbatim
+    state_index = next((i for i in reversed(range(len(message_texts))) if _USER_REQUEST.search(message_texts[i])), None)
+    if state_index is None:
+        return None
+
+    key = {
+        "model": model,
+        "format": getattr(output_format, "__name__", None),
+        "state": _state_key_text(message_texts[state_index], history_items),
+        "messages": [_normalize(text) for i, text in enumerate(message_texts) if i != state_index],
+        "screenshots": image_hashes,
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Chat model wrapper that serves repeated requests from SQLite"""
+
+    def __init__(
+        self,
+        llm,
+        path="agent_logs/response_cache.sqlite",
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 10000,
+        history_items: int = 3,
+    ):
+        """
+        Args:
+            llm: Wrapped chat model
+            path: SQLite file, shared between sessions
+            ttl_seconds: Entries older than this are ignored and removed
+            max_entries: Least recently used entries are evicted above this
+            history_items: How many trailing agent_history entries are part of the key
+        """
+        self.llm = llm
+        self.path = str(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.history_items = history_items
+        self.bypass = False  # Set to force fresh responses (still stored)
+
+        self._lock = threading.Lock()
+        self._touched = {}  # key -> (last_used, hits) of cache hits not written yet
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, created REAL, last_used REAL, hits INTEGER DEFAULT 0, completion TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self._db.commit()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.stores = 0
+        self.expired = 0
+        self.evictions = 0
+        self.decode_errors = 0
+
+    def __getattr__(self, name):
+        # model, provider, name, stats(), ... come from the wrapped model
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def _get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT created, completion FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[0] > self.ttl_seconds:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                self.expired += 1
+                return None
+            # Written with the next store or on close; a commit per hit would cost more than the hit saves
+            self._touched[key] = (now, self._touched.get(key, (now, 0))[1] + 1)
+            return row[1]
+
+    def _flush_touched(self):
+        # Caller holds the lock
+        if self._touched:
+            self._db.executemany(
+                "UPDATE responses SET last_used = ?, hits = hits + ? WHERE key = ?",
+                [(last_used, hits, key) for key, (last_used, hits) in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _put(self, key: str, completion: str):
+        now = time.time()
+        with self._lock:
+            self._flush_touched()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, created, last_used, hits, completion) VALUES (?, ?, ?, ?, 0, ?)",
+                (key, getattr(self.llm, "model", None), now, now, completion),
+            )
+            count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                excess = count - self.max_entries
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)", (excess,)
+                )
+                self.evictions += excess
+            self._db.commit()
+            self.stores += 1
+
+    async def ainvoke(self, messages, output_format=None):
+        key = cache_key(getattr(self.llm, "model", ""), messages, output_format, self.history_items)
+        if key is None or self.bypass:
+            self.bypasses += 1
+            return await self.llm.ainvoke(messages, output_format)
+
+        cached = await asyncio.to_thread(self._get, key)
+        if cached is not None:
+            try:
+                if output_format is not None:
+                    completion = output_format.model_validate_json(cached)
+                else:
+                    completion = json.loads(cached)
+                self.hits += 1
+                return ChatInvokeCompletion(completion=completion, usage=None)
+            except Exception:
+                # Output model changed since the entry was written
+                self.decode_errors += 1
+
+        self.misses += 1
+        result = await self.llm.ainvoke(messages, output_format)
+        completion = result.completion
+        if hasattr(completion, 'model_dump_json'):
+            await asyncio.to_thread(self._put, key, completion.model_dump_json())
+        else:
+            await asyncio.to_thread(self._put, key, json.dumps(completion))
+        return result
+
+    def cache_stats(self) -> dict:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypasses": self.bypasses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "stores": self.stores,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "decode_errors": self.decode_errors,
+            "entries": entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._db.commit()
+            self._db.close()
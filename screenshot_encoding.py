@@ -0,0 +1,191 @@
+"""
+Screenshot encoding stage for the logging pipeline.
+
+browser_state.screenshot is a full-resolution PNG of the viewport. Before it
+is stored, ScreenshotEncoder can:
+  - drop frames by sampling policy (keep every Nth frame, or only frames
+    where the URL or DOM changed since the last kept frame)
+  - downscale to a maximum dimension
+  - convert to grayscale
+  - re-encode as JPEG or WebP at a given quality
+
+Re-encoding runs in a process pool so compression never holds the GIL of the
+agent process, let alone the event loop. Everything except sampling needs
+Pillow.
+
+Usage:
+    encoder = ScreenshotEncoder(ScreenshotPolicy(max_dimension=1280, format="webp", quality=80))
+    if encoder.should_keep(step, url, dom_text):
+        data, ext = encoder.encode(png_bytes)       # from a worker thread
+        data, ext = await encoder.encode_async(png_bytes)  # from the event loop
+    print(encoder.stats())  # includes bytes_saved
+    encoder.close()
+"""
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+@dataclass
+class ScreenshotPolicy:
+    """How screenshots are sampled and encoded before storage. The defaults keep every frame as-is."""
+    max_dimension: int | None = None  # Longest side in pixels; None keeps the original size
+    format: str = "png"  # "png", "jpeg" or "webp"
+    quality: int = 80  # JPEG/WebP quality (ignored for PNG)
+    grayscale: bool = False
+    every_n: int = 1  # Keep only every Nth frame
+    only_on_change: bool = False  # Keep a frame only if the URL or DOM changed since the last kept frame
+
+    def reencodes(self) -> bool:
+        return self.max_dimension is not None or self.format != "png" or self.grayscale
+
+
+_EXTENSIONS = {"png": "png", "jpeg": "jpg", "webp": "webp"}
+
+
+def _encode_image(data: bytes, max_dimension: int | None, fmt: str, quality: int, grayscale: bool) -> bytes:
+    """Runs in a pool worker: decode, transform and re-encode one screenshot"""
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        if max_dimension and max(img.size) > max_dimension:
+            img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        if grayscale:
+            img = img.convert("L")
+        elif fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")  # JPEG has no alpha channel
+
+        out = io.BytesIO()
+        if fmt == "png":
+            img.save(out, format="PNG", optimize=True)
+        elif fmt == "jpeg":
+            img.save(out, format="JPEG", quality=quality, optimize=True)
+        else:
+            img.save(out, format="WEBP", quality=quality, method=4)
+        return out.getvalue()
+
+
+def _start_method() -> str:
+    """fork while the calling thread is the only one; forking a threaded process can deadlock the child"""
+    methods = multiprocessing.get_all_start_methods()
+    if "fork" in methods and threading.active_count() == 1:
+        return "fork"
+    return "forkserver" if "forkserver" in methods else "spawn"
+
+
+class ScreenshotEncoder:
+    """
+    Applies a ScreenshotPolicy and keeps byte counters for the session summary.
+
+    Create it before starting any other threads (e.g. before StepLogWriter.start()
+    or any server thread): the pool workers are then forked eagerly, while the
+    caller is the only thread. Created later, it falls back to a forkserver
+    (spawn where there is none), which re-imports the main module in each
+    worker, so the entry point must keep its work under `if __name__ == "__main__"`.
+    """
+
+    def __init__(self, policy: ScreenshotPolicy | None = None, max_workers: int = 2):
+        self.policy = policy or ScreenshotPolicy()
+        if self.policy.format not in _EXTENSIONS:
+            raise ValueError(f"Unknown screenshot format: {self.policy.format}")
+        if self.policy.every_n < 1:
+            raise ValueError("every_n must be >= 1")
+        if self.policy.reencodes() and Image is None:
+            raise RuntimeError("Screenshot downscaling/re-encoding requires Pillow (pip install pillow)")
+
+        self.extension = _EXTENSIONS[self.policy.format]
+
+        # Counters
+        self.frames_seen = 0
+        self.frames_sampled_out = 0
+        self.frames_encoded = 0
+        self.bytes_in = 0  # original PNG bytes of kept frames
+        self.bytes_out = 0  # encoded bytes of kept frames
+        self.bytes_skipped = 0  # approximate original bytes of frames dropped by sampling
+
+        self._lock = threading.Lock()
+        self._last_fingerprint = None
+        self._pool = None
+        if self.policy.reencodes():
+            self._pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(_start_method()))
+            # Start the workers now, while this may still be the only thread
+            for future in [self._pool.submit(int) for _ in range(max_workers)]:
+                future.result()
+
+    # ===== SAMPLING =====
+
+    def should_keep(self, step: int, url: str | None, dom_text: str | None, screenshot_b64: str | None = None) -> bool:
+        """Cheap sampling decision, safe to call on the event loop"""
+        with self._lock:
+            self.frames_seen += 1
+            keep = (self.frames_seen - 1) % self.policy.every_n == 0
+
+            if keep and self.policy.only_on_change:
+                fingerprint = hashlib.blake2b(f"{url}\0{dom_text or ''}".encode("utf-8"), digest_size=16).digest()
+                keep = fingerprint != self._last_fingerprint
+                if keep:
+                    self._last_fingerprint = fingerprint
+
+            if not keep:
+                self.frames_sampled_out += 1
+                if screenshot_b64:
+                    self.bytes_skipped += len(screenshot_b64) * 3 // 4
+            return keep
+
+    # ===== ENCODING =====
+
+    def encode(self, png_bytes: bytes) -> tuple[bytes, str]:
+        """Encode one frame, blocking the calling thread (never call this on the event loop)"""
+        if self._pool is None:
+            data = png_bytes
+        else:
+            policy = self.policy
+            data = self._pool.submit(
+                _encode_image, png_bytes, policy.max_dimension, policy.format, policy.quality, policy.grayscale
+            ).result()
+        self._count(png_bytes, data)
+        return data, self.extension
+
+    async def encode_async(self, png_bytes: bytes) -> tuple[bytes, str]:
+        """Encode one frame from the event loop without blocking it"""
+        if self._pool is None:
+            return self.encode(png_bytes)
+        policy = self.policy
+        data = await asyncio.get_running_loop().run_in_executor(
+            self._pool, _encode_image, png_bytes, policy.max_dimension, policy.format, policy.quality, policy.grayscale
+        )
+        self._count(png_bytes, data)
+        return data, self.extension
+
+    def _count(self, original: bytes, encoded: bytes):
+        with self._lock:
+            self.frames_encoded += 1
+            self.bytes_in += len(original)
+            self.bytes_out += len(encoded)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            original = self.bytes_in + self.bytes_skipped
+            return {
+                "frames_seen": self.frames_seen,
+                "frames_sampled_out": self.frames_sampled_out,
+                "frames_encoded": self.frames_encoded,
+                "format": self.policy.format,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "bytes_saved": original - self.bytes_out,
+                "ratio": round(self.bytes_out / original, 4) if original else None,
+            }
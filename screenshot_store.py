@@ -0,0 +1,163 @@
+"""
+Content-addressed screenshot store for a session.
+
+Instead of screenshots/step_NNN.png, every frame is stored once under
+screenshots/blobs/<sha256>.<ext> and each step gets a line in
+screenshots/index.jsonl pointing at its blob. Looping sessions (e.g. dozens
+of identical about:blank frames) then cost one blob plus a few index lines.
+
+With perceptual=True, frames whose difference hash (dHash) is within
+`threshold` bits of an already stored frame reuse that frame's blob too.
+Perceptual mode needs Pillow.
+
+Usage:
+    store = ScreenshotStore(session_log)
+    ref = store.put(step_number, image_bytes, ext="png")
+    ref.blob        # "screenshots/blobs/3f2a....png", relative to the session directory
+    store.load(step_number)
+"""
+import hashlib
+import io
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from session_logger import SessionLogger
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+@dataclass
+class ScreenshotRef:
+    """Index entry linking a step to the blob holding its screenshot"""
+    step: int
+    blob: str
+    sha256: str
+    bytes: int
+    dedup: str | None = None  # None (new blob), "exact" or "perceptual"
+    phash: str | None = None
+
+
+def dhash(image_bytes: bytes, hash_size: int = 8) -> int:
+    """Difference hash: compare neighbouring pixels of a tiny grayscale thumbnail"""
+    if Image is None:
+        raise RuntimeError("Perceptual hashing requires Pillow (pip install pillow)")
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        pixels = list(img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+class ScreenshotStore:
+    """
+    Deduplicating screenshot store backed by a SessionLogger.
+
+    Not thread-safe: call put() from a single writer (the StepLogWriter thread
+    or the step_callback itself).
+    """
+
+    BLOB_DIR = "screenshots/blobs"
+    INDEX = "screenshots/index.jsonl"
+
+    def __init__(self, session_log: SessionLogger, perceptual: bool = False, threshold: int = 4, hash_size: int = 8):
+        if perceptual and Image is None:
+            raise RuntimeError("ScreenshotStore(perceptual=True) requires Pillow (pip install pillow)")
+        self.session_log = session_log
+        self.perceptual = perceptual
+        self.threshold = threshold
+        self.hash_size = hash_size
+
+        self.refs: dict[int, ScreenshotRef] = {}
+        self._blobs: dict[str, str] = {}  # sha256 -> blob path
+        self._phashes: list[tuple[int, str, str]] = []  # (phash, sha256, blob path)
+
+        # Counters
+        self.frames = 0
+        self.bytes_in = 0
+        self.bytes_written = 0
+        self.exact_hits = 0
+        self.perceptual_hits = 0
+
+        self._load_index()
+
+    def _load_index(self):
+        """Resume an existing session directory so dedup keeps working across restarts"""
+        index_path = self.session_log.session_dir / self.INDEX
+        if not index_path.exists():
+            return
+        with open(index_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                ref = ScreenshotRef(**json.loads(line))
+                self.refs[ref.step] = ref
+                self._blobs.setdefault(ref.sha256, ref.blob)
+                if ref.phash is not None and ref.dedup is None:
+                    self._phashes.append((int(ref.phash, 16), ref.sha256, ref.blob))
+
+    def put(self, step: int, image_bytes: bytes, ext: str = "png") -> ScreenshotRef:
+        """Store a frame (or reuse an existing blob) and record the step's reference"""
+        self.frames += 1
+        self.bytes_in += len(image_bytes)
+        sha = hashlib.sha256(image_bytes).hexdigest()
+
+        ref = None
+        if sha in self._blobs:
+            self.exact_hits += 1
+            ref = ScreenshotRef(step, self._blobs[sha], sha, len(image_bytes), dedup="exact")
+
+        phash = None
+        if ref is None and self.perceptual:
+            phash = dhash(image_bytes, self.hash_size)
+            match = self._nearest(phash)
+            if match is not None:
+                self.perceptual_hits += 1
+                _, match_sha, match_blob = match
+                ref = ScreenshotRef(step, match_blob, match_sha, len(image_bytes), dedup="perceptual", phash=f"{phash:x}")
+
+        if ref is None:
+            blob = f"{self.BLOB_DIR}/{sha}.{ext}"
+            self.session_log.write_artifact(blob, image_bytes)
+            self.bytes_written += len(image_bytes)
+            self._blobs[sha] = blob
+            if phash is not None:
+                self._phashes.append((phash, sha, blob))
+            ref = ScreenshotRef(step, blob, sha, len(image_bytes), phash=f"{phash:x}" if phash is not None else None)
+
+        self.refs[step] = ref
+        self.session_log.write_jsonl(self.INDEX, asdict(ref))
+        return ref
+
+    def _nearest(self, phash: int):
+        best = None
+        best_distance = self.threshold + 1
+        for entry in self._phashes:
+            distance = (entry[0] ^ phash).bit_count()
+            if distance < best_distance:
+                best, best_distance = entry, distance
+        return best
+
+    def path(self, step: int) -> Path:
+        """Path of the blob holding a step's screenshot (inside session.bsa in archive mode)"""
+        return self.session_log.session_dir / self.refs[step].blob
+
+    def load(self, step: int) -> bytes:
+        return self.session_log.read_artifact(self.refs[step].blob)
+
+    def stats(self) -> dict:
+        return {
+            "frames": self.frames,
+            "unique_blobs": len(self._blobs),
+            "exact_hits": self.exact_hits,
+            "perceptual_hits": self.perceptual_hits,
+            "bytes_in": self.bytes_in,
+            "bytes_written": self.bytes_written,
+            "bytes_saved": self.bytes_in - self.bytes_written,
+        }
@@ -0,0 +1,664 @@
+"""
+Session analytics over agent_logs/.
+
+Scans every session under agent_logs/ (plain directories and session.bsa
+archives, old and new log layouts) in parallel and builds one table with a
+row per step:
+
+    session, model, task, step, timestamp, url, domain, title,
+    step_duration_s   time since the previous step (first step: since session start)
+    llm_ms, prompt_tokens, completion_tokens   from timings.jsonl, when present
+    dom_chars, dom_elements                    LLM DOM text size and element count
+    screenshot_bytes, html_bytes, step_bytes   stored bytes of the step's artifacts
+    actions, action_count                      action names the LLM chose
+    state_hash        fingerprint of the page (URL + DOM text, else the screenshot, else the title)
+    is_loop           same state and same actions as the previous step (no-op loop)
+
+The table is written as Parquet (or Arrow IPC for .arrow) with pyarrow, and
+as a SQLite table otherwise, so it can also be opened with DuckDB/pandas or
+the sqlite3 shell. With --incremental only sessions whose files changed
+since the last build are parsed again.
+
+Usage:
+    python session_analytics.py build                        # agent_logs -> agent_logs/steps.parquet
+    python session_analytics.py build agent_logs --out steps.sqlite --workers 8 --incremental
+    python session_analytics.py summary                      # p50/p95 step latency, loop rate, bytes/step per model
+    python session_analytics.py summary --by domain
+    python session_analytics.py loops --top 20               # sessions with the most no-op loop steps
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlparse
+
+from dom_delta import DOM_SNAPSHOTS, DomSnapshots
+from session_archive import ARCHIVE_NAME, SESSION_STEP, SessionArchive, step_from_name
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+LOGS_DIR = Path("agent_logs")
+
+# Column name -> (pyarrow type name, SQLite type)
+COLUMNS = {
+    "session": ("string", "TEXT"),
+    "session_signature": ("string", "TEXT"),
+    "model": ("string", "TEXT"),
+    "task": ("string", "TEXT"),
+    "step": ("int32", "INTEGER"),
+    "timestamp": ("string", "TEXT"),
+    "url": ("string", "TEXT"),
+    "domain": ("string", "TEXT"),
+    "title": ("string", "TEXT"),
+    "step_duration_s": ("float64", "REAL"),
+    "llm_ms": ("float64", "REAL"),
+    "prompt_tokens": ("int64", "INTEGER"),
+    "completion_tokens": ("int64", "INTEGER"),
+    "dom_chars": ("int64", "INTEGER"),
+    "dom_elements": ("int32", "INTEGER"),
+    "screenshot_bytes": ("int64", "INTEGER"),
+    "html_bytes": ("int64", "INTEGER"),
+    "step_bytes": ("int64", "INTEGER"),
+    "actions": ("list<string>", "TEXT"),  # JSON array in SQLite
+    "action_count": ("int32", "INTEGER"),
+    "state_hash": ("string", "TEXT"),
+    "is_loop": ("bool", "INTEGER"),
+}
+
+_LOG_LINE = re.compile(r"^\[(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d\.\d+)\] (.*)$")
+_MODEL_OUTPUTS = "all_model_outputs=["
+_IGNORED_ACTION_KEYS = {"interacted_element"}
+
+
+# ===== READING SESSIONS =====
+
+class SessionSource:
+    """Uniform access to a session directory or its session.bsa"""
+
+    def __init__(self, session_dir: Path):
+        self.session_dir = session_dir
+        archive_path = session_dir / ARCHIVE_NAME
+        self.archive = SessionArchive(archive_path) if archive_path.exists() else None
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+    def _read_jsonl_file(self, name: str) -> list[dict]:
+        path = self.session_dir / name
+        if not path.exists():
+            return []
+        records = []
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue  # Partially written last line
+        return records
+
+    def records(self, kind: str, name: str | None = None) -> list[dict]:
+        """actions ("action"), browser states ("browser_state") or any other JSONL file ("jsonl", name)"""
+        if self.archive is None:
+            file_name = {"action": "actions.jsonl", "browser_state": "browser_states.jsonl"}.get(kind, name)
+            return self._read_jsonl_file(file_name)
+        return [
+            json.loads(data)
+            for record, data in self.archive.iter_records(kind)
+            if name is None or record.name == name
+        ]
+
+    def log_text(self) -> str:
+        if self.archive is None:
+            path = self.session_dir / "full_session.log"
+            return path.read_text(encoding="utf-8", errors="replace") if path.exists() else ""
+        return b"".join(
+            data for record, data in self.archive.iter_records("log") if record.name == "full_session.log"
+        ).decode("utf-8", errors="replace")
+
+    def artifacts(self) -> dict[str, int]:
+        """Stored artifact name -> size in bytes (compressed size inside an archive)"""
+        if self.archive is not None:
+            return {record.name: record.length for record in self.archive.records if record.kind == "artifact"}
+        sizes = {}
+        for root, _, files in os.walk(self.session_dir):
+            for file_name in files:
+                path = Path(root) / file_name
+                sizes[path.relative_to(self.session_dir).as_posix()] = path.stat().st_size
+        return sizes
+
+    def read_artifact(self, name: str) -> bytes | None:
+        if self.archive is not None:
+            return self.archive.read_name(name)
+        path = self.session_dir / name
+        return path.read_bytes() if path.exists() else None
+
+
+def session_signature(session_dir: Path) -> str:
+    """Changes whenever a file directly in the session directory is written"""
+    parts = []
+    with os.scandir(session_dir) as entries:
+        for entry in entries:
+            stat = entry.stat()
+            parts.append(f"{entry.name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha256("\n".join(sorted(parts)).encode("utf-8")).hexdigest()[:16]
+
+
+def parse_session_log(text: str) -> dict:
+    info = {"model": None, "task": None, "start": None, "model_outputs": None}
+    for line in text.splitlines():
+        match = _LOG_LINE.match(line)
+        if not match:
+            continue
+        timestamp, message = match.groups()
+        if info["start"] is None:
+            info["start"] = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S.%f")
+        if info["model"] is None and message.startswith("Model: "):
+            info["model"] = message[len("Model: "):].strip()
+        elif info["task"] is None and message.startswith("Task: "):
+            info["task"] = message[len("Task: "):].strip()
+        elif message.startswith("Result: ") and _MODEL_OUTPUTS in message:
+            info["model_outputs"] = _top_level_keys(message[message.index(_MODEL_OUTPUTS) + len(_MODEL_OUTPUTS):])
+    return info
+
+
+def _top_level_keys(text: str) -> list[str]:
+    """First key of each dict in a repr()'d list: "{'click': {...}}, {'done': ...}]" -> ["click", "done"]"""
+    names = []
+    depth = 0
+    quote = None
+    escaped = False
+    expect_key = False
+    for index, char in enumerate(text):
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+            continue
+        if char in "'\"":
+            if expect_key:
+                end = text.find(char, index + 1)
+                names.append(text[index + 1:end])
+                expect_key = False
+            quote = char
+        elif char in "{[(":
+            depth += 1
+            expect_key = char == "{" and depth == 1
+        elif char in "}])":
+            depth -= 1
+            if depth < 0:
+                break
+        elif not char.isspace():
+            expect_key = False
+    return names
+
+
+def _balanced_end(text: str, start: int) -> int:
+    """Index just past the bracket that closes the one at text[start] (string-aware)"""
+    depth = 0
+    quote = None
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char in "{[(":
+            depth += 1
+        elif char in "}])":
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return len(text)
+
+
+def recorded_actions(log_text: str) -> list[dict]:
+    """
+    Actions with their parameters from the Result line of full_session.log, e.g.
+    [{"navigate": {"url": "https://news.ycombinator.com/show", "new_tab": False}}, {"click": {"index": 8}}]
+
+    Sessions logged before actions.jsonl captured actions only have them there.
+    Parameters that aren't Python literals are dropped.
+    """
+    result_line = next((line for line in log_text.splitlines() if "Result: " in line and _MODEL_OUTPUTS in line), None)
+    if result_line is None:
+        return []
+    text = result_line[result_line.index(_MODEL_OUTPUTS) + len(_MODEL_OUTPUTS):]
+    actions = []
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if char == "]":
+            break
+        if char != "{":
+            index += 1
+            continue
+        end = _balanced_end(text, index)
+        match = re.match(r"\{'(\w+)': ", text[index:end])
+        if match:
+            value_start = index + match.end()
+            value_end = _balanced_end(text, value_start) if text[value_start] in "{[(" else text.find(",", value_start)
+            try:
+                params = ast.literal_eval(text[value_start:value_end])
+            except (ValueError, SyntaxError):
+                params = {}
+            actions.append({match.group(1): params})
+        index = end
+    return actions
+
+
+def action_names(actions: list) -> list[str]:
+    """Action names from an actions.jsonl "actions" list (ActionModel.model_dump() dicts)"""
+    names = []
+    for action in actions or []:
+        if not isinstance(action, dict):
+            continue
+        if "name" in action:
+            names.append(str(action["name"]))
+            continue
+        for key, value in action.items():
+            if value is not None and key not in _IGNORED_ACTION_KEYS:
+                names.append(key)
+                break
+    return names
+
+
+def _parse_time(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _sha(data: bytes | str) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def session_rows(session_dir: Path) -> list[dict]:
+    """One row per step of a session; a session that can't be read yields no rows"""
+    session_dir = Path(session_dir)
+    source = SessionSource(session_dir)
+    try:
+        return _session_rows(session_dir, source)
+    finally:
+        source.close()
+
+
+def _session_rows(session_dir: Path, source: SessionSource) -> list[dict]:
+    states = {record["step"]: record for record in source.records("browser_state") if "step" in record}
+    actions = {record["step"]: record for record in source.records("action") if "step" in record}
+    timings = {}
+    for record in source.records("jsonl", "timings.jsonl"):
+        timings[record.get("agent_step", record.get("step"))] = record
+    screenshot_index = {record["step"]: record for record in source.records("jsonl", "screenshots/index.jsonl")}
+    dom_records = source.records("jsonl", DOM_SNAPSHOTS)
+    dom_snapshots = DomSnapshots(dom_records) if dom_records else None
+    dom_steps = set(dom_snapshots.steps()) if dom_snapshots else set()
+    artifacts = source.artifacts()
+    log = parse_session_log(source.log_text())
+    signature = session_signature(session_dir)
+
+    artifact_bytes = {}
+    for name, size in artifacts.items():
+        step = step_from_name(name)
+        if step != SESSION_STEP:
+            artifact_bytes[step] = artifact_bytes.get(step, 0) + size
+
+    steps = sorted(set(states) | set(actions))
+    # Old sessions never logged their actions; the final Result line lists them in order
+    fallback_actions = log["model_outputs"] if log["model_outputs"] and len(log["model_outputs"]) == len(steps) else None
+
+    rows = []
+    previous = None
+    previous_time = log["start"]
+    for position, step in enumerate(steps):
+        state = states.get(step, {})
+        action = actions.get(step, {})
+        timing = timings.get(step, {})
+        url = state.get("url")
+
+        # DOM text: inline (old layout), delta-encoded snapshots, or a per-step file
+        dom_text = state.get("dom_text")
+        if dom_text is None and step in dom_steps:
+            dom_text = dom_snapshots.reconstruct(step)
+        if dom_text is None and f"step_{step:03d}_llm_dom.txt" in artifacts:
+            data = source.read_artifact(f"step_{step:03d}_llm_dom.txt")
+            dom_text = data.decode("utf-8", errors="replace") if data is not None else None
+
+        screenshot_bytes = None
+        screenshot_hash = None
+        # Deduplicated blobs aren't named after a step, so their bytes are added to the step separately
+        blob_screenshot = step in screenshot_index
+        if blob_screenshot:
+            screenshot_bytes = screenshot_index[step].get("bytes")
+            screenshot_hash = screenshot_index[step].get("sha256")
+        else:
+            for name in (f"screenshots/step_{step:03d}.png", f"screenshots/step_{step:03d}.webp", f"screenshots/step_{step:03d}.jpeg"):
+                if name in artifacts:
+                    screenshot_bytes = artifacts[name]
+                    if dom_text is None:
+                        # Only hashed when there is no DOM text to fingerprint the page with
+                        data = source.read_artifact(name)
+                        screenshot_hash = _sha(data) if data is not None else None
+                    break
+
+        if dom_text is not None:
+            state_hash = _sha(f"{url}\n{dom_text}")
+        elif screenshot_hash is not None:
+            state_hash = _sha(f"{url}\n{screenshot_hash}")
+        elif url is not None:
+            # Nothing captured (e.g. stuck on about:blank): URL and title are all we have
+            state_hash = _sha(f"{url}\n{state.get('title')}")
+        else:
+            state_hash = None
+
+        names = action_names(action.get("actions"))
+        if not names and fallback_actions:
+            names = [fallback_actions[position]]
+
+        timestamp = state.get("timestamp") or action.get("timestamp")
+        step_time = _parse_time(timestamp)
+        duration = (step_time - previous_time).total_seconds() if step_time and previous_time else None
+        if timing.get("duration_ms") is not None:
+            duration = timing["duration_ms"] / 1000
+        llm_calls = timing.get("llm_calls") or []
+
+        is_loop = (
+            previous is not None
+            and state_hash is not None
+            and state_hash == previous["state_hash"]
+            and names == previous["actions"]
+        )
+        row = {
+            "session": session_dir.name,
+            "session_signature": signature,
+            "model": log["model"],
+            "task": log["task"],
+            "step": step,
+            "timestamp": timestamp,
+            "url": url,
+            "domain": urlparse(url).hostname if url else None,
+            "title": state.get("title"),
+            "step_duration_s": round(duration, 3) if duration is not None else None,
+            "llm_ms": timing.get("spans", {}).get("llm"),
+            "prompt_tokens": sum(call.get("prompt_tokens") or 0 for call in llm_calls) if llm_calls else None,
+            "completion_tokens": sum(call.get("completion_tokens") or 0 for call in llm_calls) if llm_calls else None,
+            "dom_chars": len(dom_text) if dom_text is not None else None,
+            "dom_elements": state.get("dom_items_count"),
+            "screenshot_bytes": screenshot_bytes,
+            "html_bytes": artifacts.get(f"step_{step:03d}_full_page.html"),
+            "step_bytes": artifact_bytes.get(step, 0) + (screenshot_bytes or 0 if blob_screenshot else 0),
+            "actions": names,
+            "action_count": len(names),
+            "state_hash": state_hash,
+            "is_loop": is_loop,
+        }
+        rows.append(row)
+        previous = row
+        if step_time:
+            previous_time = step_time
+    return rows
+
+
+def find_sessions(logs_dir: Path) -> list[Path]:
+    """Session directories: anything holding a session log, actions.jsonl or session.bsa"""
+    sessions = []
+    for root, dirs, files in os.walk(logs_dir):
+        if ARCHIVE_NAME in files or "browser_states.jsonl" in files or "actions.jsonl" in files:
+            sessions.append(Path(root))
+            dirs[:] = []  # Don't descend into screenshots/ etc.
+    return sorted(sessions)
+
+
+# ===== TABLE STORAGE =====
+
+def _arrow_type(name: str):
+    if name == "list<string>":
+        return pa.list_(pa.string())
+    return getattr(pa, name)()
+
+
+def write_table(rows: list[dict], path: Path) -> Path:
+    """Write rows as Parquet/Arrow (needs pyarrow) or SQLite; returns the path actually written"""
+    path = Path(path)
+    if path.suffix in (".parquet", ".arrow") and pa is None:
+        path = path.with_suffix(".sqlite")
+        print(f"⚠️ pyarrow not installed, writing {path} instead")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+
+    if path.suffix in (".parquet", ".arrow"):
+        schema = pa.schema([(name, _arrow_type(arrow_type)) for name, (arrow_type, _) in COLUMNS.items()])
+        table = pa.Table.from_pylist(rows, schema=schema)
+        if path.suffix == ".parquet":
+            pq.write_table(table, tmp_path, compression="zstd")
+        else:
+            with pa.OSFile(str(tmp_path), "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+                writer.write_table(table)
+    else:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        db = sqlite3.connect(tmp_path)
+        db.execute(f"CREATE TABLE steps ({', '.join(f'{name} {sql_type}' for name, (_, sql_type) in COLUMNS.items())})")
+        db.executemany(
+            f"INSERT INTO steps VALUES ({', '.join('?' for _ in COLUMNS)})",
+            ([json.dumps(row[name]) if name == "actions" else row[name] for name in COLUMNS] for row in rows),
+        )
+        db.execute("CREATE INDEX steps_model ON steps(model)")
+        db.execute("CREATE INDEX steps_session ON steps(session)")
+        db.commit()
+        db.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_table(path: Path, columns: list[str] | None = None) -> dict[str, list]:
+    """Load (some) columns as {name: list}; only the requested columns are read"""
+    path = Path(path)
+    columns = columns or list(COLUMNS)
+    if path.suffix in (".parquet", ".arrow"):
+        if pa is None:
+            raise SystemExit(f"pyarrow is needed to read {path}")
+        if path.suffix == ".parquet":
+            table = pq.read_table(path, columns=columns)
+        else:
+            with pa.memory_map(str(path)) as source:
+                table = pa.ipc.open_file(source).read_all().select(columns)
+        return table.to_pydict()
+
+    db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        result = {name: [] for name in columns}
+        for values in db.execute(f"SELECT {', '.join(columns)} FROM steps"):
+            for name, value in zip(columns, values):
+                if name == "actions":
+                    value = json.loads(value) if value else []
+                elif name == "is_loop":
+                    value = bool(value)
+                result[name].append(value)
+        return result
+    finally:
+        db.close()
+
+
+def default_table_path(logs_dir: Path) -> Path:
+    for suffix in (".parquet", ".arrow", ".sqlite"):
+        path = Path(logs_dir) / f"steps{suffix}"
+        if path.exists():
+            return path
+    return Path(logs_dir) / ("steps.parquet" if pa is not None else "steps.sqlite")
+
+
+# ===== BUILD =====
+
+def build(logs_dir: Path, out: Path, workers: int | None = None, incremental: bool = False) -> tuple[Path, dict]:
+    sessions = find_sessions(logs_dir)
+    reused = {}
+    if incremental and out.exists():
+        try:
+            previous = read_table(out)
+        except Exception as e:
+            print(f"⚠️ Could not read {out} ({e}), rebuilding everything")
+            previous = None
+        if previous:
+            signatures = {session.name: session_signature(session) for session in sessions}
+            for index, session in enumerate(previous["session"]):
+                if signatures.get(session) == previous["session_signature"][index]:
+                    reused.setdefault(session, []).append({name: previous[name][index] for name in COLUMNS})
+
+    todo = [session for session in sessions if session.name not in reused]
+    rows = [row for session_rows_ in reused.values() for row in session_rows_]
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {session: executor.submit(session_rows, session) for session in todo}
+        for session, future in futures.items():
+            try:
+                rows.extend(future.result())
+            except Exception as e:
+                failed.append(session.name)
+                print(f"⚠️ {session}: {type(e).__name__}: {e}")
+    rows.sort(key=lambda row: (row["session"], row["step"]))
+    path = write_table(rows, out)
+    return path, {
+        "sessions": len(sessions),
+        "parsed": len(todo) - len(failed),
+        "reused": len(reused),
+        "failed": len(failed),
+        "rows": len(rows),
+    }
+
+
+# ===== QUERIES =====
+
+def _percentile(values: list[float], percentile: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percentile / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(table: dict[str, list], by: str = "model") -> list[dict]:
+    """Per-group step latency percentiles, loop rate and bytes per step"""
+    groups = {}
+    for index, key in enumerate(table[by]):
+        groups.setdefault(key, []).append(index)
+
+    summary = []
+    for key, indexes in sorted(groups.items(), key=lambda item: -len(item[1])):
+        durations = [table["step_duration_s"][i] for i in indexes if table["step_duration_s"][i] is not None]
+        step_bytes = [table["step_bytes"][i] or 0 for i in indexes]
+        dom_chars = [table["dom_chars"][i] for i in indexes if table["dom_chars"][i] is not None]
+        loops = sum(1 for i in indexes if table["is_loop"][i])
+        summary.append({
+            by: key,
+            "sessions": len({table["session"][i] for i in indexes}),
+            "steps": len(indexes),
+            "p50_step_s": _percentile(durations, 50),
+            "p95_step_s": _percentile(durations, 95),
+            "loop_rate": round(loops / len(indexes), 4),
+            "bytes_per_step": round(sum(step_bytes) / len(indexes)),
+            "dom_chars_avg": round(sum(dom_chars) / len(dom_chars)) if dom_chars else None,
+        })
+    return summary
+
+
+def loop_sessions(table: dict[str, list], top: int = 20) -> list[dict]:
+    sessions = {}
+    for index, session in enumerate(table["session"]):
+        entry = sessions.setdefault(session, {"session": session, "model": table["model"][index], "steps": 0, "loop_steps": 0})
+        entry["steps"] += 1
+        entry["loop_steps"] += bool(table["is_loop"][index])
+    ranked = sorted((entry for entry in sessions.values() if entry["loop_steps"]), key=lambda entry: -entry["loop_steps"])
+    for entry in ranked:
+        entry["loop_rate"] = round(entry["loop_steps"] / entry["steps"], 4)
+    return ranked[:top]
+
+
+def _print_rows(rows: list[dict]):
+    if not rows:
+        print("(no rows)")
+        return
+    headers = list(rows[0])
+    cells = [[("" if row[h] is None else str(row[h])) for h in headers] for row in rows]
+    widths = [max(len(h), *(len(line[i]) for line in cells)) for i, h in enumerate(headers)]
+    print("  ".join(h.ljust(w) for h, w in zip(headers, widths)))
+    for line in cells:
+        print("  ".join(cell.ljust(w) for cell, w in zip(line, widths)))
+
+
+# ===== CLI =====
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-step analytics over agent_logs sessions")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = sub.add_parser("build", help="Scan sessions and write the step table")
+    build_parser.add_argument("logs_dir", type=Path, nargs="?", default=LOGS_DIR)
+    build_parser.add_argument("--out", type=Path, help="steps.parquet / steps.arrow / steps.sqlite (default: in logs_dir)")
+    build_parser.add_argument("--workers", type=int, help="Parser processes (default: CPU count)")
+    build_parser.add_argument("--incremental", action="store_true", help="Reuse rows of sessions that haven't changed")
+
+    for name, help_text in (("summary", "Latency, loop rate and bytes per step by group"), ("loops", "Sessions with the most no-op loop steps")):
+        query_parser = sub.add_parser(name, help=help_text)
+        query_parser.add_argument("table", type=Path, nargs="?", help="Step table (default: agent_logs/steps.*)")
+        query_parser.add_argument("--json", action="store_true", help="Print JSON instead of a text table")
+        if name == "summary":
+            query_parser.add_argument("--by", default="model", choices=["model", "domain", "session", "task"])
+        else:
+            query_parser.add_argument("--top", type=int, default=20)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        out = args.out or default_table_path(args.logs_dir)
+        path, stats = build(args.logs_dir, out, workers=args.workers, incremental=args.incremental)
+        print(f"✅ {path}: {stats}")
+        return 0
+
+    table_path = args.table or default_table_path(LOGS_DIR)
+    if not table_path.exists():
+        print(f"❌ {table_path} not found; run: python session_analytics.py build", file=sys.stderr)
+        return 1
+    if args.command == "summary":
+        columns = ["session", "step_duration_s", "step_bytes", "dom_chars", "is_loop"]
+        table = read_table(table_path, columns + ([args.by] if args.by not in columns else []))
+        rows = summarize(table, args.by)
+    else:
+        table = read_table(table_path, ["session", "model", "is_loop"])
+        rows = loop_sessions(table, args.top)
+    if args.json:
+        print(json.dumps(rows, indent=2, ensure_ascii=False))
+    else:
+        _print_rows(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
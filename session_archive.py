@@ -0,0 +1,464 @@
+"""
+Single-file session archive (session.bsa).
+
+One append-only container per session replaces actions.jsonl,
+browser_states.jsonl, full_session.log, screenshots/ and the per-step
+step_NNN_*.html / step_NNN_*.txt files.
+
+Layout:
+    header   MAGIC (8 bytes) + codec id (1 byte)
+    records  REC_MARKER, compressed length, crc32, step  (<4sIIi)
+             followed by the compressed payload:
+             meta length (<H) + meta JSON {"kind", "name"} + data
+    footer   compressed JSON index of every record, then
+             index offset, index length, FOOTER_MAGIC  (<QI8s)
+
+Records are compressed individually with zstd (zlib if the zstandard
+package is missing), so any record can be read with one seek. The index
+footer is written on close; an archive left without one (crash) is
+rebuilt by scanning the records, and reopening for append drops the old
+footer and writes a new one on the next close.
+
+Usage:
+    with SessionArchiveWriter(SESSION_DIR / "session.bsa") as archive:
+        archive.append(3, "action", json_bytes)
+        archive.append(3, "artifact", png_bytes, name="screenshots/step_003.png")
+
+    archive = SessionArchive("agent_logs/20251024_150203/session.bsa")
+    for step in archive.iter_steps():          # lazy, one step at a time
+        print(step.step, step.browser_state()["url"])
+    html = archive.read(3, "artifact", "step_003_full_page.html")
+
+    # Migrate existing agent_logs/<timestamp>/ directories
+    python session_archive.py convert agent_logs/20251024_150203
+    python session_archive.py convert --all agent_logs --remove-source
+    python session_archive.py info agent_logs/20251024_150203/session.bsa
+"""
+import argparse
+import json
+import os
+import re
+import struct
+import sys
+import threading
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+MAGIC = b"BUSARCH1"
+FOOTER_MAGIC = b"BUSAIDX1"
+REC_MARKER = b"REC1"
+ARCHIVE_NAME = "session.bsa"
+
+CODEC_ZSTD = 1
+CODEC_ZLIB = 2
+
+_HEADER = struct.Struct("<8sB")
+_RECORD = struct.Struct("<4sIIi")
+_FOOTER = struct.Struct("<QI8s")
+_META_LEN = struct.Struct("<H")
+
+SESSION_STEP = -1  # Records that belong to the whole session rather than one step
+
+_STEP_IN_NAME = re.compile(r"step_(\d+)")
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _compressor(codec: int, level: int):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ArchiveError("Archive uses zstd but the zstandard package is not installed (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=level).compress
+    return lambda data: zlib.compress(data, level)
+
+
+def _decompressor(codec: int):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ArchiveError("Archive uses zstd but the zstandard package is not installed (pip install zstandard)")
+        return zstandard.ZstdDecompressor().decompress
+    if codec == CODEC_ZLIB:
+        return zlib.decompress
+    raise ArchiveError(f"Unknown archive codec: {codec}")
+
+
+def step_from_name(name: str) -> int:
+    """Step number encoded in an artifact name like step_003_full_page.html, else SESSION_STEP"""
+    match = _STEP_IN_NAME.search(name)
+    return int(match.group(1)) if match else SESSION_STEP
+
+
+@dataclass
+class ArchiveRecord:
+    """Index entry for one record; data is only read on demand"""
+    step: int
+    kind: str
+    name: str
+    offset: int  # offset of the record header
+    length: int  # compressed payload length
+
+    def to_json(self) -> list:
+        return [self.step, self.kind, self.name, self.offset, self.length]
+
+    @classmethod
+    def from_json(cls, entry: list) -> "ArchiveRecord":
+        return cls(*entry)
+
+
+def _read_header(f) -> int:
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size or header[:8] != MAGIC:
+        raise ArchiveError("Not a session archive")
+    return _HEADER.unpack(header)[1]
+
+
+def _read_footer(f, codec: int) -> tuple[list[ArchiveRecord], int] | None:
+    """Return (index, index offset) if the archive ends with a valid footer"""
+    size = f.seek(0, os.SEEK_END)
+    if size < _HEADER.size + _FOOTER.size:
+        return None
+    f.seek(size - _FOOTER.size)
+    index_offset, index_length, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+    if magic != FOOTER_MAGIC or index_offset + index_length + _FOOTER.size != size:
+        return None
+    f.seek(index_offset)
+    entries = json.loads(_decompressor(codec)(f.read(index_length)))
+    return [ArchiveRecord.from_json(entry) for entry in entries], index_offset
+
+
+def _scan_records(f, codec: int) -> tuple[list[ArchiveRecord], int]:
+    """Rebuild the index by walking the records; returns (index, end of last complete record)"""
+    decompress = _decompressor(codec)
+    records = []
+    offset = _HEADER.size
+    f.seek(offset)
+    while True:
+        header = f.read(_RECORD.size)
+        if len(header) < _RECORD.size:
+            break
+        marker, length, crc, step = _RECORD.unpack(header)
+        if marker != REC_MARKER:
+            break
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break  # Torn write at the end of a crashed session
+        raw = decompress(payload)
+        (meta_length,) = _META_LEN.unpack_from(raw)
+        meta = json.loads(raw[_META_LEN.size:_META_LEN.size + meta_length])
+        records.append(ArchiveRecord(step, meta["kind"], meta["name"], offset, length))
+        offset += _RECORD.size + length
+    return records, offset
+
+
+class SessionArchiveWriter:
+    """Append-only writer for a session archive. Thread-safe."""
+
+    def __init__(self, path: Path, level: int = 6, codec: int | None = None):
+        self.path = Path(path)
+        self.records: list[ArchiveRecord] = []
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._lock = threading.Lock()
+
+        if self.path.exists() and self.path.stat().st_size:
+            self._f = open(self.path, "r+b")
+            self.codec = _read_header(self._f)
+            footer = _read_footer(self._f, self.codec)
+            if footer:
+                self.records, end = footer
+            else:
+                self.records, end = _scan_records(self._f, self.codec)
+            self._f.seek(end)
+            self._f.truncate()
+        else:
+            self.codec = codec or (CODEC_ZSTD if zstandard is not None else CODEC_ZLIB)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._f = open(self.path, "w+b")
+            self._f.write(_HEADER.pack(MAGIC, self.codec))
+
+        self._compress = _compressor(self.codec, level)
+        self._decompress = _decompressor(self.codec)
+        self._closed = False
+
+    def append(self, step: int, kind: str, data: bytes | str, name: str = "") -> ArchiveRecord:
+        """Append one record. kind is e.g. "action", "browser_state", "artifact", "log"."""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        meta = json.dumps({"kind": kind, "name": name}).encode("utf-8")
+        with self._lock:
+            if self._closed:
+                raise ArchiveError("Archive is closed")
+            # Compressor objects are not safe for concurrent use, so compress under the lock
+            payload = self._compress(_META_LEN.pack(len(meta)) + meta + data)
+            offset = self._f.tell()
+            self._f.write(_RECORD.pack(REC_MARKER, len(payload), zlib.crc32(payload), step))
+            self._f.write(payload)
+            record = ArchiveRecord(step, kind, name, offset, len(payload))
+            self.records.append(record)
+            self.bytes_in += len(data)
+            self.bytes_out += _RECORD.size + len(payload)
+        return record
+
+    def read(self, name: str) -> bytes | None:
+        """Read back the latest record with this name (e.g. a screenshot blob)"""
+        with self._lock:
+            for record in reversed(self.records):
+                if record.name == name:
+                    end = self._f.tell()
+                    try:
+                        self._f.seek(record.offset + _RECORD.size)
+                        return _split_payload(self._decompress(self._f.read(record.length)))[1]
+                    finally:
+                        self._f.seek(end)
+        return None
+
+    def flush(self):
+        with self._lock:
+            self._f.flush()
+
+    def close(self):
+        """Write the index footer and close the file"""
+        with self._lock:
+            if self._closed:
+                return
+            index = self._compress(json.dumps([r.to_json() for r in self.records]).encode("utf-8"))
+            index_offset = self._f.tell()
+            self._f.write(index)
+            self._f.write(_FOOTER.pack(index_offset, len(index), FOOTER_MAGIC))
+            self._f.close()
+            self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def stats(self) -> dict:
+        return {
+            "records": len(self.records),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+        }
+
+
+def _split_payload(raw: bytes) -> tuple[dict, bytes]:
+    (meta_length,) = _META_LEN.unpack_from(raw)
+    start = _META_LEN.size + meta_length
+    return json.loads(raw[_META_LEN.size:start]), raw[start:]
+
+
+class ArchivedStep:
+    """Lazy view of one step's records"""
+
+    def __init__(self, archive: "SessionArchive", step: int, records: list[ArchiveRecord]):
+        self.archive = archive
+        self.step = step
+        self.records = records
+
+    def read(self, kind: str, name: str | None = None) -> bytes | None:
+        for record in self.records:
+            if record.kind == kind and (name is None or record.name == name):
+                return self.archive.read_record(record)
+        return None
+
+    def _json(self, kind: str) -> dict | None:
+        data = self.read(kind)
+        return json.loads(data) if data is not None else None
+
+    def browser_state(self) -> dict | None:
+        return self._json("browser_state")
+
+    def action(self) -> dict | None:
+        return self._json("action")
+
+    def artifacts(self) -> list[str]:
+        return [record.name for record in self.records if record.kind == "artifact"]
+
+
+class SessionArchive:
+    """Random-access reader for a session archive"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._f = open(self.path, "rb")
+        self._lock = threading.Lock()
+        self.codec = _read_header(self._f)
+        self._decompress = _decompressor(self.codec)
+        footer = _read_footer(self._f, self.codec)
+        self.complete = footer is not None
+        self.records = footer[0] if footer else _scan_records(self._f, self.codec)[0]
+
+        self._by_step: dict[int, list[ArchiveRecord]] = {}
+        for record in self.records:
+            self._by_step.setdefault(record.step, []).append(record)
+
+    def steps(self) -> list[int]:
+        return sorted(step for step in self._by_step if step != SESSION_STEP)
+
+    def step(self, step: int) -> ArchivedStep:
+        return ArchivedStep(self, step, self._by_step.get(step, []))
+
+    def iter_steps(self):
+        """Yield ArchivedStep views in step order; record data is read only when asked for"""
+        for step in self.steps():
+            yield self.step(step)
+
+    def iter_records(self, kind: str | None = None):
+        """Yield (record, data) in write order, decompressing one record at a time"""
+        for record in self.records:
+            if kind is None or record.kind == kind:
+                yield record, self.read_record(record)
+
+    def read_record(self, record: ArchiveRecord) -> bytes:
+        with self._lock:
+            self._f.seek(record.offset + _RECORD.size)
+            payload = self._f.read(record.length)
+        return _split_payload(self._decompress(payload))[1]
+
+    def read(self, step: int, kind: str, name: str | None = None) -> bytes | None:
+        return self.step(step).read(kind, name)
+
+    def read_name(self, name: str) -> bytes | None:
+        """Read the latest record with this name regardless of step (e.g. a screenshot blob)"""
+        for record in reversed(self.records):
+            if record.name == name:
+                return self.read_record(record)
+        return None
+
+    def screenshot(self, step: int) -> bytes | None:
+        """Screenshot of a step, following the screenshot store index if the session used one"""
+        data = self.read_name(f"screenshots/step_{step:03d}.png")
+        if data is not None:
+            return data
+        index_entry = self.step(step).read("jsonl", "screenshots/index.jsonl")
+        if index_entry is not None:
+            return self.read_name(json.loads(index_entry)["blob"])
+        state = self.step(step).browser_state()
+        if state and state.get("screenshot"):
+            return self.read_name(state["screenshot"])
+        return None
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ===== CONVERTER =====
+
+_JSONL_KINDS = {"actions.jsonl": "action", "browser_states.jsonl": "browser_state"}
+
+
+def convert_session_dir(session_dir: Path, remove_source: bool = False, level: int = 6) -> Path:
+    """Pack an agent_logs/<timestamp>/ directory into <timestamp>/session.bsa"""
+    session_dir = Path(session_dir)
+    archive_path = session_dir / ARCHIVE_NAME
+    if archive_path.exists():
+        raise ArchiveError(f"{archive_path} already exists")
+
+    tmp_path = archive_path.with_suffix(".bsa.tmp")
+    # Left over from a failed convert; appending to it would duplicate its records
+    tmp_path.unlink(missing_ok=True)
+    sources = sorted(
+        p for p in session_dir.rglob("*") if p.is_file() and p.name not in (ARCHIVE_NAME, tmp_path.name, ".DS_Store")
+    )
+    with SessionArchiveWriter(tmp_path, level=level) as archive:
+        for path in sources:
+            name = path.relative_to(session_dir).as_posix()
+            if name in _JSONL_KINDS:
+                kind = _JSONL_KINDS[name]
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            archive.append(json.loads(line).get("step", SESSION_STEP), kind, line.rstrip("\n"))
+            elif name.endswith(".jsonl"):
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            archive.append(json.loads(line).get("step", SESSION_STEP), "jsonl", line.rstrip("\n"), name=name)
+            elif name == "full_session.log":
+                archive.append(SESSION_STEP, "log", path.read_bytes(), name=name)
+            else:
+                archive.append(step_from_name(name), "artifact", path.read_bytes(), name=name)
+    os.replace(tmp_path, archive_path)
+
+    if remove_source:
+        # Only delete what we can read back
+        with SessionArchive(archive_path) as check:
+            names = {record.name for record in check.records}
+            kinds = {record.kind for record in check.records}
+        for path in sources:
+            name = path.relative_to(session_dir).as_posix()
+            if name in names or _JSONL_KINDS.get(name) in kinds:
+                path.unlink()
+        for directory in sorted((p for p in session_dir.rglob("*") if p.is_dir()), reverse=True):
+            if not any(directory.iterdir()):
+                directory.rmdir()
+    return archive_path
+
+
+def _dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file() and p.name != ARCHIVE_NAME)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Session archive tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    convert = sub.add_parser("convert", help="Pack agent_logs/<timestamp>/ directories into session.bsa")
+    convert.add_argument("sessions", nargs="*", type=Path, help="Session directories to convert")
+    convert.add_argument("--all", type=Path, metavar="LOGS_DIR", help="Convert every session under LOGS_DIR")
+    convert.add_argument("--remove-source", action="store_true", help="Delete the original files after packing")
+    convert.add_argument("--level", type=int, default=6, help="Compression level")
+
+    info = sub.add_parser("info", help="Summarize an archive")
+    info.add_argument("archive", type=Path)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        sessions = list(args.sessions)
+        if args.all:
+            sessions += sorted(p for p in args.all.iterdir() if p.is_dir())
+        for session_dir in sessions:
+            if (session_dir / ARCHIVE_NAME).exists():
+                print(f"Skipping {session_dir}: already archived")
+                continue
+            before = _dir_size(session_dir)
+            try:
+                archive_path = convert_session_dir(session_dir, args.remove_source, args.level)
+            except Exception as e:
+                print(f"Error converting {session_dir}: {e}", file=sys.stderr)
+                continue
+            after = archive_path.stat().st_size
+            print(f"{session_dir}: {before:,} bytes -> {after:,} bytes ({archive_path})")
+
+    elif args.command == "info":
+        with SessionArchive(args.archive) as archive:
+            kinds = {}
+            for record in archive.records:
+                kinds[record.kind] = kinds.get(record.kind, 0) + 1
+            print(f"Archive: {args.archive}")
+            print(f"Codec: {'zstd' if archive.codec == CODEC_ZSTD else 'zlib'}")
+            print(f"Complete (has index footer): {archive.complete}")
+            print(f"Records: {len(archive.records)} {kinds}")
+            print(f"Steps: {archive.steps()}")
+
+
+if __name__ == "__main__":
+    main()
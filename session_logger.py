@@ -0,0 +1,223 @@
+"""
+Session logger that owns the files of one agent_logs/<timestamp>/ session.
+
+Replaces the per-script log_to_file / ACTIONS_LOG / BROWSER_STATE_LOG globals.
+The three append-only logs are opened once and written through an in-memory
+buffer that is flushed when it reaches flush_bytes or when flush_interval
+seconds have passed since the last flush, so a step costs a handful of write
+syscalls instead of one open/write/close per line.
+
+With archive=True, nothing but session.bsa is written: JSONL records and
+artifacts become individual archive records and full_session.log is stored
+as one record per flushed chunk (see session_archive.py).
+
+Usage:
+    session_log = SessionLogger(SESSION_DIR)
+    session_log.log("Starting agent session")
+    session_log.write_action({"step": 1, ...})
+    ...
+    session_log.close()
+    print(session_log.stats())
+"""
+import io
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from session_archive import ARCHIVE_NAME, SESSION_STEP, SessionArchiveWriter, step_from_name
+
+
+class SessionLogger:
+    """Buffered, thread-safe writer for full_session.log, actions.jsonl and browser_states.jsonl"""
+
+    FULL_LOG = "full_session.log"
+    ACTIONS_LOG = "actions.jsonl"
+    BROWSER_STATE_LOG = "browser_states.jsonl"
+
+    def __init__(self, session_dir: Path, flush_bytes: int = 256 * 1024, flush_interval: float = 2.0, archive: bool = False):
+        self.session_dir = Path(session_dir)
+        self.session_dir.mkdir(parents=True, exist_ok=True)
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.archive = SessionArchiveWriter(self.session_dir / ARCHIVE_NAME) if archive else None
+
+        self.full_log_path = self.session_dir / self.FULL_LOG
+        self.actions_path = self.session_dir / self.ACTIONS_LOG
+        self.browser_states_path = self.session_dir / self.BROWSER_STATE_LOG
+
+        # Counters
+        self.lines_logged = 0
+        self.bytes_written = 0
+        self.artifact_bytes_written = 0
+        self.flush_count = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+
+        self._lock = threading.RLock()
+        self._handles = {}
+        self._buffers = {}
+        self._buffered_bytes = 0
+        self._last_flush = time.monotonic()
+        self._closed = False
+
+    # ===== WRITES =====
+
+    def log(self, message: str, timestamp: str | None = None):
+        """Append a timestamped line to full_session.log"""
+        if timestamp is None:
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        with self._lock:
+            self._append(self.full_log_path, f"[{timestamp}] {message}\n")
+            self.lines_logged += 1
+
+    def write_action(self, record: dict):
+        """Append one LLM output record to actions.jsonl"""
+        if self.archive is not None:
+            self.archive.append(record.get("step", SESSION_STEP), "action", json.dumps(record, ensure_ascii=False))
+            return
+        self._append(self.actions_path, json.dumps(record, ensure_ascii=False) + "\n")
+
+    def write_browser_state(self, record: dict):
+        """Append one browser state record to browser_states.jsonl"""
+        if self.archive is not None:
+            self.archive.append(record.get("step", SESSION_STEP), "browser_state", json.dumps(record, ensure_ascii=False))
+            return
+        self._append(self.browser_states_path, json.dumps(record, ensure_ascii=False) + "\n")
+
+    def write_jsonl(self, relative_path: str, record: dict):
+        """Append one record to any other JSONL file under the session directory"""
+        if self.archive is not None:
+            self.archive.append(record.get("step", SESSION_STEP), "jsonl", json.dumps(record, ensure_ascii=False), name=relative_path)
+            return
+        path = self.session_dir / relative_path
+        if path not in self._buffers:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        self._append(path, json.dumps(record, ensure_ascii=False) + "\n")
+
+    def write_artifact(self, relative_path: str, data: bytes | str) -> Path:
+        """Write a standalone per-step file (screenshot, HTML, DOM dump) under the session directory"""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        path = self.session_dir / relative_path
+        if self.archive is not None:
+            self.archive.append(step_from_name(relative_path), "artifact", data, name=relative_path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(data)
+        with self._lock:
+            self.artifact_bytes_written += len(data)
+        return path
+
+    @contextmanager
+    def open_artifact(self, relative_path: str):
+        """Stream a large artifact: yields a binary file object. In archive mode the record is appended on exit."""
+        path = self.session_dir / relative_path
+        if self.archive is not None:
+            buffer = io.BytesIO()
+            yield buffer
+            data = buffer.getvalue()
+            self.archive.append(step_from_name(relative_path), "artifact", data, name=relative_path)
+            written = len(data)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "wb") as f:
+                yield f
+                written = f.tell()
+        with self._lock:
+            self.artifact_bytes_written += written
+
+    def read_artifact(self, relative_path: str) -> bytes:
+        """Read back an artifact written by write_artifact"""
+        if self.archive is not None:
+            data = self.archive.read(relative_path)
+            if data is None:
+                raise FileNotFoundError(relative_path)
+            return data
+        return (self.session_dir / relative_path).read_bytes()
+
+    def _append(self, path: Path, text: str):
+        data = text.encode("utf-8")
+        with self._lock:
+            if self._closed:
+                return
+            self._buffers.setdefault(path, []).append(data)
+            self._buffered_bytes += len(data)
+            if self._buffered_bytes >= self.flush_bytes:
+                self._flush_locked()
+            else:
+                self._flush_if_due_locked()
+
+    # ===== FLUSHING =====
+
+    def flush(self):
+        """Write all buffered data to disk"""
+        with self._lock:
+            self._flush_locked()
+
+    def flush_if_due(self):
+        """Flush only if flush_interval has elapsed since the last flush"""
+        with self._lock:
+            self._flush_if_due_locked()
+
+    def _flush_if_due_locked(self):
+        if self._buffered_bytes and time.monotonic() - self._last_flush >= self.flush_interval:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffered_bytes:
+            self._last_flush = time.monotonic()
+            return
+        start = time.perf_counter()
+        for path, chunks in self._buffers.items():
+            if not chunks:
+                continue
+            data = b"".join(chunks)
+            if self.archive is not None:
+                self.archive.append(SESSION_STEP, "log", data, name=path.name)
+            else:
+                handle = self._handles.get(path)
+                if handle is None:
+                    # Unbuffered: our own buffer already batches, so each flush is one write per file
+                    handle = self._handles[path] = open(path, "ab", buffering=0)
+                handle.write(data)
+            self.bytes_written += len(data)
+            chunks.clear()
+        elapsed = time.perf_counter() - start
+
+        self._buffered_bytes = 0
+        self._last_flush = time.monotonic()
+        self.flush_count += 1
+        self.flush_seconds_total += elapsed
+        self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+
+    def close(self):
+        """Flush remaining data and close all handles"""
+        with self._lock:
+            if self._closed:
+                return
+            self._flush_locked()
+            for handle in self._handles.values():
+                handle.close()
+            self._handles.clear()
+            if self.archive is not None:
+                self.archive.close()
+            self._closed = True
+
+    # ===== STATS =====
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "lines_logged": self.lines_logged,
+                "bytes_written": self.bytes_written,
+                "artifact_bytes_written": self.artifact_bytes_written,
+                "buffered_bytes": self._buffered_bytes,
+                "flush_count": self.flush_count,
+                "flush_ms_total": round(self.flush_seconds_total * 1000, 3),
+                "flush_ms_avg": round(self.flush_seconds_total * 1000 / self.flush_count, 3) if self.flush_count else 0.0,
+                "flush_ms_max": round(self.flush_seconds_max * 1000, 3),
+                "archive": self.archive.stats() if self.archive is not None else None,
+            }
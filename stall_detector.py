@@ -0,0 +1,290 @@
+"""
+Loop and stall detection for agent runs.
+
+Session 20251023_230436 spent 49 full vision LLM calls on about:blank, with the
+model deciding to "wait for the page to load" every time. StallDetector
+watches every step from the register_new_step_callback path. It
+fingerprints each step as (url, DOM hash, screenshot hash, action list) and
+fires when:
+
+  - unchanged: the page (url, DOM, screenshot) stayed the same for
+    `unchanged_steps` steps in a row, whatever the model did
+  - cycle: the last steps repeat with a period of 2..max_period steps,
+    `cycle_repeats` times (A B A B, listing -> article -> listing ...)
+
+It responds according to `response`:
+  - "hint":     the next agent step request gets a corrective message
+                (StallGuard wrapper; extraction calls are left alone)
+  - "navigate": the planned actions are replaced with a navigation to
+                recovery_url, or to the last working URL before the stall
+  - "abort":    the agent is stopped and the reason recorded
+  - "escalate": hint first, then navigate, then abort if the stall goes on
+                for `patience` more steps at each level
+
+Each detection is recorded in stall.jsonl and as "stall" in the step's
+actions.jsonl record.
+
+Usage:
+    stall_detector = StallDetector(on_event=lambda event: log_writer.write_jsonl("stall.jsonl", event))
+    llm = StallGuard(llm, stall_detector)                        # delivers hints
+    step_callback = make_step_callback(log_writer, stall_detector=stall_detector)
+    agent = Agent(task=task, llm=llm, register_new_step_callback=step_callback)
+    stall_detector.bind(agent)                                    # needed for "abort"
+"""
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from datetime import datetime
+
+from browser_use.llm.messages import UserMessage
+
+RESPONSES = ("hint", "navigate", "abort", "escalate")
+_MARKER = re.compile(r"(?m)^(\s*)\*(?=\[)")
+_BLANK_URLS = ("about:blank", "chrome://newtab/", "")
+
+
+@dataclass(frozen=True)
+class StepFingerprint:
+    url: str
+    dom_hash: str | None
+    screenshot_hash: str | None
+    actions: str  # Canonical JSON of the planned actions
+
+    @property
+    def state(self) -> tuple:
+        return self.url, self.dom_hash, self.screenshot_hash
+
+
+def _hash(text: str | None) -> str | None:
+    if not text:
+        return None
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _action_dicts(agent_output) -> list[dict]:
+    actions = []
+    for action in getattr(agent_output, "action", None) or []:
+        if hasattr(action, 'model_dump'):
+            actions.append(action.model_dump(exclude_none=True, mode="json"))
+        else:
+            actions.append(dict(action))
+    return actions
+
+
+def fingerprint(browser_state, agent_output, dom_text: str | None = ...) -> StepFingerprint:
+    """dom_text: the step's llm_representation() if the caller already has it"""
+    if dom_text is ...:
+        try:
+            dom_text = browser_state.dom_state.llm_representation()
+        except Exception:
+            dom_text = None
+    return StepFingerprint(
+        url=browser_state.url or "",
+        # New-element markers flip between identical pages
+        dom_hash=_hash(_MARKER.sub(r"\1", dom_text)) if dom_text else None,
+        screenshot_hash=_hash(browser_state.screenshot),
+        actions=json.dumps(_action_dicts(agent_output), sort_keys=True),
+    )
+
+
+class StallDetector:
+    """Per-agent stall detection; observe() is called once per step"""
+
+    def __init__(
+        self,
+        response: str = "escalate",
+        unchanged_steps: int = 3,
+        max_period: int = 3,
+        cycle_repeats: int = 2,
+        patience: int = 2,
+        recovery_url: str | None = None,
+        on_event=None,
+    ):
+        """
+        Args:
+            response: "hint", "navigate", "abort" or "escalate"
+            unchanged_steps: Steps with an identical page before it counts as a stall
+            max_period: Longest cycle (in steps) that is detected
+            cycle_repeats: How many times a cycle must repeat
+            patience: Steps to wait after a response before escalating (and between repeated hints)
+            recovery_url: Where "navigate" goes; defaults to the last URL before the stall
+            on_event: Called with a dict per detection
+        """
+        if response not in RESPONSES:
+            raise ValueError(f"Unknown response: {response} (expected one of {RESPONSES})")
+        self.response = response
+        self.unchanged_steps = unchanged_steps
+        self.max_period = max_period
+        self.cycle_repeats = cycle_repeats
+        self.patience = patience
+        self.recovery_url = recovery_url
+        self.on_event = on_event
+
+        self.window = max(unchanged_steps, max_period * cycle_repeats)
+        self._history: list[StepFingerprint] = []
+        self._level = 0  # Escalation level reached in the current stall
+        self._last_response_step = None
+        self._pending_hint = None
+        self._agent = None
+        self.last_event = None
+        self.abort_reason = None
+
+        # Counters
+        self.steps = 0
+        self.detections = 0
+        self.hints = 0
+        self.navigations = 0
+        self.aborts = 0
+
+    def bind(self, agent):
+        """Give the detector the Agent so "abort" can stop it"""
+        self._agent = agent
+
+    # ===== DETECTION =====
+
+    def detect(self) -> dict | None:
+        """Stall in the recorded history, as {"kind", ...}, or None"""
+        history = self._history
+        if len(history) >= self.unchanged_steps:
+            recent = history[-self.unchanged_steps:]
+            if all(item.state == recent[0].state for item in recent):
+                return {"kind": "unchanged", "steps": self.unchanged_steps, "url": recent[0].url}
+
+        for period in range(2, self.max_period + 1):
+            length = period * self.cycle_repeats
+            if len(history) < length:
+                break
+            recent = history[-length:]
+            if all(recent[i] == recent[i - period] for i in range(period, length)) and len(set(recent[:period])) > 1:
+                return {"kind": "cycle", "period": period, "urls": [item.url for item in recent[:period]]}
+        return None
+
+    def _last_good_url(self, stall: dict) -> str | None:
+        stalled = set(stall["urls"]) if stall["kind"] == "cycle" else {stall["url"]}
+        for item in reversed(self._history):
+            if item.url not in stalled and item.url not in _BLANK_URLS:
+                return item.url
+        return None
+
+    # ===== RESPONSES =====
+
+    def _choose(self) -> str:
+        if self.response != "escalate":
+            return self.response
+        return ("hint", "navigate", "abort")[min(self._level, 2)]
+
+    def _hint_text(self, stall: dict) -> str:
+        if stall["kind"] == "unchanged":
+            return (
+                f"You have made no progress: the page ({stall['url'] or 'blank'}) has not changed for "
+                f"{stall['steps']} steps. Waiting or repeating the same action will not help. Choose a "
+                "different action, for example navigate directly to the site you need, go back, scroll, "
+                "or use another element."
+            )
+        return (
+            f"You are going in a cycle of {stall['period']} steps ({' -> '.join(stall['urls'])}) and "
+            "repeating the same actions. Break the cycle: use the information you already have, "
+            "try a different element or page, or finish with done if the task is complete."
+        )
+
+    def _navigate(self, agent_output, url: str) -> bool:
+        actions = getattr(agent_output, "action", None)
+        if not actions:
+            return False
+        action_type = type(actions[0])
+        fields = getattr(action_type, "model_fields", {})
+        for name, params in (("navigate", {"url": url, "new_tab": False}), ("go_to_url", {"url": url})):
+            if name in fields:
+                try:
+                    actions[:] = [action_type(**{name: params})]
+                    return True
+                except Exception:
+                    continue
+        return False
+
+    def observe(self, step: int, browser_state, agent_output, dom_text: str | None = ...) -> dict | None:
+        """Record a step; returns the detection event (also kept as last_event) or None"""
+        self.steps += 1
+        self._history.append(fingerprint(browser_state, agent_output, dom_text))
+        if len(self._history) > self.window * 4:
+            del self._history[:-self.window * 4]
+
+        stall = self.detect()
+        if stall is None:
+            self._level = 0
+            self._last_response_step = None
+            self.last_event = None
+            return None
+        if self._last_response_step is not None and step - self._last_response_step < self.patience:
+            # Give the previous response time to work
+            self.last_event = {"step": step, **stall, "response": "waiting"}
+            return self.last_event
+
+        self.detections += 1
+        response = self._choose()
+        event = {"step": step, "timestamp": datetime.now().isoformat(), **stall, "response": response}
+
+        if response == "navigate":
+            url = self.recovery_url or self._last_good_url(stall)
+            if url and self._navigate(agent_output, url):
+                self.navigations += 1
+                event["url"] = url
+            else:
+                # Nowhere to go or no navigate action available; fall through to the next level
+                response = event["response"] = "abort" if self.response == "escalate" else "hint"
+        if response == "hint":
+            self.hints += 1
+            self._pending_hint = self._hint_text(stall)
+        if response == "abort":
+            self.aborts += 1
+            self.abort_reason = f"stall detected at step {step}: {stall['kind']}"
+            event["reason"] = self.abort_reason
+            actions = getattr(agent_output, "action", None)
+            if actions is not None:
+                actions[:] = []
+            if self._agent is not None and hasattr(self._agent, 'stop'):
+                self._agent.stop()
+
+        self._level += 1
+        self._last_response_step = step
+        self.last_event = event
+        if self.on_event is not None:
+            self.on_event(event)
+        return event
+
+    def apply(self, messages: list, output_format=None) -> list:
+        """Append the pending corrective hint (if any) to the next agent step request"""
+        # Other calls (page extraction, judges) must not use up the hint
+        is_step = output_format is not None and "action" in getattr(output_format, "model_fields", {})
+        if self._pending_hint is None or not is_step:
+            return messages
+        hint, self._pending_hint = self._pending_hint, None
+        return list(messages) + [UserMessage(content=hint)]
+
+    def stats(self) -> dict:
+        return {
+            "steps": self.steps,
+            "detections": self.detections,
+            "hints": self.hints,
+            "navigations": self.navigations,
+            "aborts": self.aborts,
+            "abort_reason": self.abort_reason,
+        }
+
+
+class StallGuard:
+    """Chat model wrapper that delivers a StallDetector's corrective hints"""
+
+    def __init__(self, llm, detector: StallDetector):
+        self.llm = llm
+        self.detector = detector
+
+    def __getattr__(self, name):
+        # model, provider, name, stats(), ... come from the wrapped model
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    async def ainvoke(self, messages, output_format=None):
+        return await self.llm.ainvoke(self.detector.apply(messages, output_format), output_format)
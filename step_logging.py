@@ -0,0 +1,511 @@
+"""
+Background logging pipeline for the step_callback scripts.
+
+step_callback runs on the agent's event loop, so it only captures a plain-data
+snapshot of the step (build_step_snapshot) and hands it to StepLogWriter. A
+dedicated writer thread drains the queue and writes through a SessionLogger,
+which keeps the session files open and batches flushes. Other per-session
+records written from the loop (timings, stream timings, stall events, ...)
+go through the same queue: pass the StepLogWriter wherever a session_log is
+expected, or use log_writer.write_jsonl in callbacks.
+
+Usage:
+    session_log = SessionLogger(SESSION_DIR)
+    log_writer = StepLogWriter(session_log, ScreenshotStore(session_log))
+    log_writer.start()
+
+    async def step_callback(browser_state, agent_output, step_number):
+        await log_writer.submit(build_step_snapshot(browser_state, agent_output, step_number))
+
+    try:
+        await agent.run()
+    finally:
+        await asyncio.to_thread(log_writer.close)  # flushes everything still queued and closes session_log
+
+    tracer = StepTracer(log_writer)  # timings.jsonl is written on the writer thread
+    stall_detector = StallDetector(on_event=lambda event: log_writer.write_jsonl("stall.jsonl", event))
+"""
+import asyncio
+import atexit
+import base64
+import json
+import queue
+import threading
+import traceback
+from dataclasses import dataclass
+from datetime import datetime
+
+from dom_delta import DOM_SNAPSHOTS, DomDeltaEncoder
+from html_capture import HtmlCapture, find_document_root
+from screenshot_encoding import ScreenshotEncoder
+from screenshot_store import ScreenshotStore
+from session_logger import SessionLogger
+
+
+def _timestamp() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+@dataclass
+class StepSnapshot:
+    """
+    Everything the writer needs for one step. All plain data except html_root,
+    the live document node, which stays referenced until the writer thread
+    serializes it; payload_size() counts it at the HTML size cap.
+    """
+    step: int
+    timestamp: str
+    browser_state: dict
+    llm_data: dict
+    screenshot_b64: str | None = None
+    html_root: object | None = None  # Document node, serialized on the writer thread
+    html_error: str | None = None
+    llm_dom_text: str | None = None
+    llm_dom_error: str | None = None
+    dropped_payloads: bool = False
+    screenshot_sampled_out: bool = False
+
+    def payload_size(self, html_bytes: int = 0) -> int:
+        """Approximate bytes held by the heavy fields, used for queue backpressure; html_bytes is charged for html_root"""
+        size = sum(len(value) for value in (self.screenshot_b64, self.llm_dom_text) if value)
+        return size + (html_bytes if self.html_root is not None else 0)
+
+    def drop_payloads(self):
+        """Discard screenshot/HTML/DOM payloads but keep the JSONL records"""
+        self.screenshot_b64 = None
+        self.html_root = None
+        self.llm_dom_text = None
+        self.dropped_payloads = True
+
+
+@dataclass
+class _LogLine:
+    timestamp: str
+    message: str
+
+
+@dataclass
+class _JsonlRecord:
+    relative_path: str
+    record: dict
+
+
+_STOP = object()
+
+
+def action_name(action_dict: dict) -> str:
+    """Name of a dumped ActionModel: its only non-empty field, e.g. {"click": {"index": 5}} -> click"""
+    if "name" in action_dict:
+        return str(action_dict["name"])
+    for key, value in action_dict.items():
+        if value is not None and key != "interacted_element":
+            return key
+    return "unknown"
+
+
+def build_step_snapshot(browser_state, agent_output, step_number) -> StepSnapshot:
+    """
+    Capture a step's browser state and LLM output as plain data
+
+    Args:
+        browser_state: BrowserStateSummary containing current browser state
+        agent_output: AgentOutput containing LLM's response and planned actions
+        step_number: Current step number
+    """
+    browser_state_data = {
+        "step": step_number,
+        "timestamp": datetime.now().isoformat(),
+        "url": browser_state.url,
+        "title": browser_state.title,
+        "tabs": [{"url": tab.url, "title": tab.title} for tab in browser_state.tabs],
+        "dom_text": browser_state.dom_state.dom_text if hasattr(browser_state.dom_state, 'dom_text') else None,
+        "dom_items_count": len(browser_state.dom_state.element_tree) if hasattr(browser_state.dom_state, 'element_tree') else 0,
+    }
+
+    # Add page info if available
+    if browser_state.page_info:
+        browser_state_data["page_info"] = {
+            "viewport_width": browser_state.page_info.viewport_width,
+            "viewport_height": browser_state.page_info.viewport_height,
+            "page_width": browser_state.page_info.page_width,
+            "page_height": browser_state.page_info.page_height,
+            "scroll_x": browser_state.page_info.scroll_x,
+            "scroll_y": browser_state.page_info.scroll_y,
+        }
+
+    snapshot = StepSnapshot(
+        step=step_number,
+        timestamp=_timestamp(),
+        browser_state=browser_state_data,
+        llm_data={"step": step_number, "timestamp": datetime.now().isoformat()},
+        screenshot_b64=browser_state.screenshot or None,
+    )
+
+    try:
+        # Only the parent walk happens here; serialization runs on the writer thread
+        snapshot.html_root = find_document_root(browser_state.dom_state)
+    except Exception as e:
+        snapshot.html_error = f"{e}\n{traceback.format_exc()}"
+
+    try:
+        snapshot.llm_dom_text = browser_state.dom_state.llm_representation() or None
+    except Exception as e:
+        snapshot.llm_dom_error = str(e)
+
+    current_state = agent_output.current_state
+    for attr, key in (
+        ('thinking', 'thinking'),
+        ('evaluation_previous_goal', 'evaluation'),
+        ('memory', 'memory'),
+        ('next_goal', 'next_goal'),
+    ):
+        if hasattr(current_state, attr) and getattr(current_state, attr):
+            snapshot.llm_data[key] = getattr(current_state, attr)
+
+    actions = planned_actions(agent_output)
+    if actions:
+        snapshot.llm_data["actions"] = actions
+
+    return snapshot
+
+
+def planned_actions(agent_output) -> list[dict]:
+    """The step's actions as dicts"""
+    # The planned actions live on the AgentOutput itself, not on current_state
+    actions = getattr(agent_output, "action", None) or getattr(getattr(agent_output, "current_state", None), "action", None)
+    return [
+        action.model_dump(exclude_none=True, mode="json") if hasattr(action, 'model_dump') else dict(action)
+        for action in actions or []
+    ]
+
+
+class StepLogWriter:
+    """
+    Writer thread that turns queued step snapshots into session log files.
+
+    The queue is bounded by the bytes of screenshot/HTML/DOM payload it holds
+    (max_pending_bytes; a pending document node counts as html_capture.max_bytes). When the bound is hit, overflow decides what happens:
+      - "block": submit() waits for the writer to catch up. Nothing is lost,
+        the agent just slows down. The event loop itself is never blocked.
+      - "shed": the snapshot's payloads are dropped and only its JSONL records
+        and log lines are written. submit() never waits.
+
+    Screenshots are sampled and re-encoded by screenshot_encoder when one is
+    given, then go to screenshot_store (deduplicated blobs) or, without a
+    store, to screenshots/step_NNN.<ext>. Frames dropped by the sampling
+    policy never enter the queue.
+
+    Full-page HTML is serialized here (not on the event loop) by html_capture,
+    streamed to disk with a size cap.
+
+    With a dom_encoder, the LLM DOM text goes to dom_snapshots.jsonl as
+    keyframes and deltas instead of one step_NNN_llm_dom.txt per step.
+    """
+
+    def __init__(
+        self,
+        session_log: SessionLogger,
+        screenshot_store: ScreenshotStore | None = None,
+        screenshot_encoder: ScreenshotEncoder | None = None,
+        dom_encoder: DomDeltaEncoder | None = None,
+        html_capture: HtmlCapture | None = None,
+        max_pending_bytes: int = 64 * 1024 * 1024,
+        overflow: str = "block",
+    ):
+        if overflow not in ("block", "shed"):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.session_log = session_log
+        self.screenshot_store = screenshot_store
+        self.screenshot_encoder = screenshot_encoder
+        self.dom_encoder = dom_encoder
+        self.html_capture = html_capture or HtmlCapture()
+        self.max_pending_bytes = max_pending_bytes
+        self.overflow = overflow
+
+        self.last_step = 0
+        self.steps_written = 0
+        self.payloads_dropped = 0
+
+        self._queue = queue.Queue()
+        self._pending_bytes = 0
+        self._space = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="step-log-writer", daemon=True)
+        self._closed = False
+
+    def start(self):
+        self._thread.start()
+        # Last line of defence: flush on interpreter exit even if close() was never reached
+        atexit.register(self.close)
+
+    @property
+    def session_dir(self):
+        return self.session_log.session_dir
+
+    def log(self, message: str):
+        """Queue a line for full_session.log, stamped with the current time"""
+        if self._closed:
+            return
+        self._queue.put(_LogLine(_timestamp(), message))
+
+    def write_jsonl(self, relative_path: str, record: dict):
+        """Queue a record for a JSONL file under the session directory (see SessionLogger.write_jsonl)"""
+        if self._closed:
+            return
+        self._queue.put(_JsonlRecord(relative_path, record))
+
+    async def submit(self, snapshot: StepSnapshot):
+        """Queue a step snapshot, applying the overflow policy if the writer is behind"""
+        if self._closed:
+            return
+        self.last_step = snapshot.step
+        if snapshot.screenshot_b64 and self.screenshot_encoder and not self.screenshot_encoder.should_keep(
+            snapshot.step, snapshot.browser_state.get("url"), snapshot.llm_dom_text, snapshot.screenshot_b64
+        ):
+            snapshot.screenshot_b64 = None
+            snapshot.screenshot_sampled_out = True
+        size = snapshot.payload_size(self.html_capture.max_bytes)
+        if not self._try_reserve(size):
+            if self.overflow == "shed":
+                snapshot.drop_payloads()
+                self.payloads_dropped += 1
+                size = 0
+            else:
+                await asyncio.to_thread(self._reserve, size)
+        self._queue.put((snapshot, size))
+
+    def close(self, timeout: float | None = None):
+        """Stop accepting work, drain the queue and close the session log"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+        self.session_log.close()
+
+    # ===== BACKPRESSURE =====
+
+    def _try_reserve(self, size: int) -> bool:
+        with self._space:
+            # A single oversized snapshot is still admitted once the queue is empty
+            if self._pending_bytes + size <= self.max_pending_bytes or self._pending_bytes == 0:
+                self._pending_bytes += size
+                return True
+            return False
+
+    def _reserve(self, size: int):
+        with self._space:
+            while self._pending_bytes and self._pending_bytes + size > self.max_pending_bytes:
+                self._space.wait()
+            self._pending_bytes += size
+
+    def _release(self, size: int):
+        with self._space:
+            self._pending_bytes -= size
+            self._space.notify_all()
+
+    # ===== WRITER THREAD =====
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self._queue.get(timeout=self.session_log.flush_interval)]
+            except queue.Empty:
+                # Idle: honour the logger's time-based flush threshold
+                self.session_log.flush_if_due()
+                continue
+            # Drain whatever else is already queued so it shares one flush
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            released = 0
+            for item in batch:
+                if item is _STOP:
+                    stopping = True
+                    continue
+                try:
+                    if isinstance(item, _LogLine):
+                        self.session_log.log(item.message, item.timestamp)
+                    elif isinstance(item, _JsonlRecord):
+                        self.session_log.write_jsonl(item.relative_path, item.record)
+                    else:
+                        snapshot, size = item
+                        released += size
+                        self._write_step(snapshot)
+                        self.steps_written += 1
+                except Exception as e:
+                    self.session_log.log(f"Log writer error: {e}\n{traceback.format_exc()}")
+
+            self.session_log.flush_if_due()
+            if released:
+                self._release(released)
+
+        self._write_summary()
+
+    def _write_summary(self):
+        self.session_log.log(f"Log writer: {self.steps_written} steps written, {self.payloads_dropped} payloads dropped")
+        if self.screenshot_encoder:
+            self.session_log.log(f"Screenshot encoding: {json.dumps(self.screenshot_encoder.stats())}")
+        if self.screenshot_store:
+            self.session_log.log(f"Screenshot store: {json.dumps(self.screenshot_store.stats())}")
+        if self.dom_encoder:
+            self.session_log.log(f"DOM snapshots: {json.dumps(self.dom_encoder.stats())}")
+        self.session_log.log(f"HTML capture: {json.dumps(self.html_capture.stats())}")
+
+    def _write_step(self, snap: StepSnapshot):
+        session_log = self.session_log
+        log = lambda message: session_log.log(message, snap.timestamp)
+        step = snap.step
+
+        log(f"\n{'='*80}")
+        log(f"STEP {step}")
+        log(f"{'='*80}")
+
+        # ===== STORE SCREENSHOT =====
+        # Stored before the browser state record so the record can reference the blob
+        screenshot_message = None
+        if snap.screenshot_b64:
+            try:
+                screenshot_data, ext = base64.b64decode(snap.screenshot_b64), "png"
+                if self.screenshot_encoder:
+                    screenshot_data, ext = self.screenshot_encoder.encode(screenshot_data)
+                if self.screenshot_store:
+                    ref = self.screenshot_store.put(step, screenshot_data, ext)
+                    snap.browser_state["screenshot"] = ref.blob
+                    screenshot_message = f"Screenshot saved: {ref.blob}" + (f" ({ref.dedup} duplicate)" if ref.dedup else "")
+                else:
+                    screenshot_path = session_log.write_artifact(f"screenshots/step_{step:03d}.{ext}", screenshot_data)
+                    screenshot_message = f"Screenshot saved: {screenshot_path}"
+            except Exception as e:
+                screenshot_message = f"Error saving screenshot: {e}"
+        elif snap.screenshot_sampled_out:
+            screenshot_message = "Screenshot skipped by sampling policy"
+
+        # ===== LOG BROWSER STATE =====
+        session_log.write_browser_state(snap.browser_state)
+        log(f"URL: {snap.browser_state['url']}")
+        log(f"Title: {snap.browser_state['title']}")
+
+        if snap.dropped_payloads:
+            log("Warning: log writer was behind, screenshot/HTML/DOM payloads for this step were dropped")
+        if screenshot_message:
+            log(screenshot_message)
+
+        # ===== LOG FULL HTML CONTENT =====
+        if snap.html_error:
+            log(f"Error locating HTML document root: {snap.html_error}")
+        elif snap.html_root is not None:
+            try:
+                result = self.html_capture.write(session_log, step, snap.html_root)
+                if result.same_as_step is not None:
+                    log(f"Full HTML unchanged since step {result.same_as_step}: {result.path} ({result.bytes} bytes)")
+                else:
+                    log(f"Full HTML saved: {result.path} ({result.bytes} bytes{', truncated' if result.truncated else ''})")
+            except Exception as e:
+                log(f"Error extracting HTML content: {e}\n{traceback.format_exc()}")
+        elif not snap.dropped_payloads:
+            log("Warning: Could not locate the document node in the DOM state")
+
+        # ===== LOG LLM REPRESENTATION (DOM TEXT) =====
+        if snap.llm_dom_error:
+            log(f"Error extracting LLM DOM representation: {snap.llm_dom_error}")
+        elif snap.llm_dom_text and self.dom_encoder:
+            record = self.dom_encoder.encode(step, snap.llm_dom_text, snap.browser_state.get("url"))
+            session_log.write_jsonl(DOM_SNAPSHOTS, record)
+            if record["type"] == "key":
+                log(f"LLM DOM representation saved: {DOM_SNAPSHOTS} keyframe ({len(snap.llm_dom_text)} chars)")
+                log(f"LLM DOM preview (first 500 chars):\n{snap.llm_dom_text[:500]}")
+            else:
+                changed = [line for _, _, lines in record["ops"] for line in lines]
+                log(f"LLM DOM representation saved: {DOM_SNAPSHOTS} delta vs step {record['base']} "
+                    f"({len(record['ops'])} edits, {len(snap.llm_dom_text)} chars total)")
+                log(f"LLM DOM changes (first 500 chars):\n{chr(10).join(changed)[:500]}")
+        elif snap.llm_dom_text:
+            dom_text_path = session_log.write_artifact(f"step_{step:03d}_llm_dom.txt", snap.llm_dom_text)
+            log(f"LLM DOM representation saved: {dom_text_path} ({len(snap.llm_dom_text)} chars)")
+            log(f"LLM DOM preview (first 500 chars):\n{snap.llm_dom_text[:500]}")
+
+        # ===== LOG LLM OUTPUT =====
+        llm_data = snap.llm_data
+        if "thinking" in llm_data:
+            log(f"LLM Thinking: {llm_data['thinking']}")
+        if "evaluation" in llm_data:
+            log(f"Evaluation: {llm_data['evaluation']}")
+        if "memory" in llm_data:
+            log(f"Memory: {llm_data['memory']}")
+        if "next_goal" in llm_data:
+            log(f"Next Goal: {llm_data['next_goal']}")
+
+        # ===== LOG ACTIONS =====
+        if llm_data.get("actions"):
+            log(f"\nPlanned Actions ({len(llm_data['actions'])}):")
+            for i, action_dict in enumerate(llm_data["actions"], 1):
+                log(f"  Action {i}: {action_name(action_dict)}")
+                log(f"    Full details: {json.dumps(action_dict, ensure_ascii=False)}")
+
+        session_log.write_action(llm_data)
+
+        log(f"{'='*80}\n")
+
+
+def open_step_logger(
+    session_dir,
+    archive: bool = False,
+    screenshot_encoder: ScreenshotEncoder | None = None,
+    **writer_kwargs,
+) -> StepLogWriter:
+    """
+    Standard logging setup for one agent session: SessionLogger, deduplicating
+    screenshot store, DOM deltas and a started StepLogWriter.
+
+    screenshot_encoder can be shared between sessions; the caller closes it.
+    """
+    session_log = SessionLogger(session_dir, archive=archive)
+    writer = StepLogWriter(
+        session_log,
+        screenshot_store=ScreenshotStore(session_log),
+        screenshot_encoder=screenshot_encoder,
+        dom_encoder=DomDeltaEncoder(),
+        **writer_kwargs,
+    )
+    writer.start()
+    return writer
+
+
+def make_step_callback(writer: StepLogWriter, vision_policy=None, dom_compactor=None, stall_detector=None, macro_recorder=None,
+                       usage_meter=None, streaming=None):
+    """
+    register_new_step_callback that hands each step to the writer
+
+    With a VisionPolicy or DomCompactor, its result for the step is added to the actions.jsonl record.
+    A StreamingFactory adds the step's stream timing (only meaningful when one agent uses the factory).
+    A UsageMeter adds the step's token usage and cost.
+    A StallDetector sees the step before it is logged, so a recovery navigation it plans is what gets logged.
+    A MacroRecorder records the step (after the StallDetector) for replay.
+    Both reuse the snapshot's llm_representation() text instead of rendering the DOM again.
+    """
+    async def step_callback(browser_state, agent_output, step_number):
+        snapshot = build_step_snapshot(browser_state, agent_output, step_number)
+        stall_event = None
+        if stall_detector is not None:
+            stall_event = stall_detector.observe(step_number, browser_state, agent_output, dom_text=snapshot.llm_dom_text)
+        if macro_recorder is not None:
+            macro_recorder.record(step_number, browser_state, agent_output, dom_text=snapshot.llm_dom_text)
+        if stall_event is not None:
+            snapshot.llm_data["stall"] = stall_event
+            # A recovery navigation or an abort replaces the planned actions
+            snapshot.llm_data["actions"] = planned_actions(agent_output)
+        if vision_policy is not None:
+            snapshot.llm_data["vision"] = vision_policy.last_decision
+        if dom_compactor is not None:
+            snapshot.llm_data["dom_compaction"] = dom_compactor.last_result
+        if streaming is not None:
+            snapshot.llm_data["stream"] = streaming.last_timing
+        if usage_meter is not None:
+            snapshot.llm_data["usage"] = usage_meter.take_step(step_number)
+        await writer.submit(snapshot)
+    return step_callback
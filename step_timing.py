@@ -0,0 +1,290 @@
+"""
+Per-step latency breakdown for agent runs.
+
+StepTracer records where each agent step spends its time, using monotonic
+clocks, and appends one record per step to timings.jsonl in the session
+directory:
+
+    {"step": 3, "start_s": 41.207, "duration_ms": 9312.4,
+     "spans": {"browser_state": 1204.1, "llm": 7630.2, "log_callback": 3.1, "actions": 474.9},
+     "llm_calls": [{"duration_ms": 7630.2, "prompt_tokens": 5120, "cached_tokens": 4096,
+                    "completion_tokens": 212, "ttft_ms": 2841.0, "action_ready_ms": 6002.3}]}
+
+The phases come from hooks around browser_use's step loop:
+  - browser_state: from step start to the first LLM call (DOM extraction,
+    screenshot capture and building the prompt)
+  - llm: the chat model call(s), with token counts from the response usage and,
+    for streamed responses, time to first token and to the first complete action
+  - log_callback: our register_new_step_callback (snapshot + queueing)
+  - actions: from the end of the callback to the end of the step (action
+    execution and browser_use's post-processing)
+  - human_wait: time an action (ask_human) spent waiting for a person,
+    recorded with record_human_wait and taken out of "actions"
+
+With otel_endpoint (or OTEL_EXPORTER_OTLP_ENDPOINT) set and the
+opentelemetry-sdk and OTLP exporter packages installed, every step is also
+exported as an "agent.step" span with one child span per phase.
+
+Usage:
+    tracer = StepTracer(log_writer)  # or a SessionLogger; a StepLogWriter keeps the writes off the event loop
+    llm = TracedLLM(llm, tracer)  # outermost wrapper
+    agent = Agent(task=task, llm=llm, register_new_step_callback=tracer.wrap_step_callback(step_callback))
+    await agent.run(on_step_start=tracer.on_step_start, on_step_end=tracer.on_step_end)
+    tracer.close()
+"""
+import os
+import time
+from contextvars import ContextVar
+from datetime import datetime
+
+# Fields that code below TracedLLM adds to the current call's record (see annotate_llm_call)
+_call_annotations = ContextVar("llm_call_annotations", default=None)
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+def annotate_llm_call(**fields):
+    """
+    Attach fields (e.g. time to first token) to the LLM call TracedLLM is timing.
+    No-op outside a traced call; child tasks (hedged requests) share the record.
+    """
+    annotations = _call_annotations.get()
+    if annotations is not None:
+        annotations.update(fields)
+
+
+class _OtelExporter:
+    """Turns finished step records into OpenTelemetry spans"""
+
+    def __init__(self, endpoint: str, service_name: str):
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        try:
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        self.provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+        self.provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+        self.tracer = self.provider.get_tracer("browser_use_script.step_timing")
+
+    def export(self, step: dict, phases: list[tuple], to_epoch_ns):
+        from opentelemetry import trace
+
+        parent = self.tracer.start_span(
+            "agent.step",
+            start_time=to_epoch_ns(step["_start"]),
+            attributes={"agent.step": step["step"], "session": step["session"]},
+        )
+        context = trace.set_span_in_context(parent)
+        for name, start, end, attributes in phases:
+            span = self.tracer.start_span(name, context=context, start_time=to_epoch_ns(start), attributes=attributes)
+            span.end(end_time=to_epoch_ns(end))
+        parent.end(end_time=to_epoch_ns(step["_end"]))
+
+    def close(self):
+        self.provider.shutdown()
+
+
+class StepTracer:
+    """Collects phase timings per agent step and writes them to timings.jsonl"""
+
+    def __init__(self, session_log, otel_endpoint: str | None = None, service_name: str = "browser-use-agent"):
+        """
+        Args:
+            session_log: StepLogWriter (or SessionLogger) that receives timings.jsonl
+            otel_endpoint: OTLP collector endpoint (e.g. http://localhost:4317); defaults to OTEL_EXPORTER_OTLP_ENDPOINT
+            service_name: service.name resource attribute of exported spans
+        """
+        self.session_log = session_log
+        self.session_name = session_log.session_dir.name
+        self._origin = time.monotonic()
+        self._epoch_offset_ns = time.time_ns() - time.monotonic_ns()
+        self._step = None
+        self._step_number = 0
+
+        self._otel = None
+        otel_endpoint = otel_endpoint or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+        if otel_endpoint:
+            try:
+                self._otel = _OtelExporter(otel_endpoint, service_name)
+            except ImportError:
+                self.session_log.log("opentelemetry-sdk / exporter not installed; timings go to timings.jsonl only")
+
+        # Counters
+        self.steps = 0
+        self.phase_totals = {}
+
+    def _to_epoch_ns(self, monotonic_seconds: float) -> int:
+        return int(monotonic_seconds * 1e9) + self._epoch_offset_ns
+
+    def _current(self) -> dict:
+        # LLM calls outside an on_step_start/on_step_end pair (e.g. the first
+        # step of an agent run without hooks) still get a step record
+        if self._step is None:
+            self._begin(time.monotonic())
+        return self._step
+
+    def _begin(self, now: float):
+        self._step_number += 1
+        self._step = {
+            "step": self._step_number,
+            "session": self.session_name,
+            "_start": now,
+            "_llm": [],
+            "_human": [],
+            "_callback": None,
+        }
+
+    # ===== HOOKS =====
+
+    async def on_step_start(self, agent=None):
+        if self._step is not None:
+            self._finish(time.monotonic())
+        self._begin(time.monotonic())
+
+    async def on_step_end(self, agent=None):
+        if self._step is not None:
+            self._finish(time.monotonic())
+
+    def wrap_step_callback(self, callback):
+        """Time a register_new_step_callback as the log_callback phase"""
+        async def timed_callback(browser_state, agent_output, step_number):
+            step = self._current()
+            start = time.monotonic()
+            try:
+                return await callback(browser_state, agent_output, step_number)
+            finally:
+                step["_callback"] = (start, time.monotonic())
+                step["agent_step"] = step_number
+        return timed_callback
+
+    def record_human_wait(self, start: float, end: float):
+        """Time an action spent waiting for a person; reported as human_wait instead of actions"""
+        self._current()["_human"].append((start, end))
+
+    def record_llm_call(self, start: float, end: float, result=None, annotations: dict | None = None, error: str | None = None):
+        call = {"_start": start, "_end": end, "duration_ms": _ms(end - start)}
+        usage = getattr(result, "usage", None) if result is not None else None
+        if usage is not None:
+            call["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+            call["cached_tokens"] = getattr(usage, "prompt_cached_tokens", None)
+            call["completion_tokens"] = getattr(usage, "completion_tokens", None)
+        if annotations:
+            if call.get("completion_tokens") is None and annotations.get("chunks") is not None:
+                # Early-dispatched streams have no usage; vLLM streams one token per chunk
+                call["completion_tokens"] = annotations["chunks"]
+            call.update({key: value for key, value in annotations.items() if key != "chunks"})
+        if error:
+            call["error"] = error
+        self._current()["_llm"].append(call)
+
+    # ===== RECORDS =====
+
+    def _finish(self, end: float):
+        step, self._step = self._step, None
+        step["_end"] = end
+        start = step["_start"]
+        llm_calls = step.pop("_llm")
+        callback = step.pop("_callback")
+        human_waits = step.pop("_human")
+
+        phases = []
+        if llm_calls:
+            phases.append(("browser_state", start, llm_calls[0]["_start"], {}))
+            for call in llm_calls:
+                attributes = {key: value for key, value in call.items() if not key.startswith("_") and value is not None}
+                phases.append(("llm", call["_start"], call["_end"], attributes))
+            after_llm = llm_calls[-1]["_end"]
+        else:
+            after_llm = start
+        if callback is not None:
+            phases.append(("log_callback", callback[0], callback[1], {}))
+            phases.append(("actions", callback[1], end, {}))
+        elif llm_calls:
+            phases.append(("actions", after_llm, end, {}))
+        for wait_start, wait_end in human_waits:
+            phases.append(("human_wait", wait_start, wait_end, {}))
+
+        spans = {}
+        for name, phase_start, phase_end, _ in phases:
+            spans[name] = round(spans.get(name, 0.0) + _ms(phase_end - phase_start), 1)
+            self.phase_totals[name] = self.phase_totals.get(name, 0.0) + (phase_end - phase_start)
+        if human_waits and "actions" in spans:
+            # ask_human runs as an action; keep the person's time out of the compute phases
+            waited = sum(wait_end - wait_start for wait_start, wait_end in human_waits)
+            spans["actions"] = round(max(0.0, spans["actions"] - _ms(waited)), 1)
+            self.phase_totals["actions"] -= waited
+
+        record = {
+            "step": step["step"],
+            "timestamp": datetime.now().isoformat(),
+            "start_s": round(start - self._origin, 3),
+            "duration_ms": _ms(end - start),
+            "spans": spans,
+            "llm_calls": [{key: value for key, value in call.items() if not key.startswith("_")} for call in llm_calls],
+        }
+        if "agent_step" in step:
+            record["agent_step"] = step["agent_step"]
+        self.session_log.write_jsonl("timings.jsonl", record)
+        self.steps += 1
+
+        if self._otel is not None:
+            try:
+                self._otel.export(step, [(f"agent.{name}", *rest) for name, *rest in phases], self._to_epoch_ns)
+            except Exception as e:
+                self.session_log.log(f"OpenTelemetry export failed, export disabled: {e}")
+                self._otel = None
+
+    def stats(self) -> dict:
+        return {
+            "steps": self.steps,
+            "phase_ms_avg": {
+                name: _ms(total / self.steps) for name, total in self.phase_totals.items()
+            } if self.steps else {},
+        }
+
+    def close(self):
+        """Write the step in progress (if any) and flush exported spans"""
+        if self._step is not None:
+            self._finish(time.monotonic())
+        if self._otel is not None:
+            self._otel.close()
+            self._otel = None
+
+
+class TracedLLM:
+    """Chat model wrapper that reports every call's duration and usage to a StepTracer"""
+
+    def __init__(self, llm, tracer: StepTracer):
+        """
+        Args:
+            llm: Wrapped chat model (put TracedLLM outermost so the llm span covers prompt shaping too)
+            tracer: StepTracer of the session
+        """
+        self.llm = llm
+        self.tracer = tracer
+
+    def __getattr__(self, name):
+        # model, provider, name, stats(), ... come from the wrapped model
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    async def ainvoke(self, messages, output_format=None):
+        annotations = {}
+        token = _call_annotations.set(annotations)
+        start = time.monotonic()
+        try:
+            result = await self.llm.ainvoke(messages, output_format)
+        except Exception as e:
+            self.tracer.record_llm_call(start, time.monotonic(), annotations=annotations, error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _call_annotations.reset(token)
+        self.tracer.record_llm_call(start, time.monotonic(), result, annotations=annotations)
+        return result
@@ -0,0 +1,410 @@
+"""
+Streaming LLM calls with early action dispatch.
+
+browser_use waits for the whole structured completion (thinking,
+evaluation_previous_goal, memory, next_goal, action) before it acts, and
+small VL models can spend seconds on long thinking or on extra actions that
+are thrown away after the page changes. StreamingChat streams the same
+request from the OpenAI-compatible server and parses it as it arrives:
+
+  - early dispatch (dispatch="first_action"): as soon as the first object
+    of the "action" array is complete, the stream is closed and an output
+    holding just that action is returned, so the agent starts executing it
+    while the server would still be decoding. Every later action in the
+    batch is lost, so it is only allowed for agents created with
+    max_actions_per_step=1. The default, dispatch="full", waits for the
+    complete output
+  - rambling guard: if thinking grows past max_thinking_chars, the output
+    passes max_output_chars before any action, or the text starts looping,
+    the stream is cancelled and the request is retried once, non-streamed,
+    with an instruction to answer briefly
+  - anything unexpected (server without streaming, output that doesn't
+    validate early) falls back to the wrapped model's normal ainvoke().
+    Connection errors, timeouts, 5xx and 429 are raised instead, so an
+    EndpointPool ejects the endpoint rather than waiting on it twice
+
+Every call is reported once through on_timing: time to first token, time
+until the action was ready, and with measure_saved=True the time the full
+completion would have taken (the stream is drained in the background
+instead of closed, so this costs server time; use it to measure, not in
+production).
+
+Usage is requested on every chunk (vLLM's continuous_usage_stats), so an
+early-dispatched call still returns the prompt tokens and the completion
+tokens generated so far. Servers that only send usage on the final chunk
+(continuous_usage=False, e.g. OpenAI) give early dispatches no usage, and
+token_usage.py estimates them.
+
+Usage:
+    llm = StreamingChat(ChatOpenAI(model=..., base_url=..., api_key="EMPTY"),
+                        on_timing=lambda record: log_writer.write_jsonl("llm_stream.jsonl", record))
+
+    # Early dispatch for an agent that runs one action per step
+    llm = StreamingChat(ChatOpenAI(...), dispatch="first_action", max_actions_per_step=1)
+    agent = Agent(task=..., llm=llm, max_actions_per_step=1)
+
+    # One StreamingChat per endpoint behind an EndpointPool
+    streaming = StreamingFactory(on_timing=lambda record: log_writer.write_jsonl("llm_stream.jsonl", record))
+    llm = EndpointPool(urls, model, llm_factory=streaming)
+    print(streaming.stats())
+"""
+import asyncio
+import time
+from datetime import datetime
+
+from browser_use.llm.messages import UserMessage
+from browser_use.llm.openai.serializer import OpenAIMessageSerializer
+from browser_use.llm.schema import SchemaOptimizer
+from browser_use.llm.views import ChatInvokeCompletion, ChatInvokeUsage
+
+from llm_pool import _is_endpoint_failure
+from step_timing import annotate_llm_call
+
+BRIEF_RETRY = (
+    "Your previous answer was cut off because it was too long. "
+    "Keep thinking to one short sentence and output the next action now."
+)
+
+
+class StructuredOutputScanner:
+    """
+    Incremental scanner for the agent's JSON output. Tracks which top-level
+    field is being written and where the first element of "action" ends.
+    """
+
+    def __init__(self):
+        self.text = []
+        self.length = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.key_buffer = None  # Characters of a string at depth 1 that may be a key
+        self.last_key = None
+        self.current_field = None
+        self.field_chars = {}
+        self.in_action_array = False
+        self.first_action_end = None  # Length of the text up to and including the first action's closing brace
+
+    def feed(self, chunk: str):
+        for char in chunk:
+            self.text.append(char)
+            self.length += 1
+            if self.current_field is not None:
+                self.field_chars[self.current_field] = self.field_chars.get(self.current_field, 0) + 1
+
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.key_buffer is not None:
+                        self.last_key = "".join(self.key_buffer)
+                        self.key_buffer = None
+                elif self.key_buffer is not None:
+                    self.key_buffer.append(char)
+                continue
+
+            if char == '"':
+                self.in_string = True
+                # At depth 1 a string is either a key or a top-level string value
+                self.key_buffer = [] if self.depth == 1 else None
+            elif char == ":" and self.depth == 1:
+                self.current_field = self.last_key
+            elif char == "," and self.depth == 1:
+                self.current_field = None
+            elif char in "[{":
+                self.depth += 1
+                if char == "[" and self.depth == 2 and self.current_field == "action":
+                    self.in_action_array = True
+            elif char in "]}":
+                self.depth -= 1
+                if char == "}" and self.depth == 2 and self.in_action_array and self.first_action_end is None:
+                    self.first_action_end = self.length
+                if self.depth == 1:
+                    self.in_action_array = False
+
+    def value(self) -> str:
+        return "".join(self.text)
+
+    def first_action_json(self) -> str | None:
+        """The output so far, closed right after the first action"""
+        if self.first_action_end is None:
+            return None
+        return "".join(self.text[:self.first_action_end]) + "]}"
+
+    def is_looping(self, window: int = 600, probe: int = 60, repeats: int = 3) -> bool:
+        if self.length < window:
+            return False
+        tail = "".join(self.text[-window:])
+        return tail.count(tail[-probe:]) >= repeats
+
+
+class StreamingChat:
+    """Wraps a browser_use ChatOpenAI and streams its structured-output requests"""
+
+    def __init__(
+        self,
+        llm,
+        dispatch: str = "full",
+        max_actions_per_step: int | None = None,
+        max_thinking_chars: int = 2000,
+        max_output_chars: int = 6000,
+        measure_saved: bool = False,
+        continuous_usage: bool = True,
+        on_timing=None,
+    ):
+        """
+        Args:
+            llm: ChatOpenAI (anything with get_client() returning an AsyncOpenAI client)
+            dispatch: "full" waits for the whole output, "first_action" returns as soon as the first action is complete
+            max_actions_per_step: The agent's max_actions_per_step; "first_action" requires 1
+            max_thinking_chars: Cancel when the thinking field grows past this
+            max_output_chars: Cancel when this much is generated without a complete action
+            measure_saved: Drain cancelled streams in the background to measure the full completion time
+            continuous_usage: Ask for usage on every chunk (vLLM); False for servers that reject the option
+            on_timing: Called with a dict per call
+        """
+        if dispatch not in ("first_action", "full"):
+            raise ValueError(f"Unknown dispatch mode: {dispatch}")
+        if dispatch == "first_action" and max_actions_per_step != 1:
+            raise ValueError(
+                'dispatch="first_action" drops every action after the first; '
+                "it needs an agent with max_actions_per_step=1"
+            )
+        self.llm = llm
+        self.dispatch = dispatch
+        self.max_thinking_chars = max_thinking_chars
+        self.max_output_chars = max_output_chars
+        self.measure_saved = measure_saved
+        self.continuous_usage = continuous_usage
+        self.on_timing = on_timing
+        self._schemas = {}
+        self._background = set()
+
+        # Counters
+        self.calls = 0
+        self.early_dispatches = 0
+        self.ramble_cancels = 0
+        self.fallbacks = 0
+        self.saved_seconds_total = 0.0
+
+    def __getattr__(self, name):
+        # model, provider, name, ... come from the wrapped model
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def _response_format(self, output_format) -> dict:
+        if output_format not in self._schemas:
+            self._schemas[output_format] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "agent_output",
+                    "strict": True,
+                    "schema": SchemaOptimizer.create_optimized_json_schema(output_format),
+                },
+            }
+        return self._schemas[output_format]
+
+    def _request_params(self) -> dict:
+        params = {}
+        for attr in ("temperature", "max_completion_tokens", "top_p", "frequency_penalty", "seed"):
+            value = getattr(self.llm, attr, None)
+            if value is not None:
+                params[attr] = value
+        return params
+
+    def _report(self, record: dict):
+        if self.on_timing is not None:
+            self.on_timing(record)
+
+    async def ainvoke(self, messages, output_format=None):
+        if output_format is None or not hasattr(self.llm, 'get_client'):
+            return await self.llm.ainvoke(messages, output_format)
+
+        self.calls += 1
+        record = {"call": self.calls, "timestamp": datetime.now().isoformat(), "dispatch": self.dispatch}
+        try:
+            return await self._stream(messages, output_format, record)
+        except _Rambling as e:
+            self.ramble_cancels += 1
+            record["cancelled"] = str(e)
+            self._report(record)
+            return await self.llm.ainvoke(list(messages) + [UserMessage(content=BRIEF_RETRY)], output_format)
+        except Exception as e:
+            if _is_endpoint_failure(e):
+                # Retrying on the same endpoint would only delay the EndpointPool's failover
+                record["error"] = f"{type(e).__name__}: {e}"
+                self._report(record)
+                raise
+            self.fallbacks += 1
+            record["fallback"] = f"{type(e).__name__}: {e}"
+            self._report(record)
+            return await self.llm.ainvoke(messages, output_format)
+
+    async def _stream(self, messages, output_format, record: dict):
+        start = time.monotonic()
+        client = self.llm.get_client()
+        stream = await client.chat.completions.create(
+            model=self.llm.model,
+            messages=OpenAIMessageSerializer.serialize_messages(messages),
+            response_format=self._response_format(output_format),
+            stream=True,
+            stream_options={"include_usage": True, "continuous_usage_stats": True} if self.continuous_usage else {"include_usage": True},
+            **self._request_params(),
+        )
+
+        scanner = StructuredOutputScanner()
+        first_token_at = None
+        early = self.dispatch == "first_action"
+        usage = None
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if not delta:
+                continue
+            record["chunks"] = record.get("chunks", 0) + 1
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+                record["ttft_s"] = round(first_token_at - start, 3)
+                annotate_llm_call(ttft_ms=round((first_token_at - start) * 1000, 1))
+            scanner.feed(delta)
+
+            if scanner.first_action_end is None:
+                if scanner.field_chars.get("thinking", 0) > self.max_thinking_chars:
+                    await _close(stream)
+                    raise _Rambling(f"thinking over {self.max_thinking_chars} chars")
+                if scanner.length > self.max_output_chars:
+                    await _close(stream)
+                    raise _Rambling(f"{scanner.length} chars without an action")
+                if scanner.is_looping():
+                    await _close(stream)
+                    raise _Rambling("repeating output")
+            elif early:
+                try:
+                    completion = output_format.model_validate_json(scanner.first_action_json())
+                except Exception:
+                    # Fields after "action" or a schema we can't close early; read the whole output
+                    early = False
+                else:
+                    ready_at = time.monotonic()
+                    self.early_dispatches += 1
+                    annotate_llm_call(action_ready_ms=round((ready_at - start) * 1000, 1), chunks=record["chunks"])
+                    record.update({"action_ready_s": round(ready_at - start, 3), "early": True, "chars": scanner.length})
+                    if self.measure_saved:
+                        task = asyncio.create_task(self._drain(stream, scanner, start, ready_at, record))
+                        self._background.add(task)
+                        task.add_done_callback(self._background.discard)
+                    else:
+                        await _close(stream)
+                        self._report(record)
+                    return ChatInvokeCompletion(completion=completion, usage=_usage(usage))
+
+        done_at = time.monotonic()
+        annotate_llm_call(action_ready_ms=round((done_at - start) * 1000, 1), chunks=record.get("chunks"))
+        record.update({
+            "action_ready_s": round(done_at - start, 3),
+            "complete_s": round(done_at - start, 3),
+            "early": False,
+            "chars": scanner.length,
+        })
+        # Validate before reporting: a failure here is reported once, as a fallback, by ainvoke()
+        completion = output_format.model_validate_json(scanner.value())
+        self._report(record)
+        return ChatInvokeCompletion(completion=completion, usage=_usage(usage))
+
+    async def _drain(self, stream, scanner: StructuredOutputScanner, start: float, ready_at: float, record: dict):
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    scanner.feed(chunk.choices[0].delta.content)
+        except Exception:
+            pass
+        done_at = time.monotonic()
+        saved = done_at - ready_at
+        self.saved_seconds_total += saved
+        record.update({"complete_s": round(done_at - start, 3), "saved_s": round(saved, 3), "total_chars": scanner.length})
+        self._report(record)
+
+    def stream_stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "early_dispatches": self.early_dispatches,
+            "ramble_cancels": self.ramble_cancels,
+            "fallbacks": self.fallbacks,
+            "saved_s_total": round(self.saved_seconds_total, 3),
+        }
+
+
+def _usage(usage) -> "ChatInvokeUsage | None":
+    # Latest chunk's usage: final totals, or the tokens so far for an early dispatch with continuous usage
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return ChatInvokeUsage(
+        prompt_tokens=usage.prompt_tokens,
+        prompt_cached_tokens=getattr(details, "cached_tokens", None) if details else None,
+        prompt_cache_creation_tokens=None,
+        prompt_image_tokens=None,
+        completion_tokens=usage.completion_tokens,
+        total_tokens=usage.total_tokens,
+    )
+
+
+class _Rambling(Exception):
+    pass
+
+
+async def _close(stream):
+    try:
+        await stream.close()
+    except Exception:
+        pass
+
+
+class StreamingFactory:
+    """
+    llm_factory for EndpointPool: one StreamingChat per endpoint, with shared
+    timing records and combined stats.
+    """
+
+    def __init__(self, on_timing=None, **stream_kwargs):
+        """
+        Args:
+            on_timing: Called with every StreamingChat timing record
+            **stream_kwargs: Passed to each StreamingChat (dispatch, max_actions_per_step, max_thinking_chars, ...)
+        """
+        self.on_timing = on_timing
+        self.stream_kwargs = stream_kwargs
+        self.instances = []
+        self.last_timing = None
+
+    def _record(self, record: dict):
+        self.last_timing = record
+        if self.on_timing is not None:
+            self.on_timing(record)
+
+    def __call__(self, url, model, **kwargs):
+        from browser_use import ChatOpenAI
+
+        chat = StreamingChat(
+            ChatOpenAI(model=model, base_url=url, api_key="EMPTY", **kwargs),
+            on_timing=self._record,
+            **self.stream_kwargs,
+        )
+        self.instances.append(chat)
+        return chat
+
+    def stats(self) -> dict:
+        combined = {}
+        for chat in self.instances:
+            for key, value in chat.stream_stats().items():
+                combined[key] = combined.get(key, 0) + value
+        if "saved_s_total" in combined:
+            combined["saved_s_total"] = round(combined["saved_s_total"], 3)
+        return combined
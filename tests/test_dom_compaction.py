@@ -0,0 +1,89 @@
+"""
+DomCompactor.apply must compact the state message, not the example
+<browser_state> block in browser_use's system prompt, and the compacted
+listing must fit the budget including its "... omitted ..." lines.
+
+Run: python -m pytest tests
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+pytest.importorskip("browser_use")
+from browser_use.agent.prompts import SystemPrompt
+from browser_use.llm.messages import ContentPartTextParam, UserMessage
+
+from dom_compaction import DomCompactor, estimate_tokens
+
+
+def _system_message():
+    try:
+        return SystemPrompt(max_actions_per_step=3).get_system_message()
+    except TypeError:
+        # 0.7.x requires the action description
+        return SystemPrompt(action_description="", max_actions_per_step=3).get_system_message()
+
+
+def _state_text(rows: int = 60) -> str:
+    listing = []
+    for i in range(rows):
+        listing.append(f"[{3 * i + 1}]<tr />")
+        listing.append(f"\t[{3 * i + 2}]<a>Story number {i} about databases</a>")
+        listing.append(f"\t[{3 * i + 3}]<a>{i * 7} comments</a>")
+    return (
+        "<agent_history>\n<sys>\nAgent initialized\n</sys>\n</agent_history>\n"
+        "<agent_state>\n<user_request>\nOpen the story about databases with the most comments\n</user_request>\n"
+        "<step_info>\nStep 2 of 20 max possible steps\n</step_info>\n</agent_state>\n"
+        "<browser_state>\nCurrent tab: 0\nAvailable tabs:\nTab 0: https://news.ycombinator.com - Hacker News\n\n"
+        "Interactive elements from top of current page:\n" + "\n".join(listing) + "\n[End of page]\n</browser_state>\n"
+    )
+
+
+def test_system_prompt_has_example_browser_state():
+    # The reason apply() has to skip the system message
+    assert "<browser_state>" in _system_message().text
+
+
+@pytest.mark.parametrize("as_parts", [False, True])
+def test_apply_compacts_state_message_not_system_prompt(as_parts):
+    system_message = _system_message()
+    state = _state_text()
+    user_message = UserMessage(content=[ContentPartTextParam(text=state)] if as_parts else state)
+    compactor = DomCompactor(budget_tokens=300)
+
+    shaped = compactor.apply([system_message, user_message])
+
+    assert shaped[0] is system_message
+    assert shaped[1] is not user_message
+    assert compactor.steps == 1
+    assert compactor.last_result["tokens_after"] < compactor.last_result["tokens_before"]
+    compacted = shaped[1].text
+    assert "<user_request>" in compacted
+    assert len(compacted) < len(state)
+
+
+def test_apply_uses_last_state_message():
+    older, newer = UserMessage(content=_state_text(rows=10)), UserMessage(content=_state_text())
+    compactor = DomCompactor(budget_tokens=300)
+
+    shaped = compactor.apply([_system_message(), older, newer])
+
+    assert shaped[1] is older
+    assert shaped[2] is not newer
+
+
+@pytest.mark.parametrize("budget_tokens", [500, 1500, 2000])
+def test_recorded_listing_fits_budget(budget_tokens):
+    # Hacker News front page from a recorded session; at 1500 tokens the summary
+    # lines used to push the result to ~1720
+    listing = (REPO / "agent_logs" / "20251024_150203" / "step_004_llm_dom.txt").read_text(encoding="utf-8")
+    result = DomCompactor(budget_tokens=budget_tokens).compact_listing(listing)
+
+    assert result.tokens_before > budget_tokens
+    assert result.tokens_after == estimate_tokens(result.text)
+    assert result.tokens_after <= budget_tokens
+    assert result.dropped_elements > 0
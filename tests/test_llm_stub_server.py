@@ -0,0 +1,57 @@
+"""
+The stub server's replay mode must pick the recorded step that follows the
+steps already in the prompt's <agent_history>, as browser_use renders it.
+
+Run: python -m pytest tests
+"""
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("browser_use")
+from browser_use.agent.message_manager.views import HistoryItem
+
+from llm_stub_server import DEFAULT_REPLY, StubState
+
+SCRIPT = [
+    {**DEFAULT_REPLY, "next_goal": f"Recorded step {i + 1}", "action": [{"scroll": {"down": True}}]}
+    for i in range(3)
+] + [{**DEFAULT_REPLY, "next_goal": "Recorded step 4"}]
+
+
+def _request(*steps: HistoryItem) -> dict:
+    items = [HistoryItem(step_number=0, system_message="Agent initialized"), *steps]
+    history = "\n".join(item.to_string() for item in items)
+    prompt = (
+        f"<agent_history>\n{history}\n</agent_history>\n\n"
+        "<agent_state>\n<user_request>\n[replay:session] Read the front page\n</user_request>\n</agent_state>\n"
+        "<browser_state>\n[1]<a>More</a>\n</browser_state>\n"
+    )
+    return {"model": "stub", "messages": [{"role": "user", "content": prompt}], "response_format": {"type": "json_schema"}}
+
+
+def _step(number: int) -> HistoryItem:
+    return HistoryItem(step_number=number, evaluation_previous_goal="Success", memory=f"Scrolled {number} times",
+                       next_goal="Scroll again", action_results="Result:\nScrolled down")
+
+
+def _next_goal(state: StubState, request: dict) -> str:
+    return json.loads(state.content_for(request))["next_goal"]
+
+
+def test_replay_follows_history():
+    state = StubState(0.0, 0.0, 0.0, DEFAULT_REPLY, {"session": SCRIPT})
+    assert _next_goal(state, _request()) == "Recorded step 1"
+    assert _next_goal(state, _request(_step(1), _step(2))) == "Recorded step 3"
+    # Past the end of the recording the last (done) reply repeats
+    assert _next_goal(state, _request(*(_step(n) for n in range(1, 7)))) == "Recorded step 4"
+
+
+def test_initial_actions_are_not_a_step():
+    state = StubState(0.0, 0.0, 0.0, DEFAULT_REPLY, {"session": SCRIPT})
+    opened = HistoryItem(step_number=0, action_results="Result:\nNavigated to https://news.ycombinator.com")
+    assert _next_goal(state, _request(opened, _step(1))) == "Recorded step 2"
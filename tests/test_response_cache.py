@@ -0,0 +1,97 @@
+"""
+ResponseCache keys must follow the agent's progress: the history as
+browser_use renders it (HistoryItem.to_string()) and any extra message,
+such as a StallGuard hint, are part of the key.
+
+Run: python -m pytest tests
+"""
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+pytest.importorskip("browser_use")
+from browser_use.agent.message_manager.views import HistoryItem
+from browser_use.llm.messages import SystemMessage, UserMessage
+from browser_use.llm.views import ChatInvokeCompletion
+from pydantic import BaseModel
+
+from agent_history import history_items, last_step_failed, model_steps
+from response_cache import ResponseCache, cache_key
+
+DOM = "[1]<a>Show HN: a database</a>\n[2]<a>42 comments</a>\n[3]<a>More</a>"
+
+
+def _history(*items: HistoryItem) -> str:
+    # As browser_use's AgentMessagePrompt joins the items
+    return "\n".join(item.to_string() for item in [HistoryItem(step_number=0, system_message="Agent initialized"), *items])
+
+
+def _state(history: str, step: int = 1) -> str:
+    return (
+        f"<agent_history>\n{history}\n</agent_history>\n\n"
+        "<agent_state>\n<user_request>\nOpen the Show HN story with the most comments\n</user_request>\n"
+        f"<step_info>Step{step} maximum:20\nToday:2025-10-24</step_info>\n</agent_state>\n"
+        f"<browser_state>\nCurrent tab: 0\nAvailable tabs:\nTab 0: https://news.ycombinator.com/show - Show HN\n\n{DOM}\n</browser_state>\n"
+    )
+
+
+def _step(number: int, result: str) -> HistoryItem:
+    return HistoryItem(step_number=number, evaluation_previous_goal="Success", memory=f"Step {number} done",
+                       next_goal="Continue", action_results=f"Result:\n{result}")
+
+
+def _key(*messages) -> str:
+    return cache_key("stub", [SystemMessage(content="system prompt <browser_state>example</browser_state>"), *messages])
+
+
+def test_history_parser_reads_rendered_items():
+    state = _state(_history(_step(1, "Clicked More"), _step(2, "Element 9 not found, failed to click")))
+    assert len(history_items(state)) == 3
+    assert model_steps(state) == 2
+    assert last_step_failed(state)
+    assert not last_step_failed(_state(_history(_step(1, "Clicked More"))))
+
+
+def test_key_changes_with_progress_on_the_same_page():
+    first_visit = _key(UserMessage(content=_state(_history(_step(1, "Navigated to Show HN")))))
+    back_again = _key(UserMessage(content=_state(_history(_step(1, "Navigated to Show HN"), _step(2, "Opened story 1"),
+                                                           _step(3, "Went back")), step=4)))
+    assert first_visit != back_again
+
+
+def test_key_ignores_step_info():
+    history = _history(_step(1, "Navigated to Show HN"))
+    assert _key(UserMessage(content=_state(history, step=2))) == _key(UserMessage(content=_state(history, step=7)))
+
+
+def test_key_includes_extra_messages():
+    state = UserMessage(content=_state(_history(_step(1, "Navigated to Show HN"))))
+    hint = UserMessage(content="You have repeated the same action 3 times without progress. Try something else.")
+    assert _key(state) != _key(state, hint)
+
+
+class AgentOutput(BaseModel):
+    action: list[dict] = []
+
+
+def test_cache_hit_does_not_commit(tmp_path):
+    class Stub:
+        model = "stub"
+        calls = 0
+
+        async def ainvoke(self, messages, output_format=None):
+            self.calls += 1
+            return ChatInvokeCompletion(completion=output_format(action=[{"click": {"index": 1}}]), usage=None)
+
+    messages = [UserMessage(content=_state(_history(_step(1, "Navigated to Show HN"))))]
+    cache = ResponseCache(Stub(), tmp_path / "cache.sqlite")
+    asyncio.run(cache.ainvoke(messages, AgentOutput))
+    changes = cache._db.total_changes
+    asyncio.run(cache.ainvoke(messages, AgentOutput))
+    assert cache.hits == 1 and cache.llm.calls == 1
+    assert cache._db.total_changes == changes
+    cache.close()
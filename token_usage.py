@@ -0,0 +1,332 @@
+"""
+Token and cost accounting per step, session and task.
+
+actions.jsonl records what the model decided, not what it cost, and
+LLM_INPUT_EXPLANATION.md can only give rough per-step ranges. MeteredLLM
+wraps the chat model and hands every call's usage to a UsageMeter: prompt,
+cached, completion and image tokens from the response usage, priced with a
+per-model table (USD per million tokens). ChatOllama, and early-dispatched
+streams from servers without continuous usage stats, return no usage; their
+tokens are estimated from the request (4 characters per token, images by
+size) and the call is marked "estimated".
+
+The step callback adds the step's usage to its actions.jsonl record. The
+callback runs after the model's decision and before the actions, so calls
+an action makes (page extraction, anything without an "action" output
+format) happen after their step's record was built. They are reported in
+the next record under "previous_step_actions", attributed to the step that
+made them; the last step's are only in the session totals:
+
+    {"step": 4, ..., "usage": {"calls": 1, "prompt_tokens": 6120, "cached_tokens": 4096,
+     "completion_tokens": 231, "image_tokens": 1564, "cost_usd": 0.00118, "session_cost_usd": 0.0051,
+     "previous_step_actions": {"step": 3, "calls": 1, "prompt_tokens": 2210, ...}}}
+
+Calls that raise (server errors, timeouts, output that fails validation)
+are counted as failed_calls, with their estimated prompt tokens in
+failed_prompt_tokens. They are not priced and don't count towards the
+budget, because providers differ on whether they bill them.
+
+A Budget (total tokens and/or USD) is checked after every call. Once it is
+exceeded the agent is stopped, like a StallDetector abort, and further
+calls through the meter fail with BudgetExceeded.
+
+Prices default to DEFAULT_PRICES; a JSON file with the same shape overrides
+or extends them. Models are matched exactly, then by longest prefix
+("gpt-4.1-mini-2025-04-14" -> "gpt-4.1-mini"), then by "*". Models without a
+price (local vLLM/Ollama models by default) are counted in tokens only:
+
+    {"InternVL3_5-14B": {"input": 0.05, "output": 0.05},
+     "*": {"input": 0.10, "cached_input": 0.02, "output": 0.40}}
+
+Put MeteredLLM directly around the base chat model, inside ResponseCache and
+ReplayLLM, so answers that never reached a server are not counted.
+
+Usage:
+    usage_meter = UsageMeter(prices=load_prices("prices.json"), budget=Budget(max_cost_usd=0.50))
+    llm = MeteredLLM(ChatOpenAI(model="gpt-4.1-mini"), usage_meter)
+    step_callback = make_step_callback(log_writer, usage_meter=usage_meter)
+    agent = Agent(task=task, llm=llm, register_new_step_callback=step_callback)
+    usage_meter.bind(agent)  # needed to stop the agent when the budget runs out
+    ...
+    print(usage_meter.stats())
+"""
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+from adaptive_vision import estimate_image_tokens
+from dom_compaction import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ModelPrice:
+    """USD per million tokens"""
+    input: float
+    output: float
+    cached_input: float | None = None  # Defaults to the input price
+
+    def cost(self, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float:
+        cached_rate = self.input if self.cached_input is None else self.cached_input
+        return (
+            (prompt_tokens - cached_tokens) * self.input
+            + cached_tokens * cached_rate
+            + completion_tokens * self.output
+        ) / 1_000_000
+
+
+# OpenAI list prices; image tokens are billed as input tokens
+DEFAULT_PRICES = {
+    "gpt-5": ModelPrice(input=1.25, cached_input=0.125, output=10.00),
+    "gpt-5-mini": ModelPrice(input=0.25, cached_input=0.025, output=2.00),
+    "gpt-5-nano": ModelPrice(input=0.05, cached_input=0.005, output=0.40),
+    "gpt-4.1": ModelPrice(input=2.00, cached_input=0.50, output=8.00),
+    "gpt-4.1-mini": ModelPrice(input=0.40, cached_input=0.10, output=1.60),
+    "gpt-4.1-nano": ModelPrice(input=0.10, cached_input=0.025, output=0.40),
+    "gpt-4o": ModelPrice(input=2.50, cached_input=1.25, output=10.00),
+    "gpt-4o-mini": ModelPrice(input=0.15, cached_input=0.075, output=0.60),
+}
+
+_TOKEN_FIELDS = ("calls", "estimated_calls", "unpriced_calls", "failed_calls", "prompt_tokens", "cached_tokens",
+                 "completion_tokens", "image_tokens", "total_tokens", "failed_prompt_tokens")
+
+
+def load_prices(path: Path | str | None = None) -> dict[str, ModelPrice]:
+    """DEFAULT_PRICES, overridden and extended by the JSON price table at path"""
+    prices = dict(DEFAULT_PRICES)
+    if path is not None:
+        with open(path, encoding="utf-8") as f:
+            for model, price in json.load(f).items():
+                prices[model] = ModelPrice(**price)
+    return prices
+
+
+def price_for(prices: dict[str, ModelPrice], model: str) -> ModelPrice | None:
+    if model in prices:
+        return prices[model]
+    prefixes = [name for name in prices if name != "*" and model.startswith(name)]
+    if prefixes:
+        return prices[max(prefixes, key=len)]
+    return prices.get("*")
+
+
+def estimate_request(messages: list) -> tuple[int, int]:
+    """Rough (prompt tokens, image tokens) of a request the server reported no usage for"""
+    text_tokens = image_tokens = 0
+    for message in messages:
+        content = getattr(message, "content", None)
+        if isinstance(content, str):
+            text_tokens += estimate_tokens(content)
+            continue
+        for part in content or []:
+            image_url = getattr(part, "image_url", None)
+            if image_url is not None:
+                image_tokens += estimate_image_tokens(getattr(image_url, "url", image_url))
+            elif hasattr(part, 'text'):
+                text_tokens += estimate_tokens(part.text)
+    return text_tokens + image_tokens, image_tokens
+
+
+def _completion_text(completion) -> str:
+    if hasattr(completion, 'model_dump_json'):
+        return completion.model_dump_json()
+    return str(completion)
+
+
+class BudgetExceeded(Exception):
+    """Raised by MeteredLLM for calls after the task's budget ran out"""
+
+
+@dataclass
+class Budget:
+    max_tokens: int | None = None  # Prompt + completion tokens
+    max_cost_usd: float | None = None
+
+    def exceeded(self, tokens: int, cost_usd: float) -> str | None:
+        """Why the budget is exceeded, or None"""
+        if self.max_tokens is not None and tokens > self.max_tokens:
+            return f"token budget exceeded: {tokens} > {self.max_tokens}"
+        if self.max_cost_usd is not None and cost_usd > self.max_cost_usd:
+            return f"cost budget exceeded: ${cost_usd:.4f} > ${self.max_cost_usd:.4f}"
+        return None
+
+
+def _empty() -> dict:
+    return {**{field: 0 for field in _TOKEN_FIELDS}, "cost_usd": 0.0}
+
+
+def _add(totals: dict, usage: dict):
+    for field in _TOKEN_FIELDS:
+        totals[field] = totals.get(field, 0) + (usage.get(field) or 0)
+    totals["cost_usd"] = round(totals.get("cost_usd", 0.0) + (usage.get("cost_usd") or 0.0), 6)
+
+
+class UsageMeter:
+    """Per-session token and cost totals, the current step's share and the budget"""
+
+    def __init__(self, prices: dict[str, ModelPrice] | None = None, budget: Budget | None = None):
+        """
+        Args:
+            prices: Model -> ModelPrice (see load_prices); defaults to DEFAULT_PRICES
+            budget: Limits after which the agent is stopped
+        """
+        self.prices = DEFAULT_PRICES if prices is None else prices
+        self.budget = budget
+        self.abort_reason = None
+        self._agent = None
+        self._step = _empty()
+        self._actions = _empty()  # Calls made by the last reported step's actions
+        self._last_step = None
+        self._unpriced_models = set()
+
+        # Counters
+        self.totals = _empty()
+        self.by_model = {}
+
+    def bind(self, agent):
+        """Give the meter the Agent so an exceeded budget can stop it"""
+        self._agent = agent
+
+    def record(self, model: str, messages: list, result, step_call: bool = True) -> dict:
+        """Account one completed call; returns its usage record. step_call=False for calls made by actions."""
+        usage = getattr(result, "usage", None)
+        call = {"calls": 1, "estimated_calls": 0, "unpriced_calls": 0}
+        image_tokens = getattr(usage, "prompt_image_tokens", None) if usage is not None else None
+        if usage is not None and getattr(usage, "prompt_tokens", None) is not None:
+            call["prompt_tokens"] = usage.prompt_tokens
+            call["cached_tokens"] = getattr(usage, "prompt_cached_tokens", None) or 0
+            call["completion_tokens"] = getattr(usage, "completion_tokens", None) or 0
+            if image_tokens is None:
+                image_tokens = estimate_request(messages)[1]
+        else:
+            call["prompt_tokens"], estimated_images = estimate_request(messages)
+            call["cached_tokens"] = 0
+            call["completion_tokens"] = estimate_tokens(_completion_text(result.completion))
+            call["estimated_calls"] = 1
+            if image_tokens is None:
+                image_tokens = estimated_images
+        call["image_tokens"] = image_tokens
+        call["total_tokens"] = call["prompt_tokens"] + call["completion_tokens"]
+
+        price = price_for(self.prices, model)
+        if price is None:
+            call["unpriced_calls"] = 1
+            call["cost_usd"] = None
+            if model not in self._unpriced_models:
+                self._unpriced_models.add(model)
+                logger.warning("No price for model %s; counting its tokens only", model)
+        else:
+            call["cost_usd"] = round(price.cost(call["prompt_tokens"], call["cached_tokens"], call["completion_tokens"]), 6)
+
+        _add(self.totals, call)
+        _add(self._step if step_call else self._actions, call)
+        _add(self.by_model.setdefault(model, _empty()), call)
+        self._check_budget()
+        return call
+
+    def record_failure(self, model: str, messages: list, step_call: bool = True):
+        """Account a call that raised: counted, prompt estimated, not priced"""
+        call = {"failed_calls": 1, "failed_prompt_tokens": estimate_request(messages)[0]}
+        _add(self.totals, call)
+        _add(self._step if step_call else self._actions, call)
+        _add(self.by_model.setdefault(model, _empty()), call)
+
+    def _check_budget(self):
+        if self.budget is None or self.abort_reason is not None:
+            return
+        reason = self.budget.exceeded(self.totals["total_tokens"], self.totals["cost_usd"])
+        if reason is None:
+            return
+        self.abort_reason = reason
+        logger.warning("%s; stopping the agent", reason)
+        if self._agent is not None and hasattr(self._agent, 'stop'):
+            self._agent.stop()
+
+    def check(self):
+        """Raise BudgetExceeded if the budget already ran out"""
+        if self.abort_reason is not None:
+            raise BudgetExceeded(self.abort_reason)
+
+    def take_step(self, step_number: int | None = None) -> dict | None:
+        """
+        Usage of one agent step's decision since the previous call, for the step's actions.jsonl record,
+        with the calls the previous step's actions made under "previous_step_actions"
+        """
+        step, self._step = _summary(self._step), _empty()
+        actions, self._actions = _summary(self._actions), _empty()
+        previous_step, self._last_step = self._last_step, step_number
+        if step is None and actions is None:
+            return None
+        step = step or {"calls": 0}
+        if actions is not None:
+            step["previous_step_actions"] = {"step": previous_step, **actions}
+        step["session_cost_usd"] = self.totals["cost_usd"]
+        if self.abort_reason is not None:
+            step["budget_exceeded"] = self.abort_reason
+        return step
+
+    def stats(self) -> dict:
+        return {
+            **self.totals,
+            "by_model": {model: dict(totals) for model, totals in self.by_model.items()},
+            "abort_reason": self.abort_reason,
+        }
+
+
+def _summary(usage: dict) -> dict | None:
+    """A step's usage bucket as reported in actions.jsonl, or None if it holds no calls"""
+    if not usage["calls"] and not usage["failed_calls"]:
+        return None
+    if usage["unpriced_calls"] == usage["calls"]:
+        usage["cost_usd"] = None
+    hidden = ("unpriced_calls", "total_tokens") + (() if usage["failed_calls"] else ("failed_calls", "failed_prompt_tokens"))
+    usage = {key: value for key, value in usage.items() if key not in hidden}
+    usage["estimated"] = bool(usage.pop("estimated_calls"))
+    return usage
+
+
+def merge_usage(stats_list: list[dict | None]) -> dict:
+    """Roll UsageMeter.stats() of several sessions up into one (per task or per batch)"""
+    merged = {**_empty(), "by_model": {}, "over_budget": 0}
+    for stats in stats_list:
+        if not stats:
+            continue
+        merged["over_budget"] += stats.get("over_budget", 1 if stats.get("abort_reason") else 0)
+        _add(merged, stats)
+        for model, totals in stats.get("by_model", {}).items():
+            _add(merged["by_model"].setdefault(model, _empty()), totals)
+    return merged
+
+
+class MeteredLLM:
+    """Chat model wrapper that accounts every call's tokens and cost in a UsageMeter"""
+
+    def __init__(self, llm, meter: UsageMeter):
+        """
+        Args:
+            llm: Wrapped chat model (the one that actually calls the server)
+            meter: UsageMeter of the session
+        """
+        self.llm = llm
+        self.meter = meter
+
+    def __getattr__(self, name):
+        # model, provider, name, stats(), ... come from the wrapped model
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    async def ainvoke(self, messages, output_format=None):
+        self.meter.check()
+        model = getattr(self.llm, "model", "unknown")
+        # Agent decisions have an "action" field; extraction and other calls are made by the actions
+        step_call = output_format is not None and "action" in getattr(output_format, "model_fields", {})
+        try:
+            result = await self.llm.ainvoke(messages, output_format)
+        except Exception:
+            self.meter.record_failure(model, messages, step_call)
+            raise
+        self.meter.record(model, messages, result, step_call)
+        return result